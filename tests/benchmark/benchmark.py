@@ -0,0 +1,374 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+"""
+Throughput benchmark of the wis2box subscriber
+
+Runs WIS2BoxSubscriber, its worker pool, Handler and the data plugins
+against in-process stand-ins for MinIO, MQTT and Elasticsearch and a
+local server standing in for wis2box-api (see fakes.py), and reports
+files per second, latency percentiles per stage and peak memory for
+synthetic CSV, SYNOP, BUFR and CAP workloads.
+
+Usage (from the repository root, with wis2box-management requirements
+installed):
+
+    python3 tests/benchmark/benchmark.py --files 500 --workers 4
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+from pathlib import Path
+import queue
+import resource
+import socket
+import sys
+import tempfile
+import time
+
+HERE = Path(__file__).resolve().parent
+
+
+def free_port() -> int:
+    """
+    Get a free local TCP port
+
+    :returns: `int` of port
+    """
+
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+# configure wis2box before it is imported
+API_PORT = free_port()
+os.environ.setdefault('WIS2BOX_DATADIR', tempfile.mkdtemp())
+os.environ['WIS2BOX_DOCKER_API_URL'] = f'http://localhost:{API_PORT}'
+os.environ['WIS2BOX_STORAGE_TYPE'] = 'Memory'
+os.environ['WIS2BOX_API_BACKEND_TYPE'] = 'Memory'
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(HERE.parents[1] / 'wis2box-management'))
+
+from wis2box.plugin import PLUGINS  # noqa
+
+PLUGINS['storage']['Memory'] = {'plugin': 'fakes.MemoryStorage'}
+PLUGINS['api_backend']['Memory'] = {'plugin': 'fakes.MemoryBackend'}
+PLUGINS['pubsub']['mqtt']['plugin'] = 'fakes.MemoryBroker'
+
+import fakes  # noqa
+from wis2box import metrics  # noqa
+from wis2box.env import STORAGE_INCOMING  # noqa
+import wis2box.pubsub.subscribe  # noqa
+
+# the package attributes are shadowed by click commands of the same name
+message = sys.modules['wis2box.pubsub.message']
+subscribe = sys.modules['wis2box.pubsub.subscribe']
+
+CAP_TEMPLATE = (HERE.parent / 'data' / 'CAP' / 'cap_example.xml').read_text()
+
+WORKLOADS = {
+    'csv': {
+        'suffix': 'csv',
+        'plugins': [{
+            'plugin': 'wis2box.data.csv2bufr.ObservationDataCSV2BUFR',
+            'template': 'aws-template',
+            'notify': True,
+            'file-pattern': r'^.*\.csv$'
+        }]
+    },
+    'synop': {
+        'suffix': 'txt',
+        'plugins': [{
+            'plugin': 'wis2box.data.synop2bufr.ObservationDataSYNOP2BUFR',
+            'notify': True,
+            'file-pattern': r'^.*_(\d{4})(\d{2}).*\.txt$'
+        }]
+    },
+    'bufr': {
+        'suffix': 'bufr4',
+        'plugins': [{
+            'plugin': 'wis2box.data.bufr4.ObservationDataBUFR',
+            'notify': True,
+            'file-pattern': r'^.*\.bufr4$'
+        }, {
+            'plugin': 'wis2box.data.bufr2geojson.ObservationDataBUFR2GeoJSON',  # noqa
+            'file-pattern': r'^.*\.bufr4$'
+        }]
+    },
+    'cap': {
+        'suffix': 'xml',
+        'plugins': [{
+            'plugin': 'wis2box.data.cap_message.CAPMessageData',
+            'notify': True,
+            'file-pattern': r'^.*\.xml$'
+        }]
+    }
+}
+
+
+def generate(workload: str, index: int, rows: int) -> bytes:
+    """
+    Generate a synthetic input file
+
+    The API stand-in converts one output per row ("WSI,timestamp,...").
+
+    :param workload: `str` of workload name
+    :param index: `int` of file number
+    :param rows: `int` of observations per file
+
+    :returns: `bytes` of file content
+    """
+
+    if workload == 'cap':
+        identifier = f'urn:oid:2.49.0.0.690.0.2024.{index}'
+        return CAP_TEMPLATE.replace(
+            'urn:oid:2.49.0.0.690.0.2024.5.19.13.18.0', identifier).encode()
+
+    lines = ['wsi,timestamp,air_temperature,relative_humidity']
+    for row in range(rows):
+        minute = (index * rows + row) % 1440
+        lines.append(f'0-454-2-B{index:05d}{row:02d},'
+                     f'2024-01-01T{minute // 60:02d}:{minute % 60:02d}:00+00:00,'  # noqa
+                     f'{280 + row % 20},{50 + row % 40}')
+    return '\n'.join(lines).encode()
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    Percentile of a list of values (nearest rank)
+
+    :param values: `list` of values
+    :param p: `float` of percentile (0-100)
+
+    :returns: `float` of percentile value
+    """
+
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]  # noqa
+
+
+def wait_for_port(port: int, timeout: float = 10) -> None:
+    """
+    Wait until a local TCP port accepts connections
+
+    :param port: `int` of port
+    :param timeout: `float` of seconds to wait
+
+    :returns: `None`
+    """
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('localhost', port), 1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def run_workload(workload: str, args: argparse.Namespace,
+                 results: mp.Queue) -> None:
+    """
+    Run one workload in the current (forked) process
+
+    :param workload: `str` of workload name
+    :param args: parsed command line arguments
+    :param results: queue receiving the result `dict`
+
+    :returns: `None`
+    """
+
+    definition = WORKLOADS[workload]
+    metadata_id = f'urn:wmo:md:bench:{workload}'
+    data_mappings = {
+        metadata_id: {
+            'plugins': {definition['suffix']: definition['plugins']},
+            'topic_hierarchy': f'origin/a/wis2/bench/data/core/weather/{workload}'  # noqa
+        }
+    }
+
+    keys = []
+    for index in range(args.files):
+        name = f'bench_{index:06d}_202401.{definition["suffix"]}'
+        key = f'{STORAGE_INCOMING}/{metadata_id}/{name}'
+        storage = fakes.OBJECTS.setdefault(STORAGE_INCOMING, {})
+        storage[key.split('/', 1)[1]] = {
+            'data': generate(workload, index, args.rows),
+            'etag': '', 'metadata': {}
+        }
+        keys.append(key)
+
+    # stand-ins for the discovery metadata records of wis2box-api
+    subscribe.get_data_mappings = lambda: data_mappings
+    subscribe.load_has_auth = lambda: None
+    message._HAS_AUTH[metadata_id] = False
+
+    stages = {}
+    metrics.add_observer(
+        lambda stage, dataset, plugin, seconds:
+            stages.setdefault(stage, []).append(seconds))
+
+    done = mp.Queue()
+    latencies = []
+
+    class BenchmarkSubscriber(subscribe.WIS2BoxSubscriber):
+        def task_done(self, task: tuple) -> None:
+            super().task_done(task)
+            done.put((task[1], time.perf_counter()))
+
+    def wait(submitted: dict) -> None:
+        for _ in range(len(submitted)):
+            try:
+                filepath, finished = done.get(timeout=args.timeout)
+            except queue.Empty:
+                print(f'{workload}: timed out waiting for tasks',
+                      file=sys.stderr)
+                return
+            key = filepath.split('/', 3)[-1]
+            latencies.append(finished - submitted[key])
+
+    broker = fakes.WorkloadBroker({'url': 'mqtt://localhost'}, keys, wait)
+
+    start = time.perf_counter()
+    BenchmarkSubscriber(broker=broker, workers=args.workers,
+                        queue_max=args.queue_max, batch_max=args.batch_max,
+                        metrics_port=free_port(), share_group=None,
+                        spool=None, mode=args.mode,
+                        tasks_max=args.tasks_max)
+    elapsed = time.perf_counter() - start
+
+    # let the last samples of the workers arrive
+    time.sleep(0.5)
+
+    results.put({
+        'workload': workload,
+        'mode': args.mode,
+        'files': len(latencies),
+        'seconds': elapsed,
+        'files_per_second': len(latencies) / elapsed,
+        'latency': {
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99)
+        },
+        'stages': {
+            stage: {
+                'count': len(values),
+                'p50': percentile(values, 50),
+                'p99': percentile(values, 99)
+            } for stage, values in sorted(stages.items())
+        },
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': {
+            'subscriber': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'workers': resource.getrusage(
+                resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        }
+    })
+
+
+def report(result: dict) -> None:
+    """
+    Print the result of a workload
+
+    :param result: `dict` of workload result
+
+    :returns: `None`
+    """
+
+    print(f"{result['workload']}: {result['files']} files in "
+          f"{result['seconds']:.2f}s ({result['files_per_second']:.1f} files/s), "  # noqa
+          f"latency p50={result['latency']['p50'] * 1000:.1f}ms "
+          f"p99={result['latency']['p99'] * 1000:.1f}ms, peak RSS "
+          f"subscriber={result['peak_rss_mb']['subscriber']:.0f}MB "
+          f"workers={result['peak_rss_mb']['workers']:.0f}MB")
+    for stage, values in result['stages'].items():
+        print(f"    {stage:<12} n={values['count']:<6} "
+              f"p50={values['p50'] * 1000:8.2f}ms "
+              f"p99={values['p99'] * 1000:8.2f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--workload', action='append',
+                        choices=list(WORKLOADS),
+                        help='workload to run (default: all)')
+    parser.add_argument('--files', type=int, default=200,
+                        help='number of files per workload')
+    parser.add_argument('--rows', type=int, default=5,
+                        help='observations per file')
+    parser.add_argument('--mode', choices=['process', 'asyncio'],
+                        default='process', help='subscriber mode')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of subscriber workers (threads for '
+                             'blocking steps in asyncio mode)')
+    parser.add_argument('--tasks-max', type=int, default=256,
+                        help='maximum number of tasks in flight '
+                             '(asyncio mode)')
+    parser.add_argument('--queue-max', type=int, default=100,
+                        help='maximum number of queued tasks')
+    parser.add_argument('--batch-max', type=int, default=10,
+                        help='maximum number of tasks per batch')
+    parser.add_argument('--api-latency', type=float, default=0.005,
+                        help='seconds per wis2box-api process execution')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='seconds to wait for a task to complete')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    args = parser.parse_args()
+
+    context = mp.get_context('fork')
+
+    # wis2box-api runs in a process of its own, as in a deployment
+    api = context.Process(target=fakes.FakeAPI(args.api_latency).serve,
+                          args=(API_PORT,), daemon=True)
+    api.start()
+    wait_for_port(API_PORT)
+
+    results = []
+    for workload in args.workload or list(WORKLOADS):
+        # each workload runs in a fresh process, so that peak memory
+        # and module state are not shared between workloads
+        results_queue = context.Queue()
+        process = context.Process(target=run_workload,
+                                  args=(workload, args, results_queue))
+        process.start()
+        result = results_queue.get()
+        process.join()
+        if not args.json:
+            report(result)
+        results.append(result)
+
+    api.terminate()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
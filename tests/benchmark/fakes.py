@@ -0,0 +1,291 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+"""Stand-ins for MinIO, MQTT, wis2box-api and Elasticsearch"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Union
+
+from wis2box.api.backend.base import BaseBackend
+from wis2box.pubsub.base import BasePubSubClient
+from wis2box.storage.base import StorageBase
+
+# objects by bucket name, filled before workers are forked
+OBJECTS = {}
+
+
+class MemoryStorage(StorageBase):
+    """Storage keeping objects in memory"""
+
+    def __init__(self, defs: dict) -> None:
+        super().__init__(defs)
+        self.objects = OBJECTS.setdefault(self.name, {})
+
+    def setup(self) -> bool:
+        return True
+
+    def get(self, identifier: str) -> Any:
+        return self.objects[identifier.lstrip('/')]['data']
+
+    def get_stream(self, identifier: str,
+                   chunk_size: int = 1048576) -> Iterator[bytes]:
+        data = self.get(identifier)
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+    def put(self, data: bytes, identifier: str,
+            content_type: str = 'application/octet-stream',
+            metadata: dict = None) -> bool:
+        self.objects[identifier.lstrip('/')] = {
+            'data': data,
+            'etag': hashlib.md5(data).hexdigest(),
+            'metadata': metadata or {}
+        }
+        return True
+
+    def put_stream(self, stream: BinaryIO, identifier: str,
+                   length: int = -1,
+                   content_type: str = 'application/octet-stream',
+                   metadata: dict = None) -> bool:
+        return self.put(stream.read(), identifier, content_type, metadata)
+
+    def put_bytes(self, data: bytes, identifier: str) -> bool:
+        return self.put(data, identifier)
+
+    def update_metadata(self, identifier: str, metadata: dict) -> bool:
+        self.objects[identifier.lstrip('/')]['metadata'] = dict(metadata)
+        return True
+
+    def stat(self, identifier: str) -> Union[dict, None]:
+        object_ = self.objects.get(identifier.lstrip('/'))
+        if object_ is None:
+            return None
+        return {
+            'size': len(object_['data']),
+            'etag': object_['etag'],
+            'last_modified': None,
+            'metadata': object_['metadata']
+        }
+
+    def exists(self, identifier: str) -> bool:
+        return identifier.lstrip('/') in self.objects
+
+    def delete(self, identifier: str) -> bool:
+        return self.objects.pop(identifier.lstrip('/'), None) is not None
+
+    def list_objects(self, prefix: str) -> list:
+        return [key for key in self.objects if key.startswith(prefix)]
+
+    def delete_many(self, identifiers: Iterable[str]) -> int:
+        return sum(self.delete(identifier) for identifier in identifiers)
+
+
+class MemoryBackend(BaseBackend):
+    """API backend keeping collection items in memory"""
+
+    collections = {}
+
+    def list_collections(self) -> list:
+        return list(self.collections)
+
+    def add_collection(self, name: str) -> bool:
+        self.collections.setdefault(name, {})
+        return True
+
+    def delete_collection(self, name: str) -> bool:
+        return self.collections.pop(name, None) is not None
+
+    def has_collection(self, name: str) -> bool:
+        return name in self.collections
+
+    def upsert_collection_items(self, collection: str, items: list) -> str:
+        items_ = self.collections.setdefault(collection, {})
+        for item in items:
+            items_[item['id']] = item
+        return True
+
+    def clear_cache(self) -> None:
+        pass
+
+    def delete_collection_item(self, collection: str, item_id: str) -> str:
+        return self.collections.get(collection, {}).pop(item_id, None)
+
+    def delete_collections_by_retention(self, days: int) -> None:
+        pass
+
+    def flush(self, collection: str):
+        pass
+
+
+class MemoryBroker(BasePubSubClient):
+    """Broker client counting published messages"""
+
+    published = 0
+
+    def __init__(self, broker: dict) -> None:
+        super().__init__(broker)
+        self.type = 'memory'
+
+    def start(self, inflight_max: int = 20, queue_max: int = 0) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def pub(self, topic: str, message: str, qos: int = 1) -> bool:
+        MemoryBroker.published += 1
+        return True
+
+    def test(self, topic='wis2box/test', message='test') -> bool:
+        return True
+
+    def bind(self, event: str, function: Callable[..., Any]) -> None:
+        setattr(self, event, function)
+
+
+class FakeMessage:
+    """MQTT message as passed to on_message callbacks"""
+
+    def __init__(self, topic: str, payload: dict) -> None:
+        self.topic = topic
+        self.payload = json.dumps(payload).encode()
+
+
+class WorkloadBroker(MemoryBroker):
+    """
+    Subscriber broker client delivering a workload of storage events
+
+    `sub` delivers one event per object key, waits until `wait` returns
+    and then returns, which stops the subscriber.
+    """
+
+    def __init__(self, broker: dict, keys: list,
+                 wait: Callable[[dict], None]) -> None:
+        super().__init__(broker)
+        self.keys = keys
+        self.wait = wait
+        self.submitted = {}
+
+    def sub(self, topic: Union[str, list]) -> None:
+        for key in self.keys:
+            self.submitted[key] = time.perf_counter()
+            message = FakeMessage('wis2box/storage', {
+                'EventName': 's3:ObjectCreated:Put',
+                'Key': key
+            })
+            self.on_message(self, None, message)
+        self.wait(self.submitted)
+
+
+class FakeAPI:
+    """
+    wis2box-api process endpoints
+
+    Conversions return synthetic BUFR and GeoJSON outputs after a fixed
+    delay standing in for the conversion time of the API.
+    """
+
+    def __init__(self, latency: float = 0.005) -> None:
+        self.latency = latency
+
+    async def execute(self, request):
+        from aiohttp import web
+
+        await asyncio.sleep(self.latency)
+        inputs = (await request.json())['inputs']
+        if request.match_info['process_name'] == 'bufr2geojson':
+            result = {'items': self.geojson(inputs['data'])}
+        else:
+            result = {
+                'data_items': self.data_items(inputs),
+                'errors': [],
+                'warnings': []
+            }
+
+        return web.json_response(result)
+
+    def serve(self, port: int) -> None:
+        """
+        Serve the process endpoints until the process is terminated
+
+        :param port: `int` of local HTTP port
+
+        :returns: `None`
+        """
+
+        from aiohttp import web
+
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/processes/{process_name}/execution',
+                            self.execute)
+        web.run_app(app, host='localhost', port=port, print=None,
+                    handle_signals=False, access_log=None)
+
+    @staticmethod
+    def data_items(inputs: dict) -> list:
+        data = inputs['data']
+        if 'template' not in inputs and 'year' not in inputs:
+            # BUFR input is base64 encoded
+            data = base64.b64decode(data).decode()
+        items = []
+        for line in data.splitlines()[1:]:
+            wsi, timestamp = line.split(',')[:2]
+            rmk = f"WIGOS_{wsi}_{timestamp.replace(':', '').replace('-', '')}"  # noqa
+            items.append({
+                'filename': f'{rmk}.bufr4',
+                'data': base64.b64encode(line.encode() * 20).decode(),
+                '_meta': {
+                    'id': rmk,
+                    'data_date': timestamp,
+                    'wigos_station_identifier': wsi,
+                    'geometry': {
+                        'type': 'Point',
+                        'coordinates': [33.0, -13.0]
+                    }
+                }
+            })
+        return items
+
+    @staticmethod
+    def geojson(data: str) -> list:
+        items = []
+        for line in base64.b64decode(data).decode().splitlines()[1:]:
+            wsi, timestamp = line.split(',')[:2]
+            for name in ['air_temperature', 'relative_humidity']:
+                items.append({
+                    'id': f'{wsi}-{timestamp}-{name}',
+                    'type': 'Feature',
+                    'geometry': {
+                        'type': 'Point',
+                        'coordinates': [33.0, -13.0]
+                    },
+                    'properties': {
+                        'wigos_station_identifier': wsi,
+                        'reportTime': timestamp,
+                        'name': name,
+                        'value': 1.0
+                    }
+                })
+        return items
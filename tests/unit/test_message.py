@@ -0,0 +1,109 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+# unit tests of wis2box-management, run without the docker stack:
+# pytest tests/unit (with wis2box-management requirements installed)
+
+import os
+from pathlib import Path
+import sys
+import tempfile
+
+import pytest
+
+os.environ.setdefault('WIS2BOX_DATADIR', tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'wis2box-management'))  # noqa
+
+import wis2box.pubsub.message  # noqa
+
+# the package attribute is shadowed by a click command of the same name
+message = sys.modules['wis2box.pubsub.message']
+
+
+class Response:
+    def __init__(self, status_code: int, record: dict = None) -> None:
+        self.status_code = status_code
+        self.record = record
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise RuntimeError(f'HTTP {self.status_code}')
+
+    def json(self) -> dict:
+        return self.record
+
+
+class Session:
+    def __init__(self, response: Response) -> None:
+        self.response = response
+        self.requests = 0
+
+    def get(self, url: str, params: dict = None) -> Response:
+        self.requests += 1
+        return self.response
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def use(response):
+        session_ = Session(response)
+        monkeypatch.setattr(message, 'get_session', lambda: session_)
+        return session_
+
+    message.clear_has_auth()
+    yield use
+    message.clear_has_auth()
+
+
+def test_has_auth_record(session):
+    """Test access control flag of a dataset with a record"""
+
+    session_ = session(Response(200, {'wis2box': {'has_auth': True}}))
+
+    assert message.has_auth('urn:wmo:md:test:auth')
+    assert message.has_auth('urn:wmo:md:test:auth')
+    assert session_.requests == 1
+
+
+def test_has_auth_missing_record(session):
+    """Test that datasets without a record are cached as not access
+    controlled"""
+
+    session_ = session(Response(404))
+
+    assert message.has_auth('urn:wmo:md:test:missing') is False
+    assert message.has_auth('urn:wmo:md:test:missing') is False
+    assert session_.requests == 1
+
+    message.clear_has_auth('urn:wmo:md:test:missing')
+    assert message.has_auth('urn:wmo:md:test:missing') is False
+    assert session_.requests == 2
+
+
+def test_has_auth_error(session):
+    """Test that other errors are raised and not cached"""
+
+    session_ = session(Response(500))
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            message.has_auth('urn:wmo:md:test:error')
+    assert session_.requests == 2
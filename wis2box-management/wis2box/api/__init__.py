@@ -19,50 +19,168 @@
 #
 ###############################################################################
 
+import asyncio
 import click
 import logging
+import os
 import requests
-
 from time import sleep
+from typing import Any, Iterator, Tuple
 
 from owslib.ogcapi.records import Records
 
 from wis2box import cli_helpers
 from wis2box.api.backend import load_backend
+from wis2box.api.buffer import get_buffer, get_writer
 from wis2box.api.config import load_config
 from wis2box.data_mappings import get_plugins
 
+from wis2box.metrics import stage
 from wis2box.env import (DOCKER_API_URL, API_URL, STORAGE_API_RETENTION_DAYS,
-                         STORAGE_DATA_RETENTION_DAYS)
+                         STORAGE_DATA_RETENTION_DAYS, API_PROCESS_POLL_MAX,
+                         API_PROCESS_SYNC_MAX_BYTES)
 
 LOGGER = logging.getLogger(__name__)
 
+# per-process HTTP session, created on first use
+_SESSION = None
 
-def execute_api_process(process_name: str, payload: dict) -> dict:
+
+class APIProcessError(ValueError):
+    """Process execution rejected by the API"""
+
+    def __init__(self, msg: str, status: int) -> None:
+        """
+        Initializer
+
+        :param msg: `str` of error message
+        :param status: `int` of HTTP status code
+
+        :returns: `None`
+        """
+
+        super().__init__(msg)
+        self.status = status
+
+
+def get_session() -> requests.Session:
     """
-    Executes a process on the API
+    Get the HTTP session of the current process, creating it on first use
+
+    The session keeps connections to the API open between requests.
+
+    :returns: `requests.Session` object
+    """
+
+    global _SESSION
+
+    if _SESSION is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4,
+                                                pool_maxsize=16)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _SESSION = session
+
+    return _SESSION
+
+
+def _reset_session() -> None:
+    """
+    Drop the inherited HTTP session (sockets must not be shared with
+    the parent process)
+
+    :returns: `None`
+    """
+
+    global _SESSION
+
+    _SESSION = None
+
+
+os.register_at_fork(after_in_child=_reset_session)
+
+
+def _prepare_api_process(process_name: str,
+                         payload: dict) -> Tuple[str, dict]:
+    """
+    Prepare execution request of a process on the API
+
+    Small inputs are executed synchronously, saving the polling of a
+    job; larger inputs are submitted as asynchronous jobs.
 
     :param process_name: process name
     :param payload: payload to send to process
 
-    :returns: `dict` with execution-result
+    :returns: `tuple` of execution URL and request headers
     """
 
-    LOGGER.debug('Posting data to wis2box-api')
     headers = {
         'accept': 'application/json',
-        'Content-Type': 'application/json',
-        'prefer': 'respond-async'
+        'Content-Type': 'application/json'
     }
+
+    size = sum(len(value) for value in payload.get('inputs', {}).values()
+               if isinstance(value, (str, bytes)))
+    if size > API_PROCESS_SYNC_MAX_BYTES:
+        headers['prefer'] = 'respond-async'
+
     url = f'{DOCKER_API_URL}/processes/{process_name}/execution'
 
-    response = requests.post(url, headers=headers, json=payload)
+    return url, headers
+
+
+def _poll_intervals() -> Iterator[float]:
+    """
+    Generate intervals between job status requests
+
+    Polling starts fast for short jobs and backs off exponentially up
+    to `WIS2BOX_API_PROCESS_POLL_MAX` seconds.
+
+    :returns: generator of `float` seconds
+    """
+
+    interval = 0.02
+    while True:
+        yield interval
+        interval = min(interval * 1.5, API_PROCESS_POLL_MAX)
+
+
+def execute_api_process(process_name: str, payload: dict) -> dict:
+    """
+    Executes a process on the API
+
+    :param process_name: process name
+    :param payload: payload to send to process
+
+    :returns: `dict` with execution-result
+    """
+
+    with stage('api_process'):
+        return _execute_api_process(process_name, payload)
+
+
+def _execute_api_process(process_name: str, payload: dict) -> dict:
+    """
+    Executes a process on the API and waits for its result
+
+    :param process_name: process name
+    :param payload: payload to send to process
+
+    :returns: `dict` with execution-result
+    """
+
+    LOGGER.debug('Posting data to wis2box-api')
+    session = get_session()
+    url, headers = _prepare_api_process(process_name, payload)
+
+    response = session.post(url, headers=headers, json=payload)
     if response.status_code >= 400:
         msg = f'Failed to post data to wis2box-api: {response.status_code}' # noqa
         if response.text:
             msg += f'\nError message: {response.text}'
         LOGGER.error(msg)
-        raise ValueError(msg)
+        raise APIProcessError(msg, response.status_code)
 
     if response.status_code == 200:
         return response.json()
@@ -71,23 +189,100 @@ def execute_api_process(process_name: str, payload: dict) -> dict:
     location = headers_json['Location']
     location = location.replace(API_URL, DOCKER_API_URL)
 
+    headers = {
+        'accept': 'application/json',
+        'Content-Type': 'application/json'
+    }
     status = 'accepted'
+    intervals = _poll_intervals()
     while status in ['accepted', 'running']:
+        sleep(next(intervals))
         # get the job status
-        headers = {
-            'accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
-        response = requests.get(location, headers=headers)
+        response = session.get(location, headers=headers)
         response_json = response.json()
         if 'status' in response_json:
             status = response_json['status']
-        sleep(0.05)
     # get result from location/results?f=json
-    response = requests.get(f'{location}/results?f=json', headers=headers) # noqa
+    response = session.get(f'{location}/results?f=json', headers=headers) # noqa
     return response.json()
 
 
+async def execute_api_process_async(process_name: str, payload: dict,
+                                    session: Any = None) -> dict:
+    """
+    Executes a process on the API without blocking the event loop
+
+    Many executions can be kept in flight concurrently, for example
+    with `asyncio.gather`.
+
+    :param process_name: process name
+    :param payload: payload to send to process
+    :param session: `aiohttp.ClientSession` to reuse (optional)
+
+    :returns: `dict` with execution-result
+    """
+
+    import aiohttp
+
+    with stage('api_process'):
+        if session is None:
+            async with aiohttp.ClientSession() as session_:
+                return await _execute_api_process_async(
+                    process_name, payload, session_)
+
+        return await _execute_api_process_async(process_name, payload,
+                                                session)
+
+
+async def _execute_api_process_async(process_name: str, payload: dict,
+                                     session: Any) -> dict:
+    """
+    Executes a process on the API and waits for its result
+
+    :param process_name: process name
+    :param payload: payload to send to process
+    :param session: `aiohttp.ClientSession`
+
+    :returns: `dict` with execution-result
+    """
+
+    LOGGER.debug('Posting data to wis2box-api')
+    url, headers = _prepare_api_process(process_name, payload)
+
+    async with session.post(url, headers=headers, json=payload) as response:
+        if response.status >= 400:
+            msg = f'Failed to post data to wis2box-api: {response.status}' # noqa
+            text = await response.text()
+            if text:
+                msg += f'\nError message: {text}'
+            LOGGER.error(msg)
+            raise APIProcessError(msg, response.status)
+
+        if response.status == 200:
+            return await response.json(content_type=None)
+
+        location = response.headers['Location']
+        location = location.replace(API_URL, DOCKER_API_URL)
+
+    headers = {
+        'accept': 'application/json',
+        'Content-Type': 'application/json'
+    }
+    status = 'accepted'
+    intervals = _poll_intervals()
+    while status in ['accepted', 'running']:
+        await asyncio.sleep(next(intervals))
+        # get the job status
+        async with session.get(location, headers=headers) as response:
+            response_json = await response.json(content_type=None)
+        if 'status' in response_json:
+            status = response_json['status']
+    # get result from location/results?f=json
+    async with session.get(f'{location}/results?f=json',
+                           headers=headers) as response:
+        return await response.json(content_type=None)
+
+
 def setup_collection(meta: dict = {}) -> bool:
     """
     Add collection to api backend and configuration
@@ -179,8 +374,25 @@ def upsert_collection_item(collection_id: str, item: dict) -> str:
 
     :returns: `str` identifier of added item
     """
+
+    return upsert_collection_items(collection_id, [item])
+
+
+def upsert_collection_items(collection_id: str, items: list) -> bool:
+    """
+    Add or update collection items in one bulk request
+
+    :param collection_id: name of collection
+    :param items: `list` of GeoJSON item data `dict`'s
+
+    :returns: `bool` of result
+    """
+
+    if not items:
+        return True
+
     backend = load_backend()
-    backend.upsert_collection_items(collection_id, [item])
+    backend.upsert_collection_items(collection_id, items)
 
     if collection_id in ['discovery-metadata', 'stations']:
         backend.flush(collection_id)
@@ -188,6 +400,54 @@ def upsert_collection_item(collection_id: str, item: dict) -> str:
     return True
 
 
+def buffer_collection_item(collection_id: str, item: dict) -> bool:
+    """
+    Add or update a collection item through the bulk write buffer
+
+    The item is written together with other buffered items once the
+    buffer is full or its flush interval has elapsed.
+
+    :param collection_id: name of collection
+    :param item: `dict` of GeoJSON item data
+
+    :returns: `bool` of result
+    """
+
+    get_buffer().add(collection_id, item)
+
+    return True
+
+
+def queue_collection_item(collection_id: str, item: dict) -> bool:
+    """
+    Add or update a collection item from a background thread
+
+    The item is handed to the bulk write buffer by a background thread,
+    so that the caller does not wait for the API backend.  The caller
+    only blocks when the write queue is full.
+
+    :param collection_id: name of collection
+    :param item: `dict` of GeoJSON item data
+
+    :returns: `bool` of whether the item was queued
+    """
+
+    return get_writer().add(collection_id, item)
+
+
+def flush_collection_items(owner: Any = None) -> None:
+    """
+    Write all buffered collection items to the backend
+
+    :param owner: owner of items (see `wis2box.api.buffer.item_owner`)
+                  whose write failures to raise
+
+    :returns: `None`
+    """
+
+    get_buffer().flush(owner)
+
+
 def reindex_collection(collection_id: str, new_collection_id: str) -> str:
     """
     Reindex a collection
@@ -20,27 +20,64 @@
 ###############################################################################
 
 import logging
+import os
+from threading import Lock
 from typing import Any
 
-from wis2box.env import API_BACKEND_TYPE, API_BACKEND_URL
+from wis2box.env import (API_BACKEND_TYPE, API_BACKEND_URL,
+                         API_BACKEND_PARTITION)
 from wis2box.plugin import load_plugin, PLUGINS
 
 LOGGER = logging.getLogger(__name__)
 
+# per-process backend, created on first use
+_BACKEND = None
+_BACKEND_LOCK = Lock()
+
+
+def _reset_backend() -> None:
+    """
+    Drop the inherited backend (connection pools must not be shared
+    between processes)
+
+    :returns: `None`
+    """
+
+    global _BACKEND, _BACKEND_LOCK
+
+    _BACKEND = None
+    _BACKEND_LOCK = Lock()
+
+
+os.register_at_fork(after_in_child=_reset_backend)
+
 
 def load_backend() -> Any:
     """
     Load wis2box API backend
 
+    The backend (and its connection pool) is created once per process
+    and shared by all callers.
+
     :returns: plugin object
     """
 
-    LOGGER.debug('Loading backend')
+    global _BACKEND
+
+    if _BACKEND is not None:
+        return _BACKEND
+
+    with _BACKEND_LOCK:
+        if _BACKEND is None:
+            LOGGER.debug('Loading backend')
+
+            codepath = PLUGINS['api_backend'][API_BACKEND_TYPE]['plugin']
+            defs = {
+                'codepath': codepath,
+                'url': API_BACKEND_URL,
+                'partition': API_BACKEND_PARTITION
+            }
 
-    codepath = PLUGINS['api_backend'][API_BACKEND_TYPE]['plugin']
-    defs = {
-        'codepath': codepath,
-        'url': API_BACKEND_URL
-    }
+            _BACKEND = load_plugin('api_backend', defs)
 
-    return load_plugin('api_backend', defs)
+    return _BACKEND
@@ -106,6 +106,27 @@ class BaseBackend:
 
         raise NotImplementedError()
 
+    def upsert_collection_items(self, collection: str, items: list) -> str:
+        """
+        Add or update collection items in bulk
+
+        :param collection: name of collection
+        :param items: `list` of GeoJSON item data `dict`s
+
+        :returns: `str` identifier of added item
+        """
+
+        raise NotImplementedError()
+
+    def clear_cache(self) -> None:
+        """
+        Forget cached collection state (e.g. after collections changed)
+
+        :returns: `None`
+        """
+
+        pass
+
     def delete_collection_item(self, collection: str, item_id: str) -> str:
         """
         Delete an item from a collection
@@ -19,10 +19,12 @@
 #
 ###############################################################################
 
+from datetime import date, datetime
 import logging
+import re
 
 from elasticsearch import Elasticsearch, helpers
-from typing import Tuple
+from typing import Tuple, Union
 
 from wis2box.api.backend.base import BaseBackend
 from wis2box.util import datetime_days_ago
@@ -30,6 +32,18 @@ from wis2box.util import datetime_days_ago
 logging.getLogger('elasticsearch').setLevel(logging.ERROR)
 LOGGER = logging.getLogger(__name__)
 
+# partition layouts and the date suffix of their backing indexes
+PARTITIONS = {
+    'daily': '%Y.%m.%d',
+    'monthly': '%Y.%m'
+}
+
+# separator between collection alias and partition date in index names
+PARTITION_SEPARATOR = '.partition.'
+
+PARTITION_INDEX = re.compile(
+    r'^(?P<alias>.+)\.partition\.(?P<year>\d{4})\.(?P<month>\d{2})(\.(?P<day>\d{2}))?$')  # noqa
+
 # default index settings
 SETTINGS = {
     'number_of_shards': 1,
@@ -239,6 +253,16 @@ class ElasticBackend(BaseBackend):
         self.conn = Elasticsearch(self.url, timeout=30,
                                   max_retries=10, retry_on_timeout=True)
 
+        # indexes known to exist, saving a round trip per write
+        self._indexes = set()
+
+        self.partition = defs.get('partition', 'none')
+        if self.partition not in ['none', *PARTITIONS]:
+            LOGGER.warning(f'Unknown partition layout {self.partition}; not partitioning')  # noqa
+            self.partition = 'none'
+        # partitioned layout of collections, by ES index
+        self._layouts = {}
+
     @staticmethod
     def es_id(collection_id: str) -> Tuple[str]:
         """
@@ -250,6 +274,82 @@ class ElasticBackend(BaseBackend):
         """
         return collection_id.lower().replace(':', '-')
 
+    def is_partitioned(self, es_index: str) -> bool:
+        """
+        Check whether a collection uses time-partitioned backing indexes
+
+        Messages and observation collections are partitioned when a
+        partition layout is configured, except collections created as a
+        single index before partitioning was enabled.
+
+        :param es_index: `str` of ES index (alias) of collection
+
+        :returns: `bool` of result
+        """
+
+        if self.partition == 'none':
+            return False
+        if es_index != 'messages' and not es_index.startswith('urn-wmo-md'):
+            return False
+
+        if es_index not in self._layouts:
+            indices = self.conn.indices
+            single = (bool(indices.exists(index=es_index)) and
+                      not indices.exists_alias(name=es_index))
+            self._layouts[es_index] = not single
+
+        return self._layouts[es_index]
+
+    def partition_index(self, es_index: str, feature: dict) -> str:
+        """
+        Get the backing index of a feature in a partitioned collection
+
+        Features are partitioned by their own time (observation report
+        time or message publication time), so that updates of a feature
+        go to the same index.
+
+        :param es_index: `str` of ES index (alias) of collection
+        :param feature: `dict` of GeoJSON feature
+
+        :returns: `str` of backing index name
+        """
+
+        properties = feature.get('properties', {})
+        time_ = (properties.get('reportTime') or properties.get('pubtime') or
+                 properties.get('pubTime'))
+        try:
+            date_ = datetime.strptime(str(time_)[:10], '%Y-%m-%d')
+        except ValueError:
+            date_ = datetime.utcnow()
+
+        suffix = date_.strftime(PARTITIONS[self.partition])
+        return f'{es_index}{PARTITION_SEPARATOR}{suffix}'
+
+    @staticmethod
+    def partition_range(index: str) -> Union[Tuple[date, date], None]:
+        """
+        Get the date range covered by a partition backing index
+
+        :param index: `str` of index name
+
+        :returns: `tuple` of first and next-after-last `date`, or `None`
+                  if the index is not a partition
+        """
+
+        match = PARTITION_INDEX.match(index)
+        if match is None:
+            return None
+
+        year, month = int(match['year']), int(match['month'])
+        if match['day'] is not None:
+            start = date(year, month, int(match['day']))
+            return start, date.fromordinal(start.toordinal() + 1)
+
+        start = date(year, month, 1)
+        if month == 12:
+            return start, date(year + 1, 1, 1)
+        return start, date(year, month + 1, 1)
+
     def list_collections(self) -> list:
         """
         List collections
@@ -282,6 +382,20 @@ class ElasticBackend(BaseBackend):
             LOGGER.error(msg)
             raise RuntimeError(msg)
 
+        if self.is_partitioned(es_index):
+            # backing indexes are created on first write, and added to
+            # the collection alias by the template
+            LOGGER.debug('Creating index template')
+            self.conn.indices.put_index_template(
+                name=es_index,
+                index_patterns=[f'{es_index}{PARTITION_SEPARATOR}*'],
+                template={
+                    'settings': SETTINGS,
+                    'mappings': mappings,
+                    'aliases': {es_index: {}}
+                })
+            return self.has_collection(collection_id)
+
         LOGGER.debug('Creating index')
         self.conn.options().indices.create(index=es_index, mappings=mappings,
                                            settings=SETTINGS)
@@ -303,7 +417,14 @@ class ElasticBackend(BaseBackend):
             LOGGER.error(msg)
             raise RuntimeError(msg)
 
-        if self.conn.indices.exists(index=es_index):
+        self._indexes.discard(es_index)
+        if self.is_partitioned(es_index):
+            if self.conn.indices.exists_alias(name=es_index):
+                backing = self.conn.indices.get_alias(name=es_index).keys()
+                self.conn.indices.delete(index=','.join(backing))
+            self.conn.indices.delete_index_template(name=es_index)
+            self._layouts.pop(es_index, None)
+        elif self.conn.indices.exists(index=es_index):
             self.conn.indices.delete(index=es_index)
 
         return not self.has_collection(collection_id)
@@ -334,14 +455,39 @@ class ElasticBackend(BaseBackend):
         """
         Checks a collection
 
+        Collections found to exist are remembered until `clear_cache`
+        is called, so that repeated checks do not query Elasticsearch.
+
         :param collection_id: name of collection
 
         :returns: `bool` of collection result
         """
         es_index = self.es_id(collection_id)
+        if es_index in self._indexes:
+            return True
+
         indices = self.conn.indices
 
-        return indices.exists(index=es_index)
+        if self.is_partitioned(es_index):
+            exists = bool(indices.exists_index_template(name=es_index))
+        else:
+            exists = bool(indices.exists(index=es_index))
+        if exists:
+            self._indexes.add(es_index)
+        else:
+            self._indexes.discard(es_index)
+
+        return exists
+
+    def clear_cache(self) -> None:
+        """
+        Forget indexes known to exist
+
+        :returns: `None`
+        """
+
+        self._indexes.clear()
+        self._layouts.clear()
 
     def upsert_collection_items(self, collection_id: str, items: list) -> str:
         """
@@ -358,6 +504,8 @@ class ElasticBackend(BaseBackend):
             LOGGER.debug(f'Index {es_index} does not exist.  Creating')
             self.add_collection(es_index)
 
+        partitioned = self.is_partitioned(es_index)
+
         def gendata(features):
             """
             Generator function to yield features
@@ -367,8 +515,13 @@ class ElasticBackend(BaseBackend):
                 LOGGER.debug(f'Feature: {feature}')
                 feature['properties']['id'] = feature['id']
 
+                if partitioned:
+                    index = self.partition_index(es_index, feature)
+                else:
+                    index = es_index
+
                 yield {
-                    '_index': es_index,
+                    '_index': index,
                     '_id': feature['id'],
                     '_source': feature
                 }
@@ -390,7 +543,13 @@ class ElasticBackend(BaseBackend):
 
         LOGGER.debug(f'Deleting {item_id} from {collection_id}')
         try:
-            _ = self.conn.delete(index=collection_id, id=item_id)
+            if self.is_partitioned(self.es_id(collection_id)):
+                # the item may be in any backing index of the alias
+                _ = self.conn.delete_by_query(
+                    index=self.es_id(collection_id),
+                    query={'ids': {'values': [item_id]}})
+            else:
+                _ = self.conn.delete(index=collection_id, id=item_id)
         except Exception as err:
             msg = f'Item deletion failed: {err}'
             raise RuntimeError(msg)
@@ -434,7 +593,7 @@ class ElasticBackend(BaseBackend):
         }
 
         for index in indices:
-            if index == 'messages':
+            if index == 'messages' or index.startswith(f'messages{PARTITION_SEPARATOR}'):  # noqa
                 query_by_date = msg_query_by_date
             elif index.startswith('urn-wmo-md'):
                 query_by_date = obs_query_by_date
@@ -442,6 +601,17 @@ class ElasticBackend(BaseBackend):
                 # don't run delete-query on other indexes
                 LOGGER.info(f'items for index={index} will not be deleted')
                 continue
+
+            range_ = self.partition_range(index)
+            if range_ is not None:
+                start, end = range_
+                if end <= before or start >= after:
+                    LOGGER.info(f'deleting expired partition index={index}')  # noqa
+                    self.conn.indices.delete(index=index)
+                    continue
+                if start > before and end <= after:
+                    LOGGER.debug(f'partition index={index} within retention')  # noqa
+                    continue
             LOGGER.info(f'deleting documents from index={index} older than {days} days ({before}) or newer than {after}')  # noqa
             result = self.conn.delete_by_query(index=index, **query_by_date)
             LOGGER.info(f'deleted {result["deleted"]} documents from index={index}')  # noqa
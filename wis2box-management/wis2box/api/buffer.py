@@ -0,0 +1,412 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+from multiprocessing.util import Finalize
+import os
+import queue
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Iterator
+
+from wis2box.api.backend import load_backend
+from wis2box.env import (API_BULK_MAX_ITEMS, API_BULK_FLUSH_INTERVAL,
+                         API_WRITE_QUEUE_MAX, API_WRITE_QUEUE_TIMEOUT)
+from wis2box.metrics import (WRITE_QUEUE_DEPTH, WRITE_QUEUE_DROPPED,
+                             labels, stage)
+
+LOGGER = logging.getLogger(__name__)
+
+
+class BulkWriteError(RuntimeError):
+    """Items failed to be written to the API backend"""
+    pass
+
+
+# per-process buffer, created on first use
+_BUFFER = None
+_BUFFER_LOCK = Lock()
+
+# per-process writer, created on first use
+_WRITER = None
+
+# owner (e.g. the handler of a file) of items added within the context
+_OWNER = ContextVar('wis2box_buffer_owner', default=None)
+
+
+@contextmanager
+def item_owner(owner: Any) -> Iterator[None]:
+    """
+    Set the owner of items added to the buffer within the context
+
+    Failures to write the items of an owner are reported when the owner
+    flushes the buffer, whichever flush wrote them.
+
+    :param owner: hashable owner object
+
+    :returns: `None`
+    """
+
+    token = _OWNER.set(owner)
+    try:
+        yield
+    finally:
+        _OWNER.reset(token)
+
+
+class ItemBuffer:
+    """
+    Buffer of collection items written to the API backend in bulk
+
+    Items are accumulated across data items and files and written with
+    one bulk request per collection once ``max_items`` are buffered, or
+    at the latest ``flush_interval`` seconds after the first buffered
+    item.  Items sharing an id within a collection are de-duplicated,
+    keeping the latest version.
+
+    Each item is tracked with its owner (see `item_owner`), so that failures
+    to write it are reported to the owner rather than to whichever file
+    triggered the flush.
+    """
+
+    def __init__(self, backend: Any, max_items: int = 500,
+                 flush_interval: float = 2) -> None:
+        """
+        Initializer
+
+        :param backend: API backend object
+        :param max_items: `int` of buffered items triggering a flush
+        :param flush_interval: `float` of maximum seconds items are held
+
+        :returns: `None`
+        """
+
+        self.backend = backend
+        self.max_items = max_items
+        self.flush_interval = flush_interval
+
+        self._items = {}
+        self._failures = {}
+        self._count = 0
+        self._oldest = None
+        self._lock = Lock()
+        self._stopped = Event()
+        self._flusher = None
+
+    def add(self, collection_id: str, item: dict) -> None:
+        """
+        Add an item to the buffer, flushing if the buffer is full
+
+        :param collection_id: name of collection
+        :param item: `dict` of GeoJSON item data
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            items = self._items.setdefault(collection_id, {})
+            if item['id'] in items:
+                owners = items[item['id']][1]
+            else:
+                owners = set()
+                self._count += 1
+            owners.add(_OWNER.get())
+            items[item['id']] = (item, owners)
+            if self._oldest is None:
+                self._oldest = monotonic()
+
+            if self._count >= self.max_items:
+                self._flush()
+
+        self._ensure_flusher()
+
+    def flush(self, owner: Any = None) -> None:
+        """
+        Write all buffered items to the backend
+
+        :param owner: owner whose failures to raise, including those of
+                      earlier flushes (default raises none)
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            self._flush()
+            errors = self._failures.pop(owner, None)
+
+        if errors:
+            raise BulkWriteError('; '.join(errors))
+
+    def invalidate(self) -> None:
+        """
+        Flush buffered items and forget cached collection state
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            try:
+                self._flush()
+            finally:
+                self.backend.clear_cache()
+
+    def _flush(self) -> None:
+        """
+        Write all buffered items to the backend (lock must be held)
+
+        Items of a collection failing to index are dropped and the error
+        is kept for each of their owners, until the owner flushes.
+
+        :returns: `None`
+        """
+
+        if not self._items:
+            return
+
+        items, self._items = self._items, {}
+        self._count = 0
+        self._oldest = None
+
+        for collection_id, collection_items in items.items():
+            LOGGER.debug(f'Writing {len(collection_items)} items to {collection_id}')  # noqa
+            try:
+                with labels(dataset=collection_id), stage('api_bulk'):
+                    self.backend.upsert_collection_items(
+                        collection_id,
+                        [item for item, _ in collection_items.values()])
+            except Exception as err:
+                msg = f'Failed to write items to {collection_id}: {err}'
+                LOGGER.error(msg)
+                owners = set().union(
+                    *(owners for _, owners in collection_items.values()))
+                # nobody flushes on behalf of items without an owner
+                owners.discard(None)
+                for owner in owners:
+                    self._failures.setdefault(owner, []).append(msg)
+
+    def _ensure_flusher(self) -> None:
+        """
+        Start the background thread flushing items by age
+
+        :returns: `None`
+        """
+
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+
+        self._flusher = Thread(target=self._run, name='wis2box-api-flusher',
+                               daemon=True)
+        self._flusher.start()
+
+    def _run(self) -> None:
+        """
+        Flush buffered items once they reach the flush interval
+
+        :returns: `None`
+        """
+
+        while not self._stopped.wait(self.flush_interval / 4):
+            oldest = self._oldest
+            if oldest is None or monotonic() - oldest < self.flush_interval:
+                continue
+            try:
+                self.flush()
+            except Exception as err:
+                LOGGER.error(f'Background flush failed: {err}')
+
+    def close(self) -> None:
+        """
+        Flush remaining items and stop the background thread
+
+        :returns: `None`
+        """
+
+        self._stopped.set()
+        try:
+            self.flush()
+        except Exception as err:
+            LOGGER.error(f'Final flush failed: {err}')
+
+    def __repr__(self):
+        return f'<ItemBuffer (max_items={self.max_items}, flush_interval={self.flush_interval})>'  # noqa
+
+
+class QueuedWriter:
+    """
+    Writer of collection items off the calling thread
+
+    Items are queued and added to an item buffer by a background thread,
+    so that callers (e.g. the MQTT network thread) do not wait for the
+    API backend.  When the queue is full, callers block for up to
+    ``timeout`` seconds before the item is dropped.
+    """
+
+    def __init__(self, buffer: ItemBuffer, queue_max: int = 10000,
+                 timeout: float = 5) -> None:
+        """
+        Initializer
+
+        :param buffer: `wis2box.api.buffer.ItemBuffer` writing the items
+        :param queue_max: `int` of maximum number of queued items
+        :param timeout: `float` of seconds to wait for a full queue
+
+        :returns: `None`
+        """
+
+        self.buffer = buffer
+        self.timeout = timeout
+
+        self._queue = queue.Queue(queue_max)
+        self._writer = Thread(target=self._run, name='wis2box-api-writer',
+                              daemon=True)
+        self._writer.start()
+
+    def add(self, collection_id: str, item: dict) -> bool:
+        """
+        Queue an item for writing
+
+        :param collection_id: name of collection
+        :param item: `dict` of GeoJSON item data
+
+        :returns: `bool` of whether the item was queued
+        """
+
+        try:
+            self._queue.put((collection_id, item), timeout=self.timeout)
+        except queue.Full:
+            LOGGER.error(f'Write queue full; dropping item {item.get("id")} of {collection_id}')  # noqa
+            WRITE_QUEUE_DROPPED.labels(collection_id).inc()
+            return False
+
+        return True
+
+    def qsize(self) -> int:
+        """
+        Number of queued items
+
+        :returns: `int` of queued items
+        """
+
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        """
+        Pass queued items to the item buffer until a `None` sentinel
+
+        :returns: `None`
+        """
+
+        while True:
+            entry = self._queue.get()
+            try:
+                if entry is None:
+                    return
+                self.buffer.add(*entry)
+            except Exception as err:
+                LOGGER.error(f'Failed to write items: {err}')
+            finally:
+                self._queue.task_done()
+
+    def close(self) -> None:
+        """
+        Write remaining items and stop the background thread
+
+        :returns: `None`
+        """
+
+        self._queue.put(None)
+        self._writer.join()
+        try:
+            self.buffer.flush()
+        except Exception as err:
+            LOGGER.error(f'Final flush failed: {err}')
+
+    def __repr__(self):
+        return f'<QueuedWriter (queue_max={self._queue.maxsize})>'
+
+
+def _reset_buffer() -> None:
+    """
+    Drop the inherited buffer and writer (items belong to the parent
+    process, and background threads do not survive a fork)
+
+    :returns: `None`
+    """
+
+    global _BUFFER, _BUFFER_LOCK, _WRITER
+
+    _BUFFER = None
+    _BUFFER_LOCK = Lock()
+    _WRITER = None
+
+
+os.register_at_fork(after_in_child=_reset_buffer)
+
+
+def get_buffer() -> ItemBuffer:
+    """
+    Get the item buffer of the current process, creating it on first use
+
+    :returns: `wis2box.api.buffer.ItemBuffer` object
+    """
+
+    global _BUFFER
+
+    if _BUFFER is not None:
+        return _BUFFER
+
+    with _BUFFER_LOCK:
+        if _BUFFER is None:
+            _BUFFER = ItemBuffer(load_backend(), API_BULK_MAX_ITEMS,
+                                 API_BULK_FLUSH_INTERVAL)
+            # run at interpreter exit, including in multiprocessing workers
+            # which exit without running atexit handlers
+            Finalize(None, _BUFFER.close, exitpriority=10)
+
+    return _BUFFER
+
+
+def get_writer() -> QueuedWriter:
+    """
+    Get the queued writer of the current process, creating it on first use
+
+    The writer adds items to the item buffer of the process.
+
+    :returns: `wis2box.api.buffer.QueuedWriter` object
+    """
+
+    global _WRITER
+
+    if _WRITER is not None:
+        return _WRITER
+
+    buffer = get_buffer()
+    with _BUFFER_LOCK:
+        if _WRITER is None:
+            _WRITER = QueuedWriter(buffer, API_WRITE_QUEUE_MAX,
+                                   API_WRITE_QUEUE_TIMEOUT)
+            WRITE_QUEUE_DEPTH.set_function(_WRITER.qsize)
+            # drain the queue before the buffer is closed
+            Finalize(None, _WRITER.close, exitpriority=20)
+
+    return _WRITER
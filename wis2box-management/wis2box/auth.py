@@ -20,6 +20,7 @@
 ###############################################################################
 
 import click
+import json
 import logging
 import requests
 from secrets import token_hex
@@ -29,7 +30,8 @@ from owslib.ogcapi.records import Records
 from wis2box import cli_helpers
 from wis2box.api import upsert_collection_item
 from wis2box.data_mappings import get_data_mappings
-from wis2box.env import AUTH_URL, DOCKER_API_URL
+from wis2box.env import AUTH_URL, DOCKER_API_URL, DOCKER_BROKER
+from wis2box.plugin import load_plugin, PLUGINS
 
 
 LOGGER = logging.getLogger(__name__)
@@ -41,6 +43,26 @@ VALID_PATHS = [
 ]
 
 
+def refresh_auth(metadata_id: str) -> None:
+    """
+    Notify the subscriber that access control of a dataset changed
+
+    :param metadata_id: `str` of metadata identifier
+
+    :returns: `None`
+    """
+
+    defs_local = {
+        'codepath': PLUGINS['pubsub']['mqtt']['plugin'],
+        'url': DOCKER_BROKER,
+        'client_type': 'auth-manager'
+    }
+    local_broker = load_plugin('pubsub', defs_local)
+    message = json.dumps({'metadata_id': metadata_id})
+    if not local_broker.pub('wis2box/auth/refresh', message, qos=0):
+        LOGGER.error('Failed to refresh access control')
+
+
 def create_token(path: str, token: str) -> bool:
     """
     Creates a token with access control
@@ -194,6 +216,7 @@ def add_token(ctx, metadata_id, path, yes, token):
         del record['links'][-6:]
 
         upsert_collection_item('discovery-metadata', record)
+        refresh_auth(metadata_id)
 
 
 @click.command()
@@ -228,6 +251,7 @@ def remove_token(ctx, metadata_id, path, token):
         del record['links'][-6:]
 
         upsert_collection_item('discovery-metadata', record)
+        refresh_auth(metadata_id)
 
 
 auth.add_command(add_token)
@@ -19,9 +19,12 @@
 #
 ###############################################################################
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 from datetime import datetime, timedelta, timezone
-from typing import Union
+from pathlib import Path
+from time import monotonic
+from typing import Iterator, Union
 
 import click
 
@@ -33,11 +36,57 @@ from wis2box.env import (STORAGE_SOURCE, STORAGE_PUBLIC, STORAGE_INCOMING,
                          STORAGE_DATA_RETENTION_DAYS)
 from wis2box.handler import Handler
 from wis2box.metadata.discovery import DiscoveryMetadata
-from wis2box.storage import put_data, list_content, delete_data
-from wis2box.util import walk_path
+from wis2box.storage import (CHECKSUM_METADATA_KEY, delete_data_batch,
+                             iter_content, put_data_stream,
+                             set_data_expiration, set_data_metadata,
+                             stat_data)
+from wis2box.util import HashingReader, walk_path
 
 LOGGER = logging.getLogger(__name__)
 
+# chunk size used to read files when computing checksums
+CHUNK_SIZE = 1048576
+
+
+# number of objects deleted per batch when cleaning storage
+CLEAN_BATCH_SIZE = 1000
+
+
+def _expired_objects(source_path: str, before: datetime) -> Iterator[str]:
+    """
+    Generate paths of objects last modified before a given time
+
+    Top level "directories" named by date (YYYY-MM-DD, as in the public
+    bucket) not older than the cut-off date are skipped without listing
+    their content.  Other "directories" are listed object by object.
+
+    :param source_path: `str` of base storage-path to be cleaned
+    :param before: `datetime` of cut-off time
+
+    :returns: generator of `str` storage paths
+    """
+
+    for entry in iter_content(source_path, recursive=False):
+        if not entry['is_dir']:
+            # don't delete files in the base-directory
+            continue
+        if entry['basedir'] == 'metadata':
+            LOGGER.debug('Skipping metadata')
+            continue
+        try:
+            date_ = datetime.strptime(entry['basedir'], '%Y-%m-%d').date()
+            if date_ >= before.date():
+                LOGGER.debug(f"Skipping recent data in {entry['basedir']}")
+                continue
+        except ValueError:
+            pass
+
+        for obj in iter_content(f"{source_path}/{entry['basedir']}/"):
+            LOGGER.debug(f"filename={obj['filename']}")
+            LOGGER.debug(f"last_modified={obj['last_modified']}")
+            if obj['last_modified'] < before:
+                yield obj['fullpath']
+
 
 def clean_data(source_path: str, days: int) -> None:
     """
@@ -52,23 +101,85 @@ def clean_data(source_path: str, days: int) -> None:
     before = datetime.now(timezone.utc) - timedelta(days=days)
     LOGGER.info(f'Deleting data older than {before} from {source_path}')
     nfiles_deleted = 0
-    for obj in list_content(source_path):
-        if obj['basedir'] == 'metadata':
-            LOGGER.debug('Skipping metadata')
-            continue
-        # don't delete files in the base-directory
-        if obj['basedir'] == '' or obj['basedir'] == obj['filename']:
-            continue
-        storage_path = obj['fullpath']
-        LOGGER.debug(f"filename={obj['filename']}")
-        LOGGER.debug(f"last_modified={obj['last_modified']}")
-        if obj['last_modified'] < before:
-            LOGGER.debug(f"Deleting {storage_path}")
-            delete_data(storage_path)
-            nfiles_deleted += 1
+    batch = []
+    for storage_path in _expired_objects(source_path, before):
+        LOGGER.debug(f"Deleting {storage_path}")
+        batch.append(storage_path)
+        if len(batch) >= CLEAN_BATCH_SIZE:
+            nfiles_deleted += delete_data_batch(batch)
+            batch = []
+    if batch:
+        nfiles_deleted += delete_data_batch(batch)
     LOGGER.info(f'Deleted {nfiles_deleted} files from {source_path}')
 
 
+def file_checksum(filepath: Path) -> str:
+    """
+    Compute the checksum of a local file, reading it in chunks
+
+    :param filepath: `Path` of local file
+
+    :returns: `str` of base64 SHA512 checksum
+    """
+
+    with filepath.open('rb') as fh:
+        reader = HashingReader(fh)
+        while reader.read(CHUNK_SIZE):
+            pass
+
+    return reader.checksum
+
+
+def ingest_file(filepath: Path, path: str,
+                skip_existing: bool = False) -> Union[int, None]:
+    """
+    Upload a file to storage, streaming it from disk
+
+    The SHA512 checksum of the file is computed during the upload and
+    then stored as object metadata, as for published data, so that
+    stored objects can be compared without fetching them.
+
+    :param filepath: `Path` of local file
+    :param path: `str` of storage path
+    :param skip_existing: `bool` of whether to skip files already in
+                          storage with the same checksum (or the same
+                          size, for objects stored without a checksum)
+
+    :returns: `int` of bytes uploaded, or `None` if the file was skipped
+    """
+
+    size = filepath.stat().st_size
+
+    if skip_existing:
+        stat = stat_data(path)
+        if stat is not None:
+            stored_checksum = stat['metadata'].get(CHECKSUM_METADATA_KEY)
+            if stored_checksum is not None:
+                # only files already in storage are read twice
+                same = stored_checksum == file_checksum(filepath)
+            else:
+                same = stat['size'] == size
+            if same:
+                LOGGER.debug(f'{path} already in storage; skipping')
+                return None
+
+    with filepath.open('rb') as fh:
+        reader = HashingReader(fh)
+        if not put_data_stream(reader, path, size):
+            raise RuntimeError(f'Failed to upload {filepath} to {path}')
+
+    if reader.length != size:
+        LOGGER.warning(f'{filepath} changed during upload')
+
+    # user metadata is sent before the data, so the checksum computed
+    # while uploading is set afterwards
+    if not set_data_metadata(path, {CHECKSUM_METADATA_KEY: reader.checksum}):
+        LOGGER.warning(f'Failed to store checksum of {path}')
+    LOGGER.debug(f'Uploaded {path} ({reader.length} bytes, sha512={reader.checksum})')  # noqa
+
+    return reader.length
+
+
 def gcm(mcf: Union[dict, str]) -> dict:
     """
     Generate collection metadata from metadata control file
@@ -136,8 +247,10 @@ def data():
 @click.command()
 @click.pass_context
 @click.option('--days', '-d', help='Number of days of data to keep', type=int)
+@click.option('--lifecycle', default=False, is_flag=True,
+              help='Also install a lifecycle rule expiring incoming data')
 @cli_helpers.OPTION_VERBOSITY
-def clean(ctx, days, verbosity):
+def clean(ctx, days, lifecycle, verbosity):
     """Clean data from storage older than X days"""
 
     if days is not None:
@@ -156,6 +269,9 @@ def clean(ctx, days, verbosity):
         storage_path_incoming = f'{STORAGE_SOURCE}/{STORAGE_INCOMING}'
         click.echo(f'Deleting data > {days_} day(s) old from {storage_path_incoming}') # noqa
         clean_data(storage_path_incoming, days_)
+        if lifecycle and days_ > 0:
+            click.echo(f'Setting expiration of {days_} day(s) on {storage_path_incoming}')  # noqa
+            set_data_expiration(storage_path_incoming, days_)
         click.echo('Done')
 
 
@@ -165,8 +281,14 @@ def clean(ctx, days, verbosity):
 @cli_helpers.OPTION_METADATA_ID
 @cli_helpers.OPTION_PATH
 @cli_helpers.OPTION_RECURSIVE
+@click.option('--workers', '-w', default=1, type=click.IntRange(min=1),
+              help='Number of concurrent uploads')
+@click.option('--skip-existing', default=False, is_flag=True,
+              help='Skip files already in storage with the same checksum '
+                   '(or the same size, for files stored without a checksum)')
 @cli_helpers.OPTION_VERBOSITY
-def ingest(ctx, topic_hierarchy, metadata_id, path, recursive, verbosity):
+def ingest(ctx, topic_hierarchy, metadata_id, path, recursive, workers,
+           skip_existing, verbosity):
     """Ingest data file or directory"""
 
     # either topic_hierarchy or metadata_id must be provided
@@ -185,13 +307,45 @@ def ingest(ctx, topic_hierarchy, metadata_id, path, recursive, verbosity):
     else:
         rfp = topic_hierarchy.replace('.', '/')
 
-    for file_to_process in walk_path(path, '.*', recursive):
-        click.echo(f'Processing {file_to_process}')
-        path = f'{STORAGE_INCOMING}/{rfp}/{file_to_process.name}'
-
-        with file_to_process.open('rb') as fh:
-            data = fh.read()
-            put_data(data, path)
+    files = list(walk_path(path, '.*', recursive))
+    total = len(files)
+    uploaded = skipped = nbytes = 0
+    failed = []
+
+    start = monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for file_to_process in files:
+            storage_path = f'{STORAGE_INCOMING}/{rfp}/{file_to_process.name}'
+            future = executor.submit(ingest_file, file_to_process,
+                                     storage_path, skip_existing)
+            futures[future] = file_to_process
+
+        for count, future in enumerate(as_completed(futures), start=1):
+            file_to_process = futures[future]
+            try:
+                size = future.result()
+            except Exception as err:
+                LOGGER.error(f'Failed to ingest {file_to_process}: {err}')
+                failed.append(file_to_process)
+                click.echo(f'[{count}/{total}] Failed {file_to_process}')
+                continue
+            if size is None:
+                skipped += 1
+                click.echo(f'[{count}/{total}] Skipped {file_to_process}')
+            else:
+                uploaded += 1
+                nbytes += size
+                click.echo(f'[{count}/{total}] Processed {file_to_process}')
+
+    elapsed = max(monotonic() - start, 1e-6)
+    click.echo(f'Uploaded {uploaded} file(s) ({nbytes / 1e6:.1f} MB), '
+               f'skipped {skipped}, failed {len(failed)} in {elapsed:.1f}s '
+               f'({uploaded / elapsed:.1f} files/s, '
+               f'{nbytes / 1e6 / elapsed:.1f} MB/s)')
+
+    if failed:
+        raise click.ClickException(f'Failed to ingest {len(failed)} file(s)')
 
     click.echo("Done")
 
@@ -19,20 +19,25 @@
 #
 ###############################################################################
 import base64
+from concurrent.futures import Executor
+import hashlib
 import json
 import logging
 from pathlib import Path
 import re
-from typing import Iterator, Union
+from typing import Any, Iterator, Tuple, Union
 
 from wis2box.env import (STORAGE_PUBLIC,
                          STORAGE_SOURCE, BROKER_PUBLIC,
                          DOCKER_BROKER)
-from wis2box.storage import exists, get_data, put_data
+from wis2box.storage import (CHECKSUM_METADATA_KEY, get_data, put_data,
+                             stat_data)
 
-from wis2box.plugin import load_plugin, PLUGINS
-
-from wis2box.pubsub.message import WISNotificationMessage
+from wis2box.api import execute_api_process, execute_api_process_async
+from wis2box.metrics import stage
+from wis2box.pubsub.message import WISNotificationMessage, generate_checksum
+from wis2box.pubsub.publisher import get_publisher
+from wis2box.util import json_serial, run_in_executor
 
 LOGGER = logging.getLogger(__name__)
 
@@ -59,6 +64,8 @@ class BaseAbstractData:
         self.enable_notification = defs.get('notify', False)
         self.buckets = defs.get('buckets', ())
         self.output_data = {}
+        # errors of items failing to publish
+        self.errors = []
         self.discovery_metadata = {}
         self.gts = None
         gts_ttaaii = defs.get('gts_ttaaii')
@@ -80,13 +87,7 @@ class BaseAbstractData:
         }
         if wsi is not None:
             message['wigos_station_identifier'] = wsi
-        # load plugin for local broker
-        defs = {
-            'codepath': PLUGINS['pubsub']['mqtt']['plugin'],
-            'url': DOCKER_BROKER, # noqa
-            'client_type': 'failure-publisher'
-        }
-        local_broker = load_plugin('pubsub', defs)
+        local_broker = get_publisher(DOCKER_BROKER, 'failure-publisher')
         # publish with qos=0
         success = local_broker.pub('wis2box/failure', json.dumps(message), qos=0) # noqa
         if not success:
@@ -131,13 +132,80 @@ class BaseAbstractData:
         :returns: `bool` of processing result
         """
 
+        prepared = self.prepare_process(input_data, filename)
+        if prepared is None:
+            raise NotImplementedError()
+
+        result = execute_api_process(*prepared)
+
+        return self.load_process_result(result, filename)
+
+    def prepare_process(self, input_data: Union[bytes, str],
+                        filename: str = '') -> Union[Tuple[str, dict], None]:
+        """
+        Prepare the wis2box-api process execution transforming data
+
+        Plugins transforming data with a wis2box-api process implement
+        this method and `load_process_result` instead of `transform`.
+
+        :param input_data: `bytes` or `str` of data payload
+        :param filename, to be used in case input_data is bytes
+
+        :returns: `tuple` of process name and payload, or `None` if the
+                  plugin does not transform data with wis2box-api
+        """
+
+        return None
+
+    def load_process_result(self, result: dict, filename: str = '') -> bool:
+        """
+        Load the output of the wis2box-api process transforming data
+
+        :param result: `dict` of process execution result
+        :param filename: `str` of input filename
+
+        :returns: `bool` of processing result
+        """
+
         raise NotImplementedError()
 
+    async def transform_async(self, input_data: Union[bytes, str],
+                              filename: str = '', session: Any = None,
+                              executor: Executor = None) -> bool:
+        """
+        Transform data without blocking the event loop
+
+        The wis2box-api process execution is awaited on the event loop;
+        preparing its payload and loading its result (e.g. base64
+        handling), as well as transforms of plugins not using wis2box-api,
+        run in the executor.
+
+        :param input_data: `bytes` or `str` of data payload
+        :param filename, to be used in case input_data is bytes
+        :param session: `aiohttp.ClientSession` to reuse (optional)
+        :param executor: `concurrent.futures.Executor` for blocking and
+                         CPU-heavy steps (default executor of the loop)
+
+        :returns: `bool` of processing result
+        """
+
+        prepared = await run_in_executor(executor, self.prepare_process,
+                                         input_data, filename)
+        if prepared is None:
+            return await run_in_executor(executor, self.transform,
+                                         input_data, filename)
+
+        result = await execute_api_process_async(*prepared, session=session)
+
+        return await run_in_executor(executor, self.load_process_result,
+                                     result, filename)
+
     def notify(self, identifier: str, storage_path: str,
                datetime_: str,
                geometry: dict = None,
                wigos_station_identifier: str = None,
-               is_update: bool = False) -> bool:
+               is_update: bool = False, data: bytes = None,
+               checksum: str = None) -> bool:
         """
         Send notification of data to broker
 
@@ -146,6 +214,10 @@ class BaseAbstractData:
         :param datetime_: `datetime` object of temporal aspect of data
         :param geometry: `dict` of GeoJSON geometry object
         :param wigos_station_identifier: WSI associated with the data
+        :param is_update: `bool` of whether the data replaces existing data
+        :param data: `bytes` of data written to storage (optional, saves
+                     reading it back from storage)
+        :param checksum: `str` of base64 SHA512 checksum of data
 
         :returns: `bool` of result
         """
@@ -162,15 +234,9 @@ class BaseAbstractData:
             f"{metadata_id.replace('urn:wmo:md:','')}/{identifier}",
             metadata_id, storage_path, datetime_, geometry,
             wigos_station_identifier, self.gts,
-            operation)
+            operation, data=data, checksum=checksum)
 
-        # load plugin for public broker
-        defs = {
-            'codepath': PLUGINS['pubsub']['mqtt']['plugin'],
-            'url': BROKER_PUBLIC,
-            'client_type': 'publisher'
-        }
-        broker = load_plugin('pubsub', defs)
+        broker = get_publisher(BROKER_PUBLIC, 'publisher')
 
         # publish using filename as identifier
         success = broker.pub(topic, wis_message.dumps())
@@ -180,14 +246,12 @@ class BaseAbstractData:
         else:
             LOGGER.info(f'WISNotificationMessage published for {identifier}')
 
-        # load plugin for local broker
-        defs_local = {
-            'codepath': PLUGINS['pubsub']['mqtt']['plugin'],
-            'url': DOCKER_BROKER, # noqa
-            'client_type': 'notify-publisher'
-        }
-        local_broker = load_plugin('pubsub', defs_local)
-        success = local_broker.pub('wis2box/notifications', wis_message.dumps(), qos=0) # noqa
+        # the internal notification also carries the incoming file it was
+        # published from, e.g. to measure pipeline latency
+        message = dict(wis_message.message,
+                       incoming_filepath=self.incoming_filepath)
+        local_broker = get_publisher(DOCKER_BROKER, 'notify-publisher')
+        success = local_broker.pub('wis2box/notifications', json.dumps(message, default=json_serial), qos=0) # noqa
         if not success:
             LOGGER.error('Failed to publish notification message on internal broker') # noqa
         return True
@@ -241,12 +305,16 @@ class BaseAbstractData:
                 data_bytes = self.as_bytes(the_data)
                 storage_path = f'{STORAGE_SOURCE}/{STORAGE_PUBLIC}/{rfp}/{identifier}.{format_}'  # noqa
 
+                checksum = generate_checksum(data_bytes)
+
                 is_update = False
                 is_new = True
                 # check if storage_path already exists
-                if exists(storage_path):
+                stat = stat_data(storage_path)
+                if stat is not None:
                     # if data exists, check if it is the same
-                    if data_bytes == get_data(storage_path):
+                    if self.is_same_data(data_bytes, checksum,
+                                         storage_path, stat):
                         LOGGER.error(f'Data already published for {identifier}-{format_}; not publishing')  # noqa
                         is_new = False
                     else:
@@ -254,7 +322,9 @@ class BaseAbstractData:
                         is_update = True
                 if is_new:
                     LOGGER.info(f'Writing data to {storage_path}')
-                    put_data(data_bytes, storage_path)
+                    with stage('storage'):
+                        put_data(data_bytes, storage_path,
+                                 metadata={CHECKSUM_METADATA_KEY: checksum})
 
                 if self.enable_notification and is_new:
                     LOGGER.debug('Sending notification to broker')
@@ -262,20 +332,56 @@ class BaseAbstractData:
                         datetime_ = item['_meta']['properties']['datetime']
                     except KeyError:
                         datetime_ = item['_meta'].get('data_date')
-                    self.notify(identifier, storage_path,
-                                datetime_,
-                                item['_meta'].get('geometry'), wsi, is_update)
+                    with stage('notify'):
+                        self.notify(identifier, storage_path,
+                                    datetime_,
+                                    item['_meta'].get('geometry'), wsi,
+                                    is_update, data=data_bytes,
+                                    checksum=checksum)
                 else:
                     LOGGER.debug('No notification sent')
         except Exception as err:
             msg = f'Failed to publish item {identifier}: {err}'
             LOGGER.error(msg)
+            self.errors.append(err)
             self.publish_failure_message(
                     description='Failed to publish item',
                     identifier=identifier,
                     wsi=wsi)
         return True
 
+    @staticmethod
+    def is_same_data(data_bytes: bytes, checksum: str,
+                     storage_path: str, stat: dict) -> bool:
+        """
+        Check whether data matches an already stored object
+
+        Objects written by wis2box carry their checksum as user metadata,
+        so the comparison only needs the object information.  Objects
+        stored before checksums were recorded fall back to the ETag (MD5
+        of single part uploads) and finally to fetching the object.
+
+        :param data_bytes: `bytes` of data to publish
+        :param checksum: `str` of base64 SHA512 checksum of data
+        :param storage_path: `str` of storage path of existing object
+        :param stat: `dict` of existing object information
+
+        :returns: `bool` of whether the stored object has the same content
+        """
+
+        stored_checksum = stat['metadata'].get(CHECKSUM_METADATA_KEY)
+        if stored_checksum is not None:
+            return stored_checksum == checksum
+
+        if stat.get('size') is not None and stat['size'] != len(data_bytes):
+            return False
+
+        etag = (stat.get('etag') or '').strip('"')
+        if etag and '-' not in etag:
+            return etag == hashlib.md5(data_bytes).hexdigest()
+
+        return data_bytes == get_data(storage_path)
+
     def validate_filename_pattern(
             self, filename: str) -> Union[re.Match, None]:
         """
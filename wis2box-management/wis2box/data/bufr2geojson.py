@@ -24,7 +24,7 @@ import base64
 import logging
 
 from pathlib import Path
-from typing import Union
+from typing import Tuple, Union
 
 from wis2box.api import execute_api_process
 from wis2box.data.geojson import ObservationDataGeoJSON
@@ -38,8 +38,16 @@ class ObservationDataBUFR2GeoJSON(ObservationDataGeoJSON):
     def transform(self, input_data: Union[Path, bytes],
                   filename: str = '') -> bool:
 
+        # converted by wis2box-api, not loaded as GeoJSON
+        process_name, payload = self.prepare_process(input_data, filename)
+        result = execute_api_process(process_name, payload)
+
+        return self.load_process_result(result, filename)
+
+    def prepare_process(self, input_data: Union[Path, bytes],
+                        filename: str = '') -> Tuple[str, dict]:
+
         LOGGER.debug('Procesing BUFR data')
-        process_name = 'bufr2geojson'
 
         # check if input_data is Path object
         if isinstance(input_data, Path):
@@ -56,7 +64,9 @@ class ObservationDataBUFR2GeoJSON(ObservationDataGeoJSON):
                 }
             }
 
-        result = execute_api_process(process_name, payload)
+        return 'bufr2geojson', payload
+
+    def load_process_result(self, result: dict, filename: str = '') -> bool:
 
         # check for errors
         if result.get('error') not in [None, '']:
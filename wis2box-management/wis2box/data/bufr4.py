@@ -24,9 +24,8 @@ import logging
 
 from datetime import datetime
 from pathlib import Path
-from typing import Union
+from typing import Tuple, Union
 
-from wis2box.api import execute_api_process
 from wis2box.data.base import BaseAbstractData
 
 LOGGER = logging.getLogger(__name__)
@@ -45,8 +44,8 @@ class ObservationDataBUFR(BaseAbstractData):
 
         super().__init__(defs)
 
-    def transform(self, input_data: Union[Path, bytes],
-                  filename: str = '') -> bool:
+    def prepare_process(self, input_data: Union[Path, bytes],
+                        filename: str = '') -> Tuple[str, dict]:
 
         LOGGER.debug('Processing BUFR4')
         data = self.as_string(input_data, base64_encode=True)
@@ -60,8 +59,9 @@ class ObservationDataBUFR(BaseAbstractData):
             }
         }
 
-        process_name = 'wis2box-bufr2bufr'
-        result = execute_api_process(process_name, payload)
+        return 'wis2box-bufr2bufr', payload
+
+    def load_process_result(self, result: dict, filename: str = '') -> bool:
 
         try:
             # check for errors
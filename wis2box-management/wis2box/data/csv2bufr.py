@@ -24,9 +24,8 @@ import logging
 
 from datetime import datetime
 from pathlib import Path
-from typing import Union
+from typing import Tuple, Union
 
-from wis2box.api import execute_api_process
 from wis2box.data.base import BaseAbstractData
 
 
@@ -46,8 +45,8 @@ class ObservationDataCSV2BUFR(BaseAbstractData):
 
         super().__init__(defs)
 
-    def transform(self, input_data: Union[Path, bytes],
-                  filename: str = '') -> bool:
+    def prepare_process(self, input_data: Union[Path, bytes],
+                        filename: str = '') -> Tuple[str, dict]:
 
         LOGGER.debug('Processing CSV data')
 
@@ -73,8 +72,9 @@ class ObservationDataCSV2BUFR(BaseAbstractData):
             }
         }
 
-        process_name = 'wis2box-csv2bufr'
-        result = execute_api_process(process_name, payload)
+        return 'wis2box-csv2bufr', payload
+
+    def load_process_result(self, result: dict, filename: str = '') -> bool:
 
         try:
             # check for errors
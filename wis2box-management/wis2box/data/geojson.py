@@ -24,7 +24,7 @@ import logging
 from pathlib import Path
 from typing import Union
 
-from wis2box.api import upsert_collection_item
+from wis2box.api import buffer_collection_item
 from wis2box.data.base import BaseAbstractData
 
 LOGGER = logging.getLogger(__name__)
@@ -65,7 +65,7 @@ class ObservationDataGeoJSON(BaseAbstractData):
                     continue
 
                 LOGGER.debug('Publishing data to API')
-                upsert_collection_item(self.metadata_id, the_data)
+                buffer_collection_item(self.metadata_id, the_data)
 
         return True
 
@@ -21,15 +21,180 @@
 
 import logging
 
-from typing import Any, Tuple
+from typing import Any, Tuple, Union
 
 from owslib.ogcapi.records import Records
 
 from wis2box.env import (DOCKER_BROKER, DOCKER_API_URL)
-from wis2box.plugin import load_plugin, PLUGINS
+from wis2box.plugin import get_plugin_class, load_plugin, PLUGINS
 
 LOGGER = logging.getLogger(__name__)
 
+# resolver of the data mappings last used, rebuilt when they change
+_RESOLVER = None
+
+
+class SubstringIndex:
+    """
+    Trie of keys supporting lookup of all keys contained in a string
+    """
+
+    def __init__(self, keys: list) -> None:
+        """
+        Initializer
+
+        :param keys: `list` of `str` keys, in order of priority
+
+        :returns: `None`
+        """
+
+        self.root = {}
+        for rank, key in enumerate(keys):
+            if not key:
+                continue
+            node = self.root
+            for char in key:
+                node = node.setdefault(char, {})
+            # keep the first rank of duplicate keys
+            node.setdefault(None, rank)
+
+    def find(self, text: str) -> list:
+        """
+        Find keys contained in a string
+
+        :param text: `str` to search
+
+        :returns: `list` of ranks of the keys found
+        """
+
+        ranks = []
+        root = self.root
+        for start in range(len(text)):
+            node = root.get(text[start])
+            position = start + 1
+            while node is not None:
+                if None in node:
+                    ranks.append(node[None])
+                if position == len(text):
+                    break
+                node = node.get(text[position])
+                position += 1
+
+        return ranks
+
+
+class DataMappingsResolver:
+    """
+    Precompiled lookup of datasets and GTS headers matching a path
+    """
+
+    def __init__(self, data_mappings: dict, gts_mappings: dict = None) -> None:
+        """
+        Initializer
+
+        :param data_mappings: `dict` of data mappings
+        :param gts_mappings: `dict` of GTS mappings
+
+        :returns: `None`
+        """
+
+        self.data_mappings = data_mappings
+        self.gts_mappings = gts_mappings
+
+        self.metadata_ids = list(data_mappings.keys())
+        self.topics = [v['topic_hierarchy'].replace('origin/a/wis2/', '')
+                       for v in data_mappings.values()]
+        self.gts_keys = list((gts_mappings or {}).keys())
+
+        self._metadata_ids = SubstringIndex(self.metadata_ids)
+        self._topics = SubstringIndex(self.topics)
+        self._gts = SubstringIndex(self.gts_keys)
+
+    def is_for(self, data_mappings: dict, gts_mappings: dict) -> bool:
+        """
+        Check whether the resolver was built from the given mappings
+
+        :param data_mappings: `dict` of data mappings
+        :param gts_mappings: `dict` of GTS mappings
+
+        :returns: `bool` of result
+        """
+
+        return (self.data_mappings is data_mappings and
+                self.gts_mappings is gts_mappings)
+
+    def match(self, path: str) -> Union[str, None]:
+        """
+        Match a path to a dataset
+
+        A metadata identifier contained in the path takes precedence
+        (the last one defined when several match), then the first topic
+        hierarchy contained in the path.
+
+        :param path: `str` of path
+
+        :returns: `str` of metadata identifier, or `None` if no match
+        """
+
+        ranks = self._metadata_ids.find(path)
+        if ranks:
+            return self.metadata_ids[max(ranks)]
+
+        ranks = self._topics.find(path)
+        if ranks:
+            return self.metadata_ids[min(ranks)]
+
+        return None
+
+    def match_gts(self, path: str) -> Union[dict, None]:
+        """
+        Match a path to the first GTS mapping key it contains
+
+        :param path: `str` of path
+
+        :returns: `dict` of GTS mapping, or `None` if no match
+        """
+
+        ranks = self._gts.find(path)
+        if ranks:
+            return self.gts_mappings[self.gts_keys[min(ranks)]]
+
+        return None
+
+    def options(self) -> list:
+        """
+        List the strings a path can contain to match a dataset
+
+        :returns: `list` of metadata identifiers and topic hierarchies
+        """
+
+        return self.metadata_ids + self.topics
+
+
+def get_resolver(data_mappings: dict,
+                 gts_mappings: dict = None) -> DataMappingsResolver:
+    """
+    Get the resolver for data mappings, building it when they change
+
+    Data mappings are replaced (not modified) when refreshed, so the
+    resolver is rebuilt only after a refresh.
+
+    :param data_mappings: `dict` of data mappings
+    :param gts_mappings: `dict` of GTS mappings
+
+    :returns: `wis2box.data_mappings.DataMappingsResolver` object
+    """
+
+    global _RESOLVER
+
+    resolver = _RESOLVER
+    if resolver is None or not resolver.is_for(data_mappings, gts_mappings):
+        LOGGER.debug('Building data mappings resolver')
+        resolver = DataMappingsResolver(data_mappings, gts_mappings)
+        _RESOLVER = resolver
+
+    return resolver
+
 
 def get_plugins(record: dict) -> list:
     """
@@ -123,25 +288,15 @@ def validate_and_load(path: str,
     LOGGER.debug(f'Validating path: {path}')
     LOGGER.debug(f'Data mappings {data_mappings}')
 
-    metadata_id = None
-    topic_hierarchy = None
-    # determine if path matches a metadata_id
-    for key in data_mappings.keys():
-        if key in path:
-            metadata_id = key
-            topic_hierarchy = data_mappings[key]['topic_hierarchy']
-    # else try to match topic_hierarchy
-    if metadata_id is None:
-        for key, value in data_mappings.items():
-            if (value['topic_hierarchy']).replace('origin/a/wis2/', '') in path:  # noqa
-                metadata_id = key
-                topic_hierarchy = value['topic_hierarchy']
-                break
+    resolver = get_resolver(data_mappings, gts_mappings)
+
+    # match a metadata_id, else a topic_hierarchy
+    metadata_id = resolver.match(path)
     if metadata_id is None:
-        options = [key for key in data_mappings.keys()] # noqa
-        options += [v['topic_hierarchy'].replace('origin/a/wis2/', '') for v in data_mappings.values()]  # noqa
+        options = resolver.options()
         msg = f'Could not match {path} to dataset, path should include one of the following: {options}'  # noqa
         raise ValueError(msg)
+    topic_hierarchy = data_mappings[metadata_id]['topic_hierarchy']
 
     if 'plugins' not in data_mappings[metadata_id]:
         msg = f'No plugins defined in data-mappings for metadata_id={metadata_id}' # noqa
@@ -165,7 +320,7 @@ def validate_and_load(path: str,
         notify = plugin.get('notify', False)
         data_defs = {
             'metadata_id': metadata_id,
-            'íncoming_filepath': path,
+            'incoming_filepath': path,
             'topic_hierarchy': topic_hierarchy,
             'codepath': plugin['plugin'],
             'pattern': plugin['file-pattern'],
@@ -175,14 +330,14 @@ def validate_and_load(path: str,
             'format': file_type
         }
         if notify and gts_mappings:
-            for key in gts_mappings.keys():
-                # check if string defined by key is contained in path
-                if key in path:
-                    data_defs['gts_ttaaii'] = gts_mappings[key]['ttaaii']
-                    data_defs['gts_cccc'] = gts_mappings[key]['cccc']
-                    break
+            gts = resolver.match_gts(path)
+            if gts is not None:
+                data_defs['gts_ttaaii'] = gts['ttaaii']
+                data_defs['gts_cccc'] = gts['cccc']
         return data_defs
 
-    plugins_ = [load_plugin('data', data_defs(p), data_mappings)
+    # codepaths come from the data mappings themselves, so the plugin
+    # classes can be instantiated without re-validating them
+    plugins_ = [get_plugin_class(p['plugin'])(data_defs(p))
                 for p in plugins[file_type]]
     return metadata_id, plugins_
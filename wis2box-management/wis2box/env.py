@@ -43,10 +43,41 @@ API_TYPE = os.environ.get('WIS2BOX_API_TYPE', 'pygeoapi')
 API_URL = os.environ.get('WIS2BOX_API_URL', 'http://localhost/oapi')
 API_BACKEND_TYPE = os.environ.get('WIS2BOX_API_BACKEND_TYPE', 'Elasticsearch')
 API_BACKEND_URL = os.environ.get('WIS2BOX_API_BACKEND_URL', 'http://elasticsearch:9200').rstrip('/') # noqa
+API_BACKEND_PARTITION = os.environ.get('WIS2BOX_API_BACKEND_PARTITION', 'none')  # noqa
 DOCKER_API_URL = os.environ.get('WIS2BOX_DOCKER_API_URL', 'http://wis2box-api:80') # noqa
 AUTH_URL = os.environ.get('WIS2BOX_AUTH_URL', 'http://wis2box-auth')
 URL = os.environ.get('WIS2BOX_URL', 'http://localhost')
 
+try:
+    API_PROCESS_SYNC_MAX_BYTES = int(os.environ.get('WIS2BOX_API_PROCESS_SYNC_MAX_BYTES', 1048576)) # noqa
+except (TypeError, ValueError):
+    API_PROCESS_SYNC_MAX_BYTES = 1048576
+
+try:
+    API_PROCESS_POLL_MAX = float(os.environ.get('WIS2BOX_API_PROCESS_POLL_MAX', 1)) # noqa
+except (TypeError, ValueError):
+    API_PROCESS_POLL_MAX = 1
+
+try:
+    API_BULK_MAX_ITEMS = int(os.environ.get('WIS2BOX_API_BULK_MAX_ITEMS', 500)) # noqa
+except (TypeError, ValueError):
+    API_BULK_MAX_ITEMS = 500
+
+try:
+    API_BULK_FLUSH_INTERVAL = float(os.environ.get('WIS2BOX_API_BULK_FLUSH_INTERVAL', 2)) # noqa
+except (TypeError, ValueError):
+    API_BULK_FLUSH_INTERVAL = 2
+
+try:
+    API_WRITE_QUEUE_MAX = int(os.environ.get('WIS2BOX_API_WRITE_QUEUE_MAX', 10000)) # noqa
+except (TypeError, ValueError):
+    API_WRITE_QUEUE_MAX = 10000
+
+try:
+    API_WRITE_QUEUE_TIMEOUT = float(os.environ.get('WIS2BOX_API_WRITE_QUEUE_TIMEOUT', 5)) # noqa
+except (TypeError, ValueError):
+    API_WRITE_QUEUE_TIMEOUT = 5
+
 BROKER_USERNAME = os.environ.get('WIS2BOX_BROKER_USERNAME', 'wis2box')
 BROKER_PASSWORD = os.environ.get('WIS2BOX_BROKER_PASSWORD', 'wis2box')
 BROKER_HOST = os.environ.get('WIS2BOX_BROKER_HOST', 'mosquitto')
@@ -54,6 +85,16 @@ BROKER_PORT = os.environ.get('WIS2BOX_BROKER_PORT', 1883)
 DOCKER_BROKER = f'mqtt://{BROKER_USERNAME}:{BROKER_PASSWORD}@{BROKER_HOST}:{BROKER_PORT}' # noqa
 BROKER_PUBLIC = os.environ.get('WIS2BOX_BROKER_PUBLIC', DOCKER_BROKER)
 
+try:
+    BROKER_INFLIGHT_MAX = int(os.environ.get('WIS2BOX_BROKER_INFLIGHT_MAX', 20)) # noqa
+except (TypeError, ValueError):
+    BROKER_INFLIGHT_MAX = 20
+
+try:
+    BROKER_PUBLISH_TIMEOUT = float(os.environ.get('WIS2BOX_BROKER_PUBLISH_TIMEOUT', 10)) # noqa
+except (TypeError, ValueError):
+    BROKER_PUBLISH_TIMEOUT = 10
+
 STORAGE_TYPE = os.environ.get('WIS2BOX_STORAGE_TYPE', 'S3')
 STORAGE_SOURCE = os.environ.get('WIS2BOX_STORAGE_SOURCE', 'http://minio:9000')
 STORAGE_USERNAME = os.environ.get('WIS2BOX_STORAGE_USERNAME', 'wis2box')
@@ -71,6 +112,42 @@ try:
 except TypeError:
     STORAGE_API_RETENTION_DAYS = None
 
+try:
+    SUBSCRIBER_WORKERS = int(os.environ.get('WIS2BOX_SUBSCRIBER_WORKERS', os.cpu_count())) # noqa
+except (TypeError, ValueError):
+    SUBSCRIBER_WORKERS = os.cpu_count()
+
+try:
+    SUBSCRIBER_QUEUE_MAX = int(os.environ.get('WIS2BOX_SUBSCRIBER_QUEUE_MAX', 100)) # noqa
+except (TypeError, ValueError):
+    SUBSCRIBER_QUEUE_MAX = 100
+
+try:
+    SUBSCRIBER_BATCH_MAX = int(os.environ.get('WIS2BOX_SUBSCRIBER_BATCH_MAX', 10)) # noqa
+except (TypeError, ValueError):
+    SUBSCRIBER_BATCH_MAX = 10
+
+try:
+    SUBSCRIBER_BATCH_WINDOW = float(os.environ.get('WIS2BOX_SUBSCRIBER_BATCH_WINDOW', 0.05)) # noqa
+except (TypeError, ValueError):
+    SUBSCRIBER_BATCH_WINDOW = 0.05
+
+SUBSCRIBER_MODE = os.environ.get('WIS2BOX_SUBSCRIBER_MODE', 'process')
+
+try:
+    SUBSCRIBER_TASKS_MAX = int(os.environ.get('WIS2BOX_SUBSCRIBER_TASKS_MAX', 256)) # noqa
+except (TypeError, ValueError):
+    SUBSCRIBER_TASKS_MAX = 256
+
+SUBSCRIBER_SHARE_GROUP = os.environ.get('WIS2BOX_SUBSCRIBER_SHARE_GROUP')
+SUBSCRIBER_SPOOL = os.environ.get('WIS2BOX_SUBSCRIBER_SPOOL')
+RETRY_STORE = os.environ.get('WIS2BOX_RETRY_STORE', str(DATADIR / 'spool' / 'retries.db'))  # noqa
+
+try:
+    METRICS_PORT = int(os.environ.get('WIS2BOX_METRICS_PORT', 8000)) # noqa
+except (TypeError, ValueError):
+    METRICS_PORT = 8000
+
 LOGLEVEL = os.environ.get('WIS2BOX_LOGGING_LOGLEVEL', 'ERROR')
 LOGFILE = os.environ.get('WIS2BOX_LOGGING_LOGFILE', 'stdout')
 
@@ -19,16 +19,18 @@
 #
 ###############################################################################
 
+from concurrent.futures import Executor
 import json
 import logging
 from pathlib import Path
+from typing import Any, Tuple
 
-from wis2box.api import upsert_collection_item
+from wis2box.api import buffer_collection_item, flush_collection_items
+from wis2box.api.buffer import BulkWriteError, item_owner
 from wis2box.storage import get_data
 from wis2box.data_mappings import validate_and_load
-
-from wis2box.plugin import load_plugin
-from wis2box.plugin import PLUGINS
+from wis2box.metrics import labels, plugin_name, stage
+from wis2box.util import run_in_executor
 
 from wis2box.env import (DOCKER_BROKER, STORAGE_PUBLIC)
 
@@ -42,6 +44,8 @@ class Handler:
         self.filepath = filepath
         self.plugins = ()
         self.input_bytes = None
+        # exception of the last failure to transform or publish
+        self.error = None
 
         LOGGER.debug('Detecting file type')
         if isinstance(self.filepath, Path):
@@ -71,6 +75,8 @@ class Handler:
                 raise ValueError(msg)
 
     def publish_failure_message(self, description, plugin=None):
+        from wis2box.pubsub.publisher import get_publisher
+
         message = {
             'filepath': self.filepath,
             'description': description
@@ -79,47 +85,176 @@ class Handler:
             cl = plugin.__class__
             message['plugin'] = f'{cl.__module__ }.{cl.__name__}'
         # handler uses local broker to publish success/failure messages
-        defs = {
-            'codepath': PLUGINS['pubsub']['mqtt']['plugin'],
-            'url': DOCKER_BROKER, # noqa
-            'client_type': 'handler-publisher'
-        }
-        local_broker = load_plugin('pubsub', defs)
+        local_broker = get_publisher(DOCKER_BROKER, 'handler-publisher')
         success = local_broker.pub('wis2box/handler', json.dumps(message), qos=0) # noqa
         if not success:
             msg = f'Failed to publish message: {message}'
             LOGGER.error(msg)
 
     def handle(self) -> bool:
-        for plugin in self.plugins:
-            if not plugin.accept_file(self.filepath):
-                msg = f'Filepath not accepted: {self.filepath} for class {plugin.__class__}' # noqa
-                LOGGER.debug(msg)
-                continue
-            try:
-                if self.input_bytes:
-                    plugin.transform(
-                        input_data=self.input_bytes,
-                        filename=self.filepath.split('/')[-1]
-                    )
-                else:
-                    plugin.transform(self.filepath)
-            except Exception as err:
-                msg = f'Failed to transform file {self.filepath} : {err}'
-                LOGGER.error(msg, exc_info=True)
-                self.publish_failure_message(
-                    description='Failed to transform file',
-                    plugin=plugin)
-                return False
-            try:
+        with labels(dataset=self.metadata_id), stage('handle'):
+            return self.publish_plugins(*self.transform_plugins())
+
+    async def handle_async(self, session: Any = None,
+                           executor: Executor = None) -> bool:
+        """
+        Handle the file without blocking the event loop
+
+        :param session: `aiohttp.ClientSession` for wis2box-api requests
+        :param executor: `concurrent.futures.Executor` for blocking and
+                         CPU-heavy steps (default executor of the loop)
+
+        :returns: `bool` of whether the file was transformed and published
+        """
+
+        with labels(dataset=self.metadata_id), stage('handle'):
+            transformed = await self.transform_plugins_async(session,
+                                                             executor)
+            # storage and broker clients are blocking
+            return await run_in_executor(executor, self.publish_plugins,
+                                         *transformed)
+
+    def transform_plugins(self) -> Tuple[list, bool]:
+        """
+        Transform the file with each plugin accepting it
+
+        Stops at the first plugin failing to transform the file.
+
+        :returns: `tuple` of `list` of transformed plugins and `bool`
+                  of whether all plugins transformed the file
+        """
+
+        transformed = []
+        with labels(dataset=self.metadata_id):
+            for plugin in self.plugins:
+                if not plugin.accept_file(self.filepath):
+                    msg = f'Filepath not accepted: {self.filepath} for class {plugin.__class__}' # noqa
+                    LOGGER.debug(msg)
+                    continue
+                with labels(plugin=plugin_name(plugin)):
+                    if not self._transform(plugin):
+                        return transformed, False
+                transformed.append(plugin)
+
+        return transformed, True
+
+    async def transform_plugins_async(
+            self, session: Any = None,
+            executor: Executor = None) -> Tuple[list, bool]:
+        """
+        Transform the file with each plugin accepting it, without
+        blocking the event loop
+
+        :param session: `aiohttp.ClientSession` for wis2box-api requests
+        :param executor: `concurrent.futures.Executor` for blocking and
+                         CPU-heavy steps (default executor of the loop)
+
+        :returns: `tuple` of `list` of transformed plugins and `bool`
+                  of whether all plugins transformed the file
+        """
+
+        transformed = []
+        with labels(dataset=self.metadata_id):
+            for plugin in self.plugins:
+                if not plugin.accept_file(self.filepath):
+                    msg = f'Filepath not accepted: {self.filepath} for class {plugin.__class__}' # noqa
+                    LOGGER.debug(msg)
+                    continue
+                with labels(plugin=plugin_name(plugin)):
+                    try:
+                        with stage('transform'):
+                            await plugin.transform_async(
+                                *self._transform_args(), session=session,
+                                executor=executor)
+                    except Exception as err:
+                        await run_in_executor(executor,
+                                              self._transform_failed,
+                                              plugin, err)
+                        return transformed, False
+                transformed.append(plugin)
+
+        return transformed, True
+
+    def publish_plugins(self, transformed: list,
+                        success: bool = True) -> bool:
+        """
+        Publish the output of transformed plugins
+
+        :param transformed: `list` of transformed plugins
+        :param success: `bool` of whether all plugins transformed the file
+
+        :returns: `bool` of whether the file was transformed and published
+        """
+
+        published = True
+        with labels(dataset=self.metadata_id), item_owner(self):
+            for plugin in transformed:
+                with labels(plugin=plugin_name(plugin)):
+                    if not self._publish(plugin):
+                        published = False
+                        break
+            # write the items of this file buffered for the API backend,
+            # so that failures count against this file
+            if not self._flush_items():
+                published = False
+
+        return published and success and self.error is None
+
+    def _transform_args(self) -> tuple:
+        if self.input_bytes:
+            return self.input_bytes, self.filepath.split('/')[-1]
+        else:
+            return self.filepath, ''
+
+    def _transform(self, plugin) -> bool:
+        try:
+            with stage('transform'):
+                plugin.transform(*self._transform_args())
+        except Exception as err:
+            self._transform_failed(plugin, err)
+            return False
+
+        return True
+
+    def _transform_failed(self, plugin, err: Exception) -> None:
+        self.error = err
+        msg = f'Failed to transform file {self.filepath} : {err}'
+        LOGGER.error(msg, exc_info=err)
+        self.publish_failure_message(
+            description='Failed to transform file',
+            plugin=plugin)
+
+    def _publish(self, plugin) -> bool:
+        try:
+            with stage('publish'):
                 plugin.publish()
-            except Exception as err:
-                msg = f'Failed to publish file {self.filepath}: {err}'
-                LOGGER.error(msg, exc_info=True)
-                self.publish_failure_message(
-                    description='Failed to publish file to api-backend',
-                    plugin=plugin)
-                return False
+        except Exception as err:
+            self.error = err
+            msg = f'Failed to publish file {self.filepath}: {err}'
+            LOGGER.error(msg, exc_info=True)
+            self.publish_failure_message(
+                description='Failed to publish file to api-backend',
+                plugin=plugin)
+            return False
+
+        errors = getattr(plugin, 'errors', None)
+        if errors:
+            # other items and plugins are still published; the file
+            # counts as failed
+            self.error = errors[-1]
+
+        return True
+
+    def _flush_items(self) -> bool:
+        try:
+            flush_collection_items(self)
+        except BulkWriteError as err:
+            self.error = err
+            msg = f'Failed to write items of file {self.filepath}: {err}'
+            LOGGER.error(msg)
+            self.publish_failure_message(
+                description='Failed to publish file to api-backend')
+            return False
 
         return True
 
@@ -127,11 +262,11 @@ class Handler:
         index_name = self.metadata_id
         if self.input_bytes:
             geojson = json.load(self.input_bytes)
-            upsert_collection_item(index_name, geojson)
+            buffer_collection_item(index_name, geojson)
         else:
             with Path(self.filepath).open() as fh1:
                 geojson = json.load(fh1)
-                upsert_collection_item(index_name, geojson)
+                buffer_collection_item(index_name, geojson)
 
         return True
 
@@ -40,8 +40,8 @@ from wis2box.data_mappings import refresh_data_mappings, get_plugins
 from wis2box.env import (API_URL, BROKER_PUBLIC, DOCKER_API_URL,
                          STORAGE_PUBLIC, STORAGE_SOURCE, URL)
 from wis2box.metadata.base import BaseMetadata
-from wis2box.plugin import load_plugin, PLUGINS
 from wis2box.pubsub.message import WISNotificationMessage
+from wis2box.pubsub.publisher import get_publisher
 from wis2box.storage import put_data, delete_data
 from wis2box.util import json_serial
 
@@ -169,13 +169,15 @@ class DiscoveryMetadata(BaseMetadata):
 
 
 def publish_broker_message(record: dict, storage_path: str,
-                           centre_id: str) -> str:
+                           centre_id: str, data: bytes = None) -> str:
     """
     Publish discovery metadata to broker
 
     :param record: `dict` of discovery metadata record
     :param storage_path: `str` of storage path/object id
     :param centre_id: centre acronym
+    :param data: `bytes` of record written to storage (optional, saves
+                 reading it back from storage)
 
     :returns: `str` of WIS message
     """
@@ -188,15 +190,10 @@ def publish_broker_message(record: dict, storage_path: str,
                                          metadata_id=None,
                                          filepath=storage_path,
                                          datetime_=datetime_,
-                                         geometry=record['geometry']).dumps()
+                                         geometry=record['geometry'],
+                                         data=data).dumps()
 
-    # load plugin for plugin-broker
-    defs = {
-        'codepath': PLUGINS['pubsub']['mqtt']['plugin'],
-        'url': BROKER_PUBLIC,
-        'client_type': 'publisher'
-    }
-    broker = load_plugin('pubsub', defs)
+    broker = get_publisher(BROKER_PUBLIC, 'publisher')
 
     success = broker.pub(topic, wis_message)
     if not success:
@@ -315,7 +312,7 @@ def publish_discovery_metadata(metadata: Union[dict, str]):
         centre_id = record['properties']['wmo:topicHierarchy'].split('/')[3]
         try:
             message = publish_broker_message(record, storage_path,
-                                             centre_id)
+                                             centre_id, data_bytes)
         except Exception as err:
             msg = 'Failed to publish discovery metadata to public broker'
             LOGGER.error(msg)
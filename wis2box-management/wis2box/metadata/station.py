@@ -37,7 +37,8 @@ from pyoscar import OSCARClient
 
 from wis2box import cli_helpers
 from wis2box.api import (
-    delete_collection_item, setup_collection, upsert_collection_item
+    delete_collection_item, setup_collection, upsert_collection_item,
+    upsert_collection_items
 )
 from wis2box.env import (API_BACKEND_URL, DOCKER_API_URL,
                          BROKER_HOST, BROKER_USERNAME, BROKER_PASSWORD,
@@ -123,6 +124,42 @@ def station():
     pass
 
 
+def _iter_stations(es: Elasticsearch, batch_size: int = 500) -> Iterator[dict]:  # noqa
+    """
+    Iterate over all stations in the backend
+
+    Pages are read from a point in time with `search_after`, so the cost
+    per page is constant and the listing is not limited by the index
+    `max_result_window`.
+
+    :param es: `Elasticsearch` client
+    :param batch_size: `int` of number of stations per page
+
+    :returns: generator of station features
+    """
+
+    pit = es.open_point_in_time(index='stations', keep_alive='1m')
+    pit_id = pit['id']
+    search_after = None
+    try:
+        while True:
+            kwargs = {}
+            if search_after is not None:
+                kwargs['search_after'] = search_after
+            res = es.search(query={'match_all': {}}, size=batch_size,
+                            pit={'id': pit_id, 'keep_alive': '1m'},
+                            sort=['_shard_doc'], **kwargs)
+            hits = res['hits']['hits']
+            if not hits:
+                break
+            pit_id = res.get('pit_id', pit_id)
+            search_after = hits[-1]['sort']
+            for hit in hits:
+                yield hit['_source']
+    finally:
+        es.close_point_in_time(id=pit_id)
+
+
 def load_stations() -> dict:
     """Load stations from API
 
@@ -133,21 +170,8 @@ def load_stations() -> dict:
 
     try:
         es = Elasticsearch(API_BACKEND_URL)
-        nbatch = 500  # TODO: make configurable
-        res = es.search(index='stations', query={'match_all': {}}, size=nbatch)
-        if len(res['hits']['hits']) == 0:
-            LOGGER.debug('No stations found')
-            return stations
-        for hit in res['hits']['hits']:
-            stations[hit['_source']['id']] = hit['_source']
-        while len(res['hits']['hits']) > 0:
-            res = es.search(
-                index='stations', query={'match_all': {}},
-                size=nbatch, from_=len(stations)) # noqa
-
-            for hit in res['hits']['hits']:
-                stations[hit['_source']['id']] = hit['_source']
-
+        for station in _iter_stations(es):
+            stations[station['id']] = station
     except Exception as err:
         LOGGER.error(f'Failed to load stations from backend: {err}')
 
@@ -156,6 +180,149 @@ def load_stations() -> dict:
     return stations
 
 
+class StationIndex:
+    """
+    In-process lookup of stations by WIGOS and traditional identifier
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializer
+
+        :returns: `None`
+        """
+
+        self.stations = {}
+        self.tsi = {}
+        self.loaded = False
+
+    def load(self) -> None:
+        """
+        Load all stations from the backend
+
+        :returns: `None`
+        """
+
+        self.stations = load_stations()
+        self._build_tsi()
+        # an empty index (no stations yet, or backend unavailable) is
+        # retried on the next lookup
+        self.loaded = len(self.stations) > 0
+
+    def refresh(self, station_list: list = None) -> None:
+        """
+        Refresh stations from the backend
+
+        :param station_list: `list` of WIGOS station identifiers that
+                             changed (default reloads all stations)
+
+        :returns: `None`
+        """
+
+        if not self.loaded:
+            # loaded in full on first lookup
+            return
+        if station_list is None:
+            self.load()
+            return
+
+        LOGGER.debug(f'Refreshing {len(station_list)} stations')
+        try:
+            es = Elasticsearch(API_BACKEND_URL)
+            res = es.mget(index='stations', ids=station_list)
+        except Exception as err:
+            LOGGER.error(f'Failed to refresh stations: {err}')
+            self.loaded = False
+            return
+
+        for doc in res['docs']:
+            if doc.get('found'):
+                self.stations[doc['_id']] = doc['_source']
+            else:
+                self.stations.pop(doc['_id'], None)
+        self._build_tsi()
+
+    def _build_tsi(self) -> None:
+        """
+        Build lookup of WIGOS identifiers by traditional identifier
+
+        :returns: `None`
+        """
+
+        self.tsi = {}
+        for wsi, station in self.stations.items():
+            tsi = station['properties'].get('traditional_station_identifier')
+            # keep the first station with a given traditional identifier
+            self.tsi.setdefault(tsi, wsi)
+
+    def get(self, wsi: str) -> Union[dict, None]:
+        """
+        Get a station by WIGOS identifier
+
+        :param wsi: `str` of WIGOS station identifier
+
+        :returns: `dict` of station feature or `None`
+        """
+
+        if not self.loaded:
+            self.load()
+
+        return self.stations.get(wsi)
+
+    def get_wsi(self, tsi: str) -> Union[str, None]:
+        """
+        Get the WIGOS identifier of a traditional identifier
+
+        :param tsi: `str` of traditional station identifier
+
+        :returns: `str` of WIGOS station identifier or `None`
+        """
+
+        if not self.loaded:
+            self.load()
+
+        return self.tsi.get(tsi)
+
+
+STATION_INDEX = StationIndex()
+
+
+def refresh_stations(station_list: list = None) -> None:
+    """
+    Refresh the in-process station index after stations changed
+
+    :param station_list: `list` of WIGOS station identifiers that
+                         changed (default reloads all stations)
+
+    :returns: `None`
+    """
+
+    STATION_INDEX.refresh(station_list)
+
+
+def publish_station_list(station_list: list) -> None:
+    """
+    Inform subscribers (e.g. mqtt-metrics-collector, station index
+    caches) of updated stations
+
+    :param station_list: `list` of WIGOS station identifiers
+
+    :returns: `None`
+    """
+
+    notify_msg = {
+        'station_list': station_list
+    }
+    # load plugin for local broker
+    defs_local = {
+        'codepath': PLUGINS['pubsub']['mqtt']['plugin'],
+        'url': f'mqtt://{BROKER_USERNAME}:{BROKER_PASSWORD}@{BROKER_HOST}:{BROKER_PORT}', # noqa
+        'client_type': 'station-publisher'
+    }
+    local_broker = load_plugin('pubsub', defs_local)
+    local_broker.pub('wis2box/stations', json.dumps(notify_msg), qos=0)
+
+
 def get_stations_csv(wsi: str = '') -> str:
     """Load stations into csv-string
 
@@ -269,6 +436,7 @@ def add_topic_hierarchy(new_topic: str, territory_name: str = None,
         LOGGER.error(msg)
         return
 
+    station_list = []
     stations = load_stations()
     for feature in stations.values():
         if wsi != 'any' and feature['properties']['wigos_station_identifier'] != wsi:  # noqa
@@ -290,6 +458,10 @@ def add_topic_hierarchy(new_topic: str, territory_name: str = None,
         except RuntimeError as err:
             LOGGER.debug(f'Station does not exist: {err}')
         upsert_collection_item('stations', feature)
+        station_list.append(feature['id'])
+
+    if station_list:
+        publish_station_list(station_list)
 
 
 def publish_from_csv(path: Path, new_topic: str = None) -> None:
@@ -319,22 +491,22 @@ def publish_from_csv(path: Path, new_topic: str = None) -> None:
             return
 
     oscar_baseurl = 'https://oscar.wmo.int/surface/#/search/station/stationReportDetails'  # noqa
+    codelists = get_wmdr_codelists()
 
     LOGGER.debug(f'Publishing station list from {path}')
-    station_list = []
+    features = {}
     with path.open() as fh:
         reader = csv.DictReader(fh)
 
         for row in reader:
             wigos_station_identifier = row['wigos_station_identifier']
-            station_list.append(wigos_station_identifier)
 
             topics = []
             topic2 = ''
             # check if station already exists, if so, get topics
             if wigos_station_identifier in stations:
                 feature = stations[wigos_station_identifier]
-                topics = feature['properties'].get('topics', [])
+                topics = list(feature['properties'].get('topics', []))
             # add new_topic if not already in topics
             if new_topic is not None:
                 topic2 = new_topic
@@ -379,8 +551,7 @@ def publish_from_csv(path: Path, new_topic: str = None) -> None:
                 }
             }
 
-            LOGGER.debug('Checking properties against WMDR code lists')
-            for key, values in get_wmdr_codelists().items():
+            for key, values in codelists.items():
                 column_value = feature['properties'][key]
                 if column_value not in values:
                     msg = f'Invalid value {column_value}'
@@ -392,26 +563,38 @@ def publish_from_csv(path: Path, new_topic: str = None) -> None:
                 LOGGER.debug('Adding z value to geometry')
                 feature['geometry']['coordinates'].append(station_elevation)
 
-            LOGGER.debug('Updating backend')
-            try:
-                delete_collection_item('stations', feature['id'])
-            except RuntimeError as err:
-                LOGGER.debug(f'Station does not exist: {err}')
-            upsert_collection_item('stations', feature)
+            features[wigos_station_identifier] = feature
 
+    # all rows are valid: write only new or changed stations
+    changed = [feature for wsi, feature in features.items()
+               if station_changed(feature, stations.get(wsi))]
+    LOGGER.info(f'Writing {len(changed)} new or changed stations of {len(features)}')  # noqa
+    upsert_collection_items('stations', changed)
+
+    station_list = list(features.keys())
     LOGGER.info(f'Updated station list: {station_list}')
-    # inform mqtt-metrics-collector
-    notify_msg = {
-        'station_list': station_list
-    }
-    # load plugin for local broker
-    defs_local = {
-        'codepath': PLUGINS['pubsub']['mqtt']['plugin'],
-        'url': f'mqtt://{BROKER_USERNAME}:{BROKER_PASSWORD}@{BROKER_HOST}:{BROKER_PORT}', # noqa
-        'client_type': 'station-publisher'
-    }
-    local_broker = load_plugin('pubsub', defs_local)
-    local_broker.pub('wis2box/stations', json.dumps(notify_msg), qos=0)
+    publish_station_list(station_list)
+
+
+def station_changed(feature: dict, existing: Union[dict, None]) -> bool:
+    """
+    Compare a station with its version in the backend
+
+    :param feature: `dict` of station feature
+    :param existing: `dict` of station feature in the backend, if any
+
+    :returns: `bool` of whether the station needs to be written
+    """
+
+    if existing is None:
+        return True
+
+    # the backend adds the feature id to the properties
+    properties = dict(existing['properties'])
+    properties.pop('id', None)
+
+    return (feature['geometry'] != existing.get('geometry') or
+            feature['properties'] != properties)
 
 
 def get_valid_wsi(wsi: str = '', tsi: str = '') -> Union[str, None]:
@@ -425,16 +608,11 @@ def get_valid_wsi(wsi: str = '', tsi: str = '') -> Union[str, None]:
     """
 
     LOGGER.info(f'Validating wsi={wsi}, tsi={tsi}')
-    stations = load_stations()
 
-    if wsi in stations:
+    if STATION_INDEX.get(wsi) is not None:
         return wsi
-    else:
-        for station in stations.values():
-            if station['properties']['traditional_station_identifier'] == tsi:
-                return station['properties']['wigos_station_identifier']
 
-    return None
+    return STATION_INDEX.get_wsi(tsi)
 
 
 def get_geometry(wsi: str = '') -> Union[dict, None]:
@@ -446,9 +624,9 @@ def get_geometry(wsi: str = '') -> Union[dict, None]:
     :returns: `dict`, of station geometry or `None`
     """
 
-    stations = load_stations()
-    if wsi in stations:
-        return stations[wsi]['geometry']
+    station = STATION_INDEX.get(wsi)
+    if station is not None:
+        return station['geometry']
 
     LOGGER.debug('No matching WSI')
     return None
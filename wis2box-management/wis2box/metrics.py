@@ -0,0 +1,237 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import multiprocessing as mp
+import os
+import queue
+from threading import Thread
+from time import perf_counter
+from typing import Any, Callable, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+LOGGER = logging.getLogger(__name__)
+
+# maximum number of samples waiting to be applied by the metrics server
+SAMPLES_MAX = 10000
+
+STAGE_SECONDS = Histogram(
+    'wis2box_stage_seconds',
+    'Seconds spent in a processing stage, by dataset and plugin',
+    ['stage', 'dataset', 'plugin'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+             60, float('inf')))
+
+STAGE_IN_FLIGHT = Gauge(
+    'wis2box_stage_in_flight',
+    'Tasks currently in a processing stage',
+    ['stage'])
+
+STAGE_ERRORS = Counter(
+    'wis2box_stage_errors_total',
+    'Errors raised in a processing stage, by dataset and plugin',
+    ['stage', 'dataset', 'plugin'])
+
+QUEUE_DEPTH = Gauge(
+    'wis2box_subscriber_queue_depth',
+    'Tasks waiting for a subscriber worker')
+
+WRITE_QUEUE_DEPTH = Gauge(
+    'wis2box_api_write_queue_depth',
+    'Items waiting to be written to the API backend')
+
+WRITE_QUEUE_DROPPED = Counter(
+    'wis2box_api_write_queue_dropped_total',
+    'Items dropped because the API write queue was full',
+    ['collection'])
+
+# dataset and plugin of the task being processed
+_LABELS = ContextVar('wis2box_metrics_labels', default=('none', 'none'))
+
+# samples sent by worker processes to the process serving metrics
+_SAMPLES = None
+_SERVER_PID = None
+
+# callables notified of stage timings in the process serving metrics
+_OBSERVERS = []
+
+
+def add_observer(observer: Callable[[str, str, str, float], None]) -> None:
+    """
+    Register a callable notified of every stage timing, e.g. to compute
+    exact percentiles in benchmarks
+
+    :param observer: callable taking stage, dataset, plugin and seconds
+
+    :returns: `None`
+    """
+
+    _OBSERVERS.append(observer)
+
+
+def plugin_name(plugin: Any) -> str:
+    """
+    Name of a plugin class, used as metrics label
+
+    :param plugin: plugin object
+
+    :returns: `str` of plugin module and class name
+    """
+
+    cl = plugin.__class__
+    return f'{cl.__module__}.{cl.__name__}'
+
+
+@contextmanager
+def labels(dataset: str = None, plugin: str = None) -> Iterator[None]:
+    """
+    Set the dataset and plugin labels of stages run within the context
+
+    :param dataset: `str` of dataset (metadata) identifier
+    :param plugin: `str` of plugin name
+
+    :returns: `None`
+    """
+
+    current_dataset, current_plugin = _LABELS.get()
+    token = _LABELS.set((dataset or current_dataset,
+                         plugin or current_plugin))
+    try:
+        yield
+    finally:
+        _LABELS.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a processing stage
+
+    Exceptions raised within the context are counted as stage errors
+    and re-raised.
+
+    :param name: `str` of stage name
+
+    :returns: `None`
+    """
+
+    dataset, plugin = _LABELS.get()
+    _record(('in_flight', name, 1))
+    start = perf_counter()
+    try:
+        yield
+    except Exception:
+        _record(('error', name, dataset, plugin))
+        raise
+    finally:
+        _record(('in_flight', name, -1))
+        _record(('time', name, dataset, plugin, perf_counter() - start))
+
+
+def _record(sample: tuple) -> None:
+    """
+    Record a sample, sending it to the metrics server from workers
+
+    Timing and error samples are dropped when the queue to the metrics
+    server is full; in-flight samples are always delivered.
+
+    :param sample: `tuple` of sample type and values
+
+    :returns: `None`
+    """
+
+    if _SAMPLES is not None and os.getpid() != _SERVER_PID:
+        if sample[0] == 'in_flight':
+            # a lost increment or decrement would offset the gauge for
+            # good, so these wait for the collector to catch up
+            _SAMPLES.put(sample)
+            return
+        try:
+            _SAMPLES.put_nowait(sample)
+        except queue.Full:
+            # timings must never hold up processing
+            pass
+    else:
+        _apply(sample)
+
+
+def _apply(sample: tuple) -> None:
+    """
+    Apply a sample to the metrics of this process
+
+    :param sample: `tuple` of sample type and values
+
+    :returns: `None`
+    """
+
+    type_, name = sample[:2]
+    if type_ == 'time':
+        STAGE_SECONDS.labels(name, sample[2], sample[3]).observe(sample[4])
+        for observer in _OBSERVERS:
+            observer(*sample[1:])
+    elif type_ == 'error':
+        STAGE_ERRORS.labels(name, sample[2], sample[3]).inc()
+    elif type_ == 'in_flight':
+        STAGE_IN_FLIGHT.labels(name).inc(sample[2])
+
+
+def _collect() -> None:
+    """
+    Apply samples sent by worker processes
+
+    :returns: `None`
+    """
+
+    while True:
+        sample = _SAMPLES.get()
+        try:
+            _apply(sample)
+        except Exception as err:
+            LOGGER.error(f'Failed to apply metrics sample: {err}')
+
+
+def start_metrics_server(port: int,
+                         queue_depth: Callable[[], float] = None) -> None:
+    """
+    Serve metrics of this process and of the worker processes it forks
+
+    Must be called before forking workers.
+
+    :param port: `int` of HTTP port
+    :param queue_depth: callable returning the number of queued tasks
+
+    :returns: `None`
+    """
+
+    global _SAMPLES, _SERVER_PID
+
+    LOGGER.info(f'Serving metrics on port {port}')
+    start_http_server(port)
+
+    _SAMPLES = mp.Queue(SAMPLES_MAX)
+    _SERVER_PID = os.getpid()
+    Thread(target=_collect, name='wis2box-metrics', daemon=True).start()
+
+    if queue_depth is not None:
+        QUEUE_DEPTH.set_function(queue_depth)
@@ -26,6 +26,9 @@ from typing import Any
 
 LOGGER = logging.getLogger(__name__)
 
+# plugin classes by codepath, imported once per process
+_CLASSES = {}
+
 PLUGINS = {
     'api_backend': {
         'Elasticsearch': {
@@ -110,6 +113,25 @@ def load_plugin(plugin_type: PluginTypes,
         LOGGER.exception(msg)
         raise InvalidPluginError(msg)
 
+    class_ = get_plugin_class(codepath)
+    plugin = class_(defs)
+
+    return plugin
+
+
+def get_plugin_class(codepath: str) -> type:
+    """
+    Get plugin class by codepath, importing it on first use
+
+    :param codepath: `str` of plugin codepath (package.module.Class)
+
+    :returns: plugin class
+    """
+
+    class_ = _CLASSES.get(codepath)
+    if class_ is not None:
+        return class_
+
     packagename, classname = codepath.rsplit('.', 1)
 
     LOGGER.debug(f'Package name: {packagename}')
@@ -117,9 +139,9 @@ def load_plugin(plugin_type: PluginTypes,
 
     module = importlib.import_module(packagename)
     class_ = getattr(module, classname)
-    plugin = class_(defs)
+    _CLASSES[codepath] = class_
 
-    return plugin
+    return class_
 
 
 class InvalidPluginError(Exception):
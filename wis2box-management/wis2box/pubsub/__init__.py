@@ -22,6 +22,7 @@
 import click
 import logging
 
+from wis2box.pubsub.retry import dead_letters
 from wis2box.pubsub.subscribe import subscribe
 
 LOGGER = logging.getLogger(__name__)
@@ -34,3 +35,4 @@ def pubsub():
 
 
 pubsub.add_command(subscribe)
+pubsub.add_command(dead_letters)
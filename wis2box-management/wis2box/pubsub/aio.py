@@ -0,0 +1,240 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
+import logging
+from threading import Event, Lock, Thread
+from typing import Any, Awaitable, Callable
+
+LOGGER = logging.getLogger(__name__)
+
+# maximum seconds a submit may block on a full queue, well below the
+# MQTT keepalive of the network loop calling it
+SUBMIT_WAIT = 5
+
+
+class AsyncPool:
+    """
+    Pool of tasks processed concurrently on an asyncio event loop
+
+    The loop runs in a thread of the subscriber process, next to the
+    MQTT network loop.  Up to ``tasks_max`` tasks are in flight at once,
+    waiting on wis2box-api without holding a thread each; blocking and
+    CPU-heavy steps run in ``executor``.  Offers the interface of
+    `wis2box.pubsub.pool.WorkerPool`.
+    """
+
+    def __init__(self, process: Callable[[Any], Awaitable],
+                 tasks_max: int = 256, queue_max: int = 100,
+                 executor_workers: int = None) -> None:
+        """
+        Initializer
+
+        :param process: coroutine function executed for each task
+        :param tasks_max: maximum number of tasks in flight
+        :param queue_max: maximum number of queued tasks
+        :param executor_workers: number of threads for blocking and
+                                 CPU-heavy steps (default as for
+                                 `concurrent.futures.ThreadPoolExecutor`)
+
+        :returns: `None`
+        """
+
+        self.process = process
+        self.tasks_max = tasks_max
+        self.queue_max = queue_max
+
+        self.executor = ThreadPoolExecutor(executor_workers,
+                                           thread_name_prefix='wis2box-aio')
+        # HTTP session of the loop, shared by all tasks
+        self.session = None
+
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._ready = Event()
+
+        # tasks waiting on the loop for a free slot in the queue
+        self._overflow = 0
+        self._overflow_lock = Lock()
+
+    def start(self) -> None:
+        """
+        Start the event loop and its consumers
+
+        :returns: `None`
+        """
+
+        LOGGER.info(f'Starting event loop (tasks_max={self.tasks_max}, queue_max={self.queue_max})')  # noqa
+        self._thread = Thread(target=self._run, name='wis2box-asyncio',
+                              daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self) -> None:
+        """
+        Event loop thread
+
+        :returns: `None`
+        """
+
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.set_default_executor(self.executor)
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self) -> None:
+        """
+        Run consumers until each has received a stop sentinel
+
+        :returns: `None`
+        """
+
+        import aiohttp
+
+        self._queue = asyncio.Queue(self.queue_max)
+        connector = aiohttp.TCPConnector(limit=self.tasks_max)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            self.session = session
+            consumers = [asyncio.create_task(self._consume())
+                         for _ in range(self.tasks_max)]
+            self._ready.set()
+            await asyncio.gather(*consumers)
+
+    async def _consume(self) -> None:
+        """
+        Process queued tasks until a stop sentinel
+
+        :returns: `None`
+        """
+
+        while True:
+            task = await self._queue.get()
+            if task is None:
+                return
+            try:
+                await self.process(task)
+            except Exception as err:
+                LOGGER.error(f'Failed to process task: {err}', exc_info=True)
+
+    def submit(self, task: Any, block: bool = False) -> None:
+        """
+        Queue a task for processing
+
+        When the queue is full the call blocks for up to `SUBMIT_WAIT`
+        seconds, applying back-pressure to the MQTT network loop as with
+        `wis2box.pubsub.pool.WorkerPool.submit`.  Tasks still not queued
+        by then wait on the loop and are queued in order as tasks
+        complete.
+
+        :param task: task definition
+        :param block: `bool` of whether to block until the task is
+                      queued (for callers other than the network loop)
+
+        :returns: `None`
+        """
+
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(task),
+                                                  self._loop)
+        if block:
+            future.result()
+            return
+
+        if self._overflow:
+            # queued behind the tasks already waiting
+            self._hold(future)
+            return
+
+        try:
+            future.result(SUBMIT_WAIT)
+        except concurrent.futures.TimeoutError:
+            LOGGER.warning(f'Work queue full ({self.queue_max} tasks); holding tasks in memory')  # noqa
+            self._hold(future)
+
+    def _hold(self, future: concurrent.futures.Future) -> None:
+        """
+        Count a task waiting on the loop until it is queued
+
+        :param future: `concurrent.futures.Future` of queueing the task
+
+        :returns: `None`
+        """
+
+        def release(_):
+            with self._overflow_lock:
+                self._overflow -= 1
+
+        with self._overflow_lock:
+            self._overflow += 1
+        future.add_done_callback(release)
+
+    def broadcast(self, event: str, payload: Any = None) -> None:
+        """
+        Send a control event to the tasks
+
+        Tasks run in the subscriber process, which applies control events
+        itself, so there is nothing to send.
+
+        :param event: `str` of event name
+        :param payload: event payload
+
+        :returns: `None`
+        """
+
+        LOGGER.debug(f'Control event {event} applied in process')
+
+    def qsize(self) -> int:
+        """
+        Approximate number of queued tasks
+
+        :returns: `int` of queue depth
+        """
+
+        if self._queue is None:
+            return 0
+
+        return self._queue.qsize() + self._overflow
+
+    def stop(self, timeout: float = 30) -> None:
+        """
+        Stop once queued tasks have been processed
+
+        :param timeout: seconds to wait for tasks in flight
+
+        :returns: `None`
+        """
+
+        LOGGER.info('Stopping event loop')
+        for _ in range(self.tasks_max):
+            asyncio.run_coroutine_threadsafe(self._queue.put(None),
+                                             self._loop)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            LOGGER.warning('Tasks still in flight after stopping')
+        self.executor.shutdown(wait=False)
+
+    def __repr__(self):
+        return f'<AsyncPool (tasks_max={self.tasks_max})>'
@@ -21,7 +21,7 @@
 
 from urllib.parse import urlparse
 import logging
-from typing import Any, Callable
+from typing import Any, Callable, Union
 
 LOGGER = logging.getLogger(__name__)
 
@@ -53,11 +53,11 @@ class BasePubSubClient:
 
         raise NotImplementedError()
 
-    def sub(self, topic: str) -> None:
+    def sub(self, topic: Union[str, list]) -> None:
         """
         Subscribe to a broker/topic
 
-        :param topic: `str` of topic
+        :param topic: `str` of topic, or `list` of topics
 
         :returns: `None`
         """
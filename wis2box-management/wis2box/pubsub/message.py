@@ -26,14 +26,16 @@ import json
 import hashlib
 import logging
 from pathlib import Path
+from typing import Iterator
 import uuid
 
 from owslib.ogcapi.records import Records
 
 from wis2box import __version__
+from wis2box.api import get_session
 from wis2box.util import json_serial
 from wis2box.env import DOCKER_API_URL, STORAGE_PUBLIC, URL, STORAGE_SOURCE
-from wis2box.storage import get_data
+from wis2box.storage import get_data_stream
 
 LOGGER = logging.getLogger(__name__)
 
@@ -43,6 +45,123 @@ class SecureHashAlgorithms(Enum):
     MD5 = 'md5'
 
 
+def generate_checksum(data: bytes, algorithm: str = 'sha512') -> str:
+    """
+    Generate a base64 encoded checksum of bytes
+
+    :param data: `bytes` of data
+    :param algorithm: secure hash algorithm (md5, sha512)
+
+    :returns: `str` of base64 encoded digest
+    """
+
+    sh = getattr(hashlib, algorithm)()
+    sh.update(data)
+    return base64.b64encode(sh.digest()).decode()
+
+
+# chunk size used to read data when computing checksums
+CHUNK_SIZE = 1048576
+
+# maximum size of data included inline in notification messages
+CONTENT_INLINE_MAX = 4096
+
+# discovery metadata records requested per page
+RECORDS_PAGE_SIZE = 500
+
+# has_auth flag of discovery metadata records by metadata_id, including
+# datasets without a record (flagged False); entries are invalidated by
+# wis2box/auth/refresh and dataset (un)publication events, see
+# clear_has_auth
+_HAS_AUTH = {}
+
+
+def has_auth(metadata_id: str) -> bool:
+    """
+    Check whether a dataset has access control, caching the result
+
+    Datasets without a discovery metadata record are cached as not
+    access controlled until the cache is cleared (see `clear_has_auth`).
+    Other errors are raised and not cached.
+
+    :param metadata_id: `str` of metadata identifier
+
+    :returns: `bool` of whether the dataset has access control
+    """
+
+    if metadata_id in _HAS_AUTH:
+        return _HAS_AUTH[metadata_id]
+
+    LOGGER.debug(f'Find metadata record with id={metadata_id}')
+    url = f'{DOCKER_API_URL}/collections/discovery-metadata/items/{metadata_id}'  # noqa
+    response = get_session().get(url, params={'f': 'json'})
+    if response.status_code == 404:
+        LOGGER.debug(f'No metadata record with id={metadata_id}')
+        _HAS_AUTH[metadata_id] = False
+        return False
+    response.raise_for_status()
+
+    record = response.json()
+    _HAS_AUTH[metadata_id] = bool(
+        record.get('wis2box', {}).get('has_auth'))
+
+    return _HAS_AUTH[metadata_id]
+
+
+def load_has_auth() -> None:
+    """
+    Fill the has_auth cache from all discovery metadata records, paging
+    through the collection
+
+    :returns: `None`
+    """
+
+    oar = Records(DOCKER_API_URL)
+    offset = 0
+    try:
+        while True:
+            records = oar.collection_items('discovery-metadata',
+                                           limit=RECORDS_PAGE_SIZE,
+                                           offset=offset)
+            features = records['features']
+            for record in features:
+                _HAS_AUTH[record['id']] = bool(
+                    record.get('wis2box', {}).get('has_auth'))
+
+            # the server may return fewer records than requested
+            offset += len(features)
+            if not features:
+                break
+            matched = records.get('numberMatched')
+            if matched is not None:
+                if offset >= matched:
+                    break
+            elif not any(link.get('rel') == 'next'
+                         for link in records.get('links', [])):
+                break
+    except Exception as err:
+        LOGGER.warning(f'Failed to load discovery metadata records: {err}')
+
+
+def clear_has_auth(metadata_id: str = None) -> None:
+    """
+    Invalidate the has_auth cache
+
+    Called by the subscriber on wis2box/auth/refresh messages and when a
+    dataset is published or unpublished.
+
+    :param metadata_id: `str` of metadata identifier
+                        (default clears all datasets)
+
+    :returns: `None`
+    """
+
+    if metadata_id is None:
+        _HAS_AUTH.clear()
+    else:
+        _HAS_AUTH.pop(metadata_id, None)
+
+
 DATA_OBJECT_MIMETYPES = {
     'bufr4': 'application/bufr',
     'grib2': 'application/grib2',
@@ -56,15 +175,24 @@ class PubSubMessage:
     """
 
     def __init__(self, type_: str, identifier: str, filepath: str,
-                 datetime_: datetime, geometry: dict = None) -> None:
+                 datetime_: datetime, geometry: dict = None,
+                 data: bytes = None, checksum: str = None,
+                 length: int = None) -> None:
         """
         Initializer
 
+        Checksum and length are computed from `data` when provided, or
+        taken from `checksum` and `length`; the file is only read when
+        neither is available (or to include small data inline).
+
         :param type_: message type
         :param identifier: identifier
         :param filepath: `Path` of file
         :param datetime_: `datetime` object of temporal aspect of data
         :param geometry: `dict` of GeoJSON geometry object
+        :param data: `bytes` of data (optional)
+        :param checksum: `str` of base64 SHA512 checksum of data (optional)
+        :param length: `int` of data length in bytes (optional)
 
         :returns: `wis2box.pubsub.message.PubSubMessage` message object
         """
@@ -80,16 +208,59 @@ class PubSubMessage:
             '%Y-%m-%dT%H:%M:%SZ'
         )
         self.checksum_type = SecureHashAlgorithms.SHA512.value
-        # needs to get bytes to calc checksum and get length
+        if data is not None:
+            self.length = len(data)
+            self.checksum_value = checksum or self._generate_checksum(
+                data, self.checksum_type)
+            if self.length < CONTENT_INLINE_MAX:
+                self.filebytes = data
+        elif (checksum is not None and length is not None and
+                length >= CONTENT_INLINE_MAX):
+            self.length = length
+            self.checksum_value = checksum
+        else:
+            # stream data to calc checksum and get length
+            self._read_file()
+        self.message = {}
+
+    def _read_file(self) -> None:
+        """
+        Read file from disk or storage to calc checksum and get length
+
+        :returns: `None`
+        """
+
+        LOGGER.debug(f'Reading {self.filepath} to compute checksum')
         if isinstance(self.filepath, Path):
             with self.filepath.open('rb') as fh:
-                self.filebytes = fh.read()
+                self._read_chunks(iter(lambda: fh.read(CHUNK_SIZE), b''))
         else:
-            self.filebytes = get_data(filepath)
-        self.length = len(self.filebytes)
-        self.checksum_value = self._generate_checksum(
-            self.filebytes, self.checksum_type)
-        self.message = {}
+            self._read_chunks(get_data_stream(self.filepath, CHUNK_SIZE))
+
+    def _read_chunks(self, chunks: Iterator[bytes]) -> None:
+        """
+        Compute checksum and length of data in a single pass
+
+        Only data small enough to be included inline in a message is
+        kept in memory.
+
+        :param chunks: iterator of `bytes` chunks
+
+        :returns: `None`
+        """
+
+        sh = getattr(hashlib, self.checksum_type)()
+        head = []
+        self.length = 0
+        for chunk in chunks:
+            sh.update(chunk)
+            self.length += len(chunk)
+            if self.length < CONTENT_INLINE_MAX:
+                head.append(chunk)
+
+        self.checksum_value = base64.b64encode(sh.digest()).decode()
+        if self.length < CONTENT_INLINE_MAX:
+            self.filebytes = b''.join(head)
 
     def prepare(self):
         """
@@ -121,19 +292,19 @@ class PubSubMessage:
         :returns: `tuple` of hexdigest and length
         """
 
-        sh = getattr(hashlib, algorithm)()
-        sh.update(bytes)
-        return base64.b64encode(sh.digest()).decode()
+        return generate_checksum(bytes, algorithm)
 
 
 class WISNotificationMessage(PubSubMessage):
     def __init__(self, identifier: str, metadata_id: str, filepath: str,
                  datetime_: str, geometry=None,
                  wigos_station_identifier=None, gts: dict = None,
-                 operation: str = 'create') -> None:
+                 operation: str = 'create', data: bytes = None,
+                 checksum: str = None, length: int = None) -> None:
 
         super().__init__('wis2-notification-message', identifier,
-                         filepath, datetime_, geometry)
+                         filepath, datetime_, geometry, data, checksum,
+                         length)
 
         data_id = f'{self.identifier}'
 
@@ -193,7 +364,7 @@ class WISNotificationMessage(PubSubMessage):
         if gts is not None:
             self.message['properties']['gts'] = gts
 
-        if self.length < 4096:
+        if self.length < CONTENT_INLINE_MAX:
             LOGGER.debug('Including data inline via properties.content')
             content_value = base64.b64encode(self.filebytes)
 
@@ -214,11 +385,8 @@ class WISNotificationMessage(PubSubMessage):
 
         # check if metadata record exists and has access control
         if metadata_id is not None:
-            LOGGER.debug(f'Find metadata record with id={metadata_id}')
             try:
-                oar = Records(DOCKER_API_URL)
-                record = oar.collection_item('discovery-metadata', metadata_id)
-                if record and record['wis2box'].get('has_auth'):
+                if has_auth(metadata_id):
                     LOGGER.debug('Updating message with access control')
                     for link in self.message['links']:
                         if link['href'] == public_file_url:
@@ -20,10 +20,11 @@
 ###############################################################################
 
 import logging
+import os
 import random
 
 from time import sleep
-from typing import Any, Callable
+from typing import Any, Callable, Union
 
 from paho.mqtt import client as mqtt_client
 
@@ -47,11 +48,18 @@ class MQTTPubSubClient(BasePubSubClient):
         self.test_status = 'unknown'
         self.type = 'mqtt'
         self._port = self.broker_url.port
-        self.client_id = f"wis2box-mqtt-{self.broker['client_type']}-{random.randint(0, 1000)}"  # noqa
+        self.client_id = f"wis2box-mqtt-{self.broker['client_type']}-{os.getpid()}-{random.randint(0, 1000)}"  # noqa
+        self.publish_timeout = self.broker.get('publish_timeout', 10)
+        self.persistent = False
 
         msg = f'Connecting to broker {self.broker} with id {self.client_id}'
         LOGGER.debug(msg)
-        self.conn = mqtt_client.Client(self.client_id)
+        if self.broker.get('protocol') == 'v5':
+            # required for shared subscriptions
+            self.conn = mqtt_client.Client(self.client_id,
+                                           protocol=mqtt_client.MQTTv5)
+        else:
+            self.conn = mqtt_client.Client(self.client_id)
 
         self.conn.enable_logger(logger=LOGGER)
 
@@ -75,54 +83,103 @@ class MQTTPubSubClient(BasePubSubClient):
             self.test_status = e
         LOGGER.debug('Connection initiated')
 
+    def start(self, inflight_max: int = 20, queue_max: int = 0) -> None:
+        """
+        Keep the connection open for repeated publishing
+
+        The network loop runs in a background thread which handles
+        acknowledgements and reconnects, instead of being started and
+        stopped around every message.
+
+        :param inflight_max: maximum number of QoS 1/2 messages awaiting
+                             acknowledgement
+        :param queue_max: maximum number of messages queued behind the
+                          in-flight window (0 for unlimited)
+
+        :returns: `None`
+        """
+
+        LOGGER.debug(f'Starting persistent network loop for {self.client_id}')  # noqa
+        self.conn.max_inflight_messages_set(inflight_max)
+        self.conn.max_queued_messages_set(queue_max)
+        self.conn.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.conn.loop_start()
+        self.persistent = True
+
+    def stop(self) -> None:
+        """
+        Close a persistent connection
+
+        :returns: `None`
+        """
+
+        if self.persistent:
+            self.conn.disconnect()
+            self.conn.loop_stop()
+            self.persistent = False
+
     def pub(self, topic: str, message: str, qos: int = 1) -> bool:
         """
         Publish a message to a broker/topic
 
         :param topic: `str` of topic
         :param message: `str` of message
+        :param qos: `int` of quality of service level
 
-        :returns: `bool` of publish result
+        :returns: `bool` of publish result (for QoS 1/2, whether the
+                  broker acknowledged the message)
         """
 
         LOGGER.debug(f'Publishing to broker {self.broker}')
         LOGGER.debug(f'Topic: {topic}')
         LOGGER.debug(f'Message: {message}')
 
-        self.conn.loop_start()
-        result = self.conn.publish(topic, message, qos)
-        self.conn.loop_stop()
+        if not self.persistent:
+            self.conn.loop_start()
 
-        # TODO: investigate implication
-        # result.wait_for_publish()
+        try:
+            result = self.conn.publish(topic, message, qos)
+            result.wait_for_publish(timeout=self.publish_timeout)
+            published = result.is_published()
+        except (RuntimeError, ValueError) as err:
+            LOGGER.warning(f'Publishing error: {err}')
+            return False
+        finally:
+            if not self.persistent:
+                self.conn.loop_stop()
 
-        if result.is_published:
-            return True
-        else:
-            msg = f'Publishing error code: {result[1]}'
+        if not published:
+            msg = f'Publishing timed out after {self.publish_timeout}s (rc={result.rc})'  # noqa
             LOGGER.warning(msg)
-            return False
 
-    def sub(self, topic: str) -> None:
+        return published
+
+    def sub(self, topic: Union[str, list]) -> None:
         """
         Subscribe to a broker/topic
 
-        :param topic: `str` of topic
+        :param topic: `str` of topic, or `list` of topics
 
         :returns: `None`
         """
 
-        def on_connect(client, userdata, flags, rc):
+        topics = [topic] if isinstance(topic, str) else topic
+
+        def on_connect(client, userdata, flags, rc, properties=None):
             if rc == 0:
                 LOGGER.debug(f'Connected to broker {self.broker}')
-                LOGGER.debug(f'Subscribing to topic {topic} ')
-                client.subscribe(topic, qos=1)
-                LOGGER.debug(f'Subscribed to topic {topic}')
+                for topic_ in topics:
+                    LOGGER.debug(f'Subscribing to topic {topic_} ')
+                    client.subscribe(topic_, qos=1)
+                    LOGGER.debug(f'Subscribed to topic {topic_}')
             else:
                 msg = 'Failed to connect to MQTT-broker:'
-                LOGGER.error(f'{msg} {mqtt_client.connack_string(rc)}')
+                if isinstance(rc, int):
+                    # MQTT v5 reason codes carry their own description
+                    rc = mqtt_client.connack_string(rc)
+                LOGGER.error(f'{msg} {rc}')
 
-        def on_disconnect(client, userdata, rc):
+        def on_disconnect(client, userdata, rc, properties=None):
             LOGGER.debug(f'Disconnected from {self.broker}')
 
         LOGGER.debug(f'Subscribing to broker {self.broker}, topic {topic}')
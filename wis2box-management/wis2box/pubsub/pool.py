@@ -0,0 +1,342 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+from collections import deque
+import logging
+import multiprocessing as mp
+import queue
+import signal
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# maximum seconds a submit may block on a full queue, well below the
+# MQTT keepalive of the network loop calling it
+SUBMIT_WAIT = 5
+
+
+class WorkerPool:
+    """
+    Pool of long-lived worker processes fed by a bounded work queue
+
+    Workers are forked once and then reused for every task, so imports,
+    data mappings and connection pools held at module or object level
+    survive from one task to the next.
+    """
+
+    def __init__(self, process: Callable[[Any], Any],
+                 control: Callable[[str, Any], None] = None,
+                 workers: int = None, queue_max: int = 100,
+                 process_batch: Callable[[list], Any] = None,
+                 batch_max: int = 1, batch_window: float = 0) -> None:
+        """
+        Initializer
+
+        :param process: callable executed in a worker for each task
+        :param control: callable executed in every worker for each
+                        broadcast control event
+        :param workers: number of worker processes
+                        (default is the number of CPUs)
+        :param queue_max: maximum number of queued tasks
+        :param process_batch: callable executed in a worker for a
+                              `list` of tasks (optional)
+        :param batch_max: maximum number of tasks per batch
+        :param batch_window: seconds a worker waits for further tasks
+                             to add to a batch
+
+        :returns: `None`
+        """
+
+        self.process = process
+        self.control = control
+        self.workers = workers or mp.cpu_count()
+        self.queue_max = queue_max
+        self.process_batch = process_batch
+        self.batch_max = batch_max
+        self.batch_window = batch_window
+
+        self._tasks = mp.Queue(maxsize=self.queue_max)
+        self._controls = []
+        self._processes = []
+        self._saturated = False
+
+        # tasks waiting for a free slot in the queue
+        self._overflow = deque()
+        self._overflow_lock = Lock()
+        self._overflowed = Event()
+        self._drainer = None
+
+    def start(self) -> None:
+        """
+        Start worker processes
+
+        :returns: `None`
+        """
+
+        LOGGER.info(f'Starting {self.workers} workers (queue_max={self.queue_max})')  # noqa
+        for index in range(self.workers):
+            self._controls.append(mp.Queue())
+            self._processes.append(None)
+            self._spawn(index)
+
+        self._drainer = Thread(target=self._drain, name='wis2box-overflow',
+                               daemon=True)
+        self._drainer.start()
+
+    def _spawn(self, index: int) -> None:
+        """
+        Start (or restart) worker at a given slot
+
+        :param index: `int` of worker slot
+
+        :returns: `None`
+        """
+
+        process = mp.Process(target=self._run, args=(index,),
+                             name=f'wis2box-worker-{index}', daemon=True)
+        process.start()
+        self._processes[index] = process
+
+    def _ensure_workers(self) -> None:
+        """
+        Restart any worker that died unexpectedly
+
+        :returns: `None`
+        """
+
+        for index, process in enumerate(self._processes):
+            if process is not None and not process.is_alive():
+                LOGGER.error(f'Worker {process.name} died (exitcode={process.exitcode}); restarting')  # noqa
+                self._spawn(index)
+
+    def _apply_controls(self, index: int) -> None:
+        """
+        Apply pending control events in a worker
+
+        :param index: `int` of worker slot
+
+        :returns: `None`
+        """
+
+        while True:
+            try:
+                event, payload = self._controls[index].get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.control(event, payload)
+            except Exception as err:
+                LOGGER.error(f'Failed to apply control event {event}: {err}')
+
+    def _run(self, index: int) -> None:
+        """
+        Worker main loop
+
+        :param index: `int` of worker slot
+
+        :returns: `None`
+        """
+
+        # interrupts are handled by the parent process
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                LOGGER.debug('Worker received stop sentinel')
+                break
+            self._apply_controls(index)
+            if self.process_batch is None or self.batch_max <= 1:
+                try:
+                    self.process(task)
+                except Exception as err:
+                    LOGGER.error(f'Worker failed to process task: {err}',
+                                 exc_info=True)
+                continue
+
+            tasks, stop = self._collect(task)
+            try:
+                self.process_batch(tasks)
+            except Exception as err:
+                LOGGER.error(f'Worker failed to process batch: {err}',
+                             exc_info=True)
+            if stop:
+                LOGGER.debug('Worker received stop sentinel')
+                break
+
+    def _collect(self, task: Any) -> Tuple[list, bool]:
+        """
+        Collect the tasks queued within the batch window
+
+        Other idle workers compete for the same tasks, so batches only
+        grow while all workers are busy.  A task arriving at an idle
+        queue is returned at once rather than held for the window.
+
+        :param task: first task of the batch
+
+        :returns: `tuple` of `list` of tasks and whether the stop
+                  sentinel was received
+        """
+
+        tasks = [task]
+        deadline = monotonic() + self.batch_window
+        while len(tasks) < self.batch_max:
+            try:
+                if len(tasks) == 1:
+                    task = self._tasks.get_nowait()
+                else:
+                    timeout = max(deadline - monotonic(), 0)
+                    task = self._tasks.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if task is None:
+                return tasks, True
+            tasks.append(task)
+
+        return tasks, False
+
+    def submit(self, task: Any, block: bool = False) -> None:
+        """
+        Queue a task for processing
+
+        When the queue is full the call blocks for up to `SUBMIT_WAIT`
+        seconds.  Called from the MQTT network loop, this delays the
+        acknowledgement of the incoming QoS 1 message so that the broker
+        slows down, without starving the keepalive of the connection.
+        Tasks still not queued by then are held in memory and passed on
+        in order as workers free slots.
+
+        :param task: picklable task definition
+        :param block: `bool` of whether to block until the task is
+                      queued (for callers other than the network loop)
+
+        :returns: `None`
+        """
+
+        self._ensure_workers()
+
+        if block:
+            while True:
+                try:
+                    self._tasks.put(task, timeout=SUBMIT_WAIT)
+                    return
+                except queue.Full:
+                    self._ensure_workers()
+
+        with self._overflow_lock:
+            if not self._overflow:
+                try:
+                    self._tasks.put_nowait(task)
+                    if self._saturated:
+                        LOGGER.info('Work queue accepting tasks again')
+                        self._saturated = False
+                    return
+                except queue.Full:
+                    pass
+
+                if not self._saturated:
+                    LOGGER.warning(f'Work queue full ({self.queue_max} tasks); applying back-pressure')  # noqa
+                    self._saturated = True
+                try:
+                    self._tasks.put(task, timeout=SUBMIT_WAIT)
+                    return
+                except queue.Full:
+                    LOGGER.warning('Work queue still full; holding tasks in memory')  # noqa
+
+            self._overflow.append(task)
+            self._overflowed.set()
+
+    def _drain(self) -> None:
+        """
+        Pass tasks held in memory to the queue, in order
+
+        :returns: `None`
+        """
+
+        while True:
+            self._overflowed.wait()
+            with self._overflow_lock:
+                if not self._overflow:
+                    self._overflowed.clear()
+                    continue
+                # left in place until queued, so that later tasks
+                # are held behind it
+                task = self._overflow[0]
+            while True:
+                try:
+                    self._tasks.put(task, timeout=SUBMIT_WAIT)
+                    break
+                except queue.Full:
+                    LOGGER.warning(f'Work queue full; {len(self._overflow)} tasks held in memory')  # noqa
+                    self._ensure_workers()
+            with self._overflow_lock:
+                self._overflow.popleft()
+
+    def broadcast(self, event: str, payload: Any = None) -> None:
+        """
+        Send a control event to every worker
+
+        Events are applied by each worker before its next task.
+
+        :param event: `str` of event name
+        :param payload: picklable event payload
+
+        :returns: `None`
+        """
+
+        for control in self._controls:
+            control.put((event, payload))
+
+    def qsize(self) -> int:
+        """
+        Approximate number of queued tasks
+
+        :returns: `int` of queue depth
+        """
+
+        try:
+            return self._tasks.qsize() + len(self._overflow)
+        except NotImplementedError:
+            return -1
+
+    def stop(self, timeout: float = 30) -> None:
+        """
+        Stop workers once queued tasks have been processed
+
+        :param timeout: seconds to wait for each worker
+
+        :returns: `None`
+        """
+
+        LOGGER.info('Stopping workers')
+        for _ in self._processes:
+            # queued behind any tasks held in memory
+            self.submit(None, block=not self._overflow)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                LOGGER.warning(f'Terminating worker {process.name}')
+                process.terminate()
+
+    def __repr__(self):
+        return f'<WorkerPool (workers={self.workers})>'
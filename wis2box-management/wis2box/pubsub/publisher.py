@@ -0,0 +1,84 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+import logging
+import os
+from threading import Lock
+from typing import Any
+
+from wis2box.env import BROKER_INFLIGHT_MAX, BROKER_PUBLISH_TIMEOUT
+from wis2box.plugin import load_plugin, PLUGINS
+
+LOGGER = logging.getLogger(__name__)
+
+# connected publishers by broker URL, shared by all calls in a process
+_PUBLISHERS = {}
+_PUBLISHERS_LOCK = Lock()
+
+
+def _reset_publishers() -> None:
+    """
+    Drop cached publishers (network loop threads and sockets do not
+    survive a fork)
+
+    :returns: `None`
+    """
+
+    global _PUBLISHERS_LOCK
+
+    _PUBLISHERS.clear()
+    _PUBLISHERS_LOCK = Lock()
+
+
+os.register_at_fork(after_in_child=_reset_publishers)
+
+
+def get_publisher(url: str, client_type: str = 'publisher') -> Any:
+    """
+    Get a connected publisher for a broker, creating it on first use
+
+    The publisher keeps its connection and network loop running, so
+    successive messages reuse the same MQTT session.
+
+    :param url: `str` of broker RFC1738 URL
+    :param client_type: `str` used in the client id on first connect
+
+    :returns: pubsub plugin object
+    """
+
+    publisher = _PUBLISHERS.get(url)
+    if publisher is not None:
+        return publisher
+
+    with _PUBLISHERS_LOCK:
+        publisher = _PUBLISHERS.get(url)
+        if publisher is None:
+            defs = {
+                'codepath': PLUGINS['pubsub']['mqtt']['plugin'],
+                'url': url,
+                'client_type': client_type,
+                'publish_timeout': BROKER_PUBLISH_TIMEOUT
+            }
+            publisher = load_plugin('pubsub', defs)
+            publisher.start(inflight_max=BROKER_INFLIGHT_MAX)
+            _PUBLISHERS[url] = publisher
+
+    return publisher
@@ -0,0 +1,446 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+import asyncio
+from datetime import datetime, timezone
+import logging
+import random
+import sqlite3
+from threading import Event, Thread
+from time import time
+from typing import Callable, Union
+
+import aiohttp
+import click
+from elasticsearch import ApiError, TransportError
+from minio.error import ServerError
+import requests
+from urllib3.exceptions import HTTPError
+
+from wis2box import cli_helpers
+from wis2box.api import APIProcessError
+from wis2box.api.buffer import BulkWriteError
+from wis2box.env import RETRY_STORE
+from wis2box.pubsub.spool import SQLiteStore
+
+LOGGER = logging.getLogger(__name__)
+
+# seconds between checks for files due to be retried
+RETRY_POLL = 1
+
+# maximum number of files submitted per check
+RETRY_BATCH = 10
+
+# seconds after which a file submitted for retry, but never reported
+# back (e.g. its worker died), is submitted again
+CLAIM_TIMEOUT = 900
+
+# HTTP status codes of transient errors
+RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+
+NETWORK_ERRORS = (ConnectionError, TimeoutError, asyncio.TimeoutError,
+                  requests.exceptions.ConnectionError,
+                  requests.exceptions.Timeout,
+                  aiohttp.ClientConnectionError, HTTPError)
+
+
+class RetryPolicy:
+    """Retry policy of a class of errors"""
+
+    def __init__(self, attempts: int, base_delay: float = 0,
+                 max_delay: float = 0) -> None:
+        """
+        Initializer
+
+        :param attempts: `int` of attempts before a file is dead-lettered
+                         (including the first one)
+        :param base_delay: `float` of seconds before the first retry
+        :param max_delay: `float` of maximum seconds between retries
+
+        :returns: `None`
+        """
+
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """
+        Seconds to wait before retrying after a failed attempt
+
+        The delay doubles with every attempt up to ``max_delay``, half
+        of it being random so that files failing together (e.g. during
+        an outage) are not all retried at once.
+
+        :param attempt: `int` of failed attempt (starting at 1)
+
+        :returns: `float` of seconds
+        """
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def __repr__(self):
+        return f'<RetryPolicy (attempts={self.attempts}, base_delay={self.base_delay}, max_delay={self.max_delay})>'  # noqa
+
+
+# retry policies by error class
+POLICIES = {
+    # connection failures and timeouts (wis2box-api, MinIO, brokers)
+    'network': RetryPolicy(attempts=10, base_delay=5, max_delay=600),
+    # wis2box-api overloaded or failing (HTTP 408, 429 and 5xx)
+    'api': RetryPolicy(attempts=6, base_delay=30, max_delay=1800),
+    # Elasticsearch unavailable or rejecting writes
+    'backend': RetryPolicy(attempts=8, base_delay=10, max_delay=900),
+    # MinIO server errors
+    'storage': RetryPolicy(attempts=8, base_delay=10, max_delay=900),
+    # invalid data or configuration: dead-lettered at once
+    'permanent': RetryPolicy(attempts=1)
+}
+
+
+def classify(err: Union[Exception, None]) -> str:
+    """
+    Classify the error of a failed file
+
+    :param err: exception raised when processing the file
+
+    :returns: `str` of error class (key of `POLICIES`)
+    """
+
+    if isinstance(err, APIProcessError):
+        return 'api' if err.status in RETRY_STATUS else 'permanent'
+    if isinstance(err, BulkWriteError):
+        return 'backend'
+    if isinstance(err, ApiError):
+        return 'backend' if err.status_code in RETRY_STATUS else 'permanent'
+    if isinstance(err, TransportError):
+        return 'backend'
+    if isinstance(err, ServerError):
+        return 'storage'
+    if isinstance(err, NETWORK_ERRORS):
+        return 'network'
+
+    return 'permanent'
+
+
+class RetryStore(SQLiteStore):
+    """
+    Store of files that failed to be processed
+
+    Files failing with a transient error are retried with exponential
+    backoff according to the policy of their error class, and kept as
+    dead letters once their attempts are exhausted (or at once for
+    permanent errors) until replayed.
+    """
+
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS retries ('
+              'filepath TEXT PRIMARY KEY, '
+              'attempts INTEGER NOT NULL, '
+              'error_class TEXT NOT NULL, '
+              'error TEXT NOT NULL, '
+              'due REAL, '
+              'created REAL NOT NULL, '
+              'updated REAL NOT NULL); '
+              'CREATE INDEX IF NOT EXISTS retries_due ON retries (due)')
+
+    def __init__(self, path: str) -> None:
+        """
+        Initializer
+
+        :param path: `Path` of SQLite database file
+
+        :returns: `None`
+        """
+
+        super().__init__(path)
+
+        self._stopped = Event()
+        self._scheduler = None
+
+    def fail(self, filepath: str, err: Union[Exception, None],
+             retried: bool = False) -> Union[float, None]:
+        """
+        Record a failure to process a file
+
+        :param filepath: `str` of file path
+        :param err: exception raised when processing the file
+        :param retried: `bool` of whether the file was being retried
+                        (a new failure otherwise restarts the attempts)
+
+        :returns: `float` of time of the next attempt, or `None` if the
+                  file was dead-lettered
+        """
+
+        error_class = classify(err)
+        policy = POLICIES[error_class]
+        now = time()
+
+        with self._get_lock():
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT attempts, created FROM retries WHERE filepath = ?',
+                (filepath,)).fetchone()
+            if row is not None and retried:
+                attempts, created = row[0] + 1, row[1]
+            else:
+                attempts, created = 1, now
+
+            if attempts >= policy.attempts:
+                due = None
+            else:
+                due = now + policy.delay(attempts)
+
+            conn.execute(
+                'INSERT OR REPLACE INTO retries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (filepath, attempts, error_class, str(err), due, created,
+                 now))
+
+        return due
+
+    def done(self, filepath: str) -> None:
+        """
+        Forget a file once processed, including any pending retry or
+        dead letter
+
+        :param filepath: `str` of file path
+
+        :returns: `None`
+        """
+
+        with self._get_lock():
+            self._connect().execute('DELETE FROM retries WHERE filepath = ?',
+                                    (filepath,))
+
+    def claim(self, limit: int = RETRY_BATCH) -> list:
+        """
+        Get files due to be retried
+
+        Claimed files are not returned again until ``CLAIM_TIMEOUT``
+        has elapsed without an outcome being recorded.
+
+        :param limit: `int` of maximum number of files
+
+        :returns: `list` of file paths
+        """
+
+        now = time()
+        with self._get_lock():
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute(
+                    'SELECT filepath FROM retries WHERE due <= ? '
+                    'ORDER BY due LIMIT ?', (now, limit)).fetchall()
+                conn.executemany(
+                    'UPDATE retries SET due = ? WHERE filepath = ?',
+                    [(now + CLAIM_TIMEOUT, row[0]) for row in rows])
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+        return [row[0] for row in rows]
+
+    def dead_letters(self, error_class: str = None) -> list:
+        """
+        Get dead-lettered files
+
+        :param error_class: `str` of error class (optional)
+
+        :returns: `list` of `dict`s of file path, error class, error,
+                  attempts and time of the last failure
+        """
+
+        query = ('SELECT filepath, error_class, error, attempts, updated '
+                 'FROM retries WHERE due IS NULL')
+        params = ()
+        if error_class is not None:
+            query += ' AND error_class = ?'
+            params = (error_class,)
+
+        with self._get_lock():
+            rows = self._connect().execute(
+                f'{query} ORDER BY updated', params).fetchall()
+
+        return [{
+            'filepath': filepath,
+            'error_class': error_class_,
+            'error': error,
+            'attempts': attempts,
+            'updated': datetime.fromtimestamp(updated, timezone.utc)
+        } for filepath, error_class_, error, attempts, updated in rows]
+
+    def pending(self) -> int:
+        """
+        Number of files waiting to be retried
+
+        :returns: `int` of files
+        """
+
+        with self._get_lock():
+            return self._connect().execute(
+                'SELECT COUNT(*) FROM retries WHERE due IS NOT NULL'
+            ).fetchone()[0]
+
+    def replay(self, filepaths: list = None, error_class: str = None) -> int:
+        """
+        Retry dead-lettered files
+
+        :param filepaths: `list` of file paths (default all files)
+        :param error_class: `str` of error class (optional)
+
+        :returns: `int` of files to be retried
+        """
+
+        query = 'UPDATE retries SET due = ?, attempts = 0 WHERE due IS NULL'
+        params = [time()]
+        if error_class is not None:
+            query += ' AND error_class = ?'
+            params.append(error_class)
+        if filepaths:
+            query += f" AND filepath IN ({', '.join('?' * len(filepaths))})"
+            params.extend(filepaths)
+
+        with self._get_lock():
+            return self._connect().execute(query, params).rowcount
+
+    def schedule(self, submit: Callable[[tuple], None],
+                 has_capacity: Callable[[], bool]) -> None:
+        """
+        Start a thread submitting files due to be retried
+
+        Files are submitted as ``('retry', filepath)`` tasks, a few at a
+        time and only while ``has_capacity`` returns `True`, so that
+        retries do not hold up new files.
+
+        :param submit: callable queueing a task for processing
+        :param has_capacity: callable returning whether tasks may be
+                             queued
+
+        :returns: `None`
+        """
+
+        pending = self.pending()
+        if pending:
+            LOGGER.info(f'{pending} files waiting to be retried in {self.path}')  # noqa
+
+        self._scheduler = Thread(target=self._schedule,
+                                 args=(submit, has_capacity),
+                                 name='wis2box-retry', daemon=True)
+        self._scheduler.start()
+
+    def _schedule(self, submit: Callable[[tuple], None],
+                  has_capacity: Callable[[], bool]) -> None:
+        """
+        Submit files due to be retried until stopped
+
+        :param submit: callable queueing a task for processing
+        :param has_capacity: callable returning whether tasks may be
+                             queued
+
+        :returns: `None`
+        """
+
+        while not self._stopped.wait(RETRY_POLL):
+            if not has_capacity():
+                continue
+            try:
+                filepaths = self.claim()
+            except sqlite3.Error as err:
+                LOGGER.error(f'Failed to read retries: {err}')
+                continue
+            for filepath in filepaths:
+                LOGGER.info(f'Retrying {filepath}')
+                submit(('retry', filepath))
+
+    def stop(self) -> None:
+        """
+        Stop submitting files
+
+        :returns: `None`
+        """
+
+        self._stopped.set()
+
+    def __repr__(self):
+        return f'<RetryStore ({self.path})>'
+
+
+def get_retry_store() -> RetryStore:
+    """
+    Open the retry store of the subscriber
+
+    :returns: `wis2box.pubsub.retry.RetryStore` object
+    """
+
+    if not RETRY_STORE:
+        raise click.ClickException('Retries are disabled (WIS2BOX_RETRY_STORE is empty)')  # noqa
+
+    return RetryStore(RETRY_STORE)
+
+
+@click.group()
+def dead_letters():
+    """Files that failed to be processed"""
+    pass
+
+
+@click.command(name='list')
+@click.pass_context
+@click.option('--error-class', '-e', type=click.Choice(list(POLICIES)),
+              help='Only list files failing with this class of errors')
+@cli_helpers.OPTION_VERBOSITY
+def list_(ctx, error_class, verbosity):
+    """List dead-lettered files"""
+
+    store = get_retry_store()
+    entries = store.dead_letters(error_class)
+    for entry in entries:
+        click.echo(f"{entry['updated'].isoformat(timespec='seconds')} "
+                   f"{entry['error_class']} (attempts={entry['attempts']}) "
+                   f"{entry['filepath']}: {entry['error']}")
+
+    click.echo(f'{len(entries)} dead-lettered file(s), '
+               f'{store.pending()} file(s) waiting to be retried')
+
+
+@click.command()
+@click.pass_context
+@click.argument('filepath', nargs=-1)
+@click.option('--error-class', '-e', type=click.Choice(list(POLICIES)),
+              help='Only replay files failing with this class of errors')
+@click.option('--all', '-a', 'all_', default=False, is_flag=True,
+              help='Replay all dead-lettered files')
+@cli_helpers.OPTION_VERBOSITY
+def replay(ctx, filepath, error_class, all_, verbosity):
+    """Retry dead-lettered files"""
+
+    if not filepath and error_class is None and not all_:
+        raise click.ClickException('Specify file paths, --error-class or --all')  # noqa
+
+    count = get_retry_store().replay(list(filepath), error_class)
+
+    click.echo(f'{count} file(s) queued for retry by the subscriber')
+
+
+dead_letters.add_command(list_)
+dead_letters.add_command(replay)
@@ -0,0 +1,252 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+from threading import Event, Lock, Thread
+from time import time
+from typing import Callable, Union
+
+LOGGER = logging.getLogger(__name__)
+
+# number of events read from the journal at a time
+FEED_BATCH = 100
+
+
+class SQLiteStore:
+    """
+    SQLite database (in WAL mode) shared by the subscriber and its
+    forked workers
+    """
+
+    # statement creating the tables of the store
+    SCHEMA = None
+
+    def __init__(self, path: Union[Path, str]) -> None:
+        """
+        Initializer
+
+        :param path: `Path` of SQLite database file
+
+        :returns: `None`
+        """
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = None
+        self._pid = None
+        self._lock = Lock()
+        self._lock_pid = os.getpid()
+
+        with self._get_lock():
+            self._connect().executescript(self.SCHEMA)
+
+    def _get_lock(self) -> Lock:
+        """
+        Get the lock of the current process
+
+        A lock inherited by a forked worker may be held by a thread of
+        the parent, so workers use a lock of their own.
+
+        :returns: `threading.Lock` object
+        """
+
+        if self._lock_pid != os.getpid():
+            self._lock = Lock()
+            self._lock_pid = os.getpid()
+
+        return self._lock
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Get the database connection of the current process
+        (lock must be held)
+
+        Connections are not shared with forked workers, which open
+        their own.
+
+        :returns: `sqlite3.Connection` object
+        """
+
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # durable across process crashes, without an fsync per event
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._pid = os.getpid()
+
+        return self._conn
+
+
+class EventSpool(SQLiteStore):
+    """
+    On-disk journal of tasks between the broker and the worker pool
+
+    Tasks are written to a SQLite database (in WAL mode) before the
+    incoming message is acknowledged, and removed once a worker has
+    processed them.  Tasks left in the journal when the subscriber
+    stops or dies are processed again on the next start.
+    """
+
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS events ('
+              'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+              'task TEXT NOT NULL, '
+              'created REAL NOT NULL)')
+
+    def __init__(self, path: Union[Path, str]) -> None:
+        """
+        Initializer
+
+        :param path: `Path` of SQLite database file
+
+        :returns: `None`
+        """
+
+        super().__init__(path)
+
+        self._added = Event()
+        self._stopped = Event()
+        self._feeder = None
+
+    def add(self, task: tuple) -> int:
+        """
+        Journal a task
+
+        :param task: `tuple` of task type and JSON serializable payload
+
+        :returns: `int` of event identifier
+        """
+
+        with self._get_lock():
+            cursor = self._connect().execute(
+                'INSERT INTO events (task, created) VALUES (?, ?)',
+                (json.dumps(task), time()))
+            event_id = cursor.lastrowid
+
+        self._added.set()
+
+        return event_id
+
+    def done(self, event_id: int) -> None:
+        """
+        Remove a processed task from the journal
+
+        :param event_id: `int` of event identifier
+
+        :returns: `None`
+        """
+
+        with self._get_lock():
+            self._connect().execute('DELETE FROM events WHERE id = ?',
+                                    (event_id,))
+
+    def pending(self, after: int = 0, limit: int = FEED_BATCH) -> list:
+        """
+        Get journaled tasks
+
+        :param after: `int` of event identifier to start after
+        :param limit: `int` of maximum number of tasks
+
+        :returns: `list` of (event identifier, task) `tuple`s
+        """
+
+        with self._get_lock():
+            rows = self._connect().execute(
+                'SELECT id, task FROM events WHERE id > ? '
+                'ORDER BY id LIMIT ?', (after, limit)).fetchall()
+
+        return [(event_id, tuple(json.loads(task))) for event_id, task in rows]
+
+    def size(self) -> int:
+        """
+        Number of journaled tasks
+
+        :returns: `int` of tasks in the journal
+        """
+
+        with self._get_lock():
+            return self._connect().execute(
+                'SELECT COUNT(*) FROM events').fetchone()[0]
+
+    def feed(self, submit: Callable[[tuple], None]) -> None:
+        """
+        Start a thread passing journaled tasks to a worker pool
+
+        Tasks are submitted in journal order with their event identifier
+        appended, starting with those left over from a previous run.
+        Submitting may block when the pool is busy; new tasks keep being
+        journaled in the meantime.
+
+        :param submit: callable queueing a task for processing
+
+        :returns: `None`
+        """
+
+        leftover = self.size()
+        if leftover:
+            LOGGER.info(f'Resuming {leftover} tasks from {self.path}')
+
+        self._feeder = Thread(target=self._feed, args=(submit,),
+                              name='wis2box-spool', daemon=True)
+        self._feeder.start()
+
+    def _feed(self, submit: Callable[[tuple], None]) -> None:
+        """
+        Pass journaled tasks to a worker pool until stopped
+
+        :param submit: callable queueing a task for processing
+
+        :returns: `None`
+        """
+
+        last_id = 0
+        while not self._stopped.is_set():
+            self._added.clear()
+            try:
+                events = self.pending(after=last_id)
+            except sqlite3.Error as err:
+                LOGGER.error(f'Failed to read spool: {err}')
+                events = []
+            if not events:
+                self._added.wait(1)
+                continue
+            for event_id, task in events:
+                submit(task + (event_id,))
+                last_id = event_id
+
+    def stop(self) -> None:
+        """
+        Stop passing tasks to the worker pool
+
+        :returns: `None`
+        """
+
+        self._stopped.set()
+        self._added.set()
+
+    def __repr__(self):
+        return f'<EventSpool ({self.path})>'
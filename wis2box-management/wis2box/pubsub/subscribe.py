@@ -20,30 +20,44 @@
 ###############################################################################
 
 import base64
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
-import multiprocessing as mp
-
-from time import sleep
+from threading import Event
+from time import time
 
 import click
 
 from wis2box import cli_helpers
 import wis2box.data as data_
 
-from wis2box.api import (setup_collection, upsert_collection_item,
+from wis2box.api import (setup_collection, queue_collection_item,
                          delete_collection_item, remove_collection)
+from wis2box.api.buffer import get_buffer
 
 from wis2box.data_mappings import get_data_mappings
 from wis2box.data.message import MessageData
 
-from wis2box.env import (DATADIR, DOCKER_BROKER,
-                         STORAGE_SOURCE, STORAGE_INCOMING)
+from wis2box.env import (DATADIR, DOCKER_BROKER, METRICS_PORT,
+                         STORAGE_SOURCE, STORAGE_INCOMING,
+                         SUBSCRIBER_WORKERS, SUBSCRIBER_QUEUE_MAX,
+                         SUBSCRIBER_BATCH_MAX, SUBSCRIBER_BATCH_WINDOW,
+                         SUBSCRIBER_MODE, SUBSCRIBER_TASKS_MAX,
+                         SUBSCRIBER_SHARE_GROUP, SUBSCRIBER_SPOOL,
+                         RETRY_STORE)
 from wis2box.handler import Handler, NotHandledError
+from wis2box.metrics import (labels, plugin_name, stage,
+                             start_metrics_server)
 import wis2box.metadata.discovery as discovery_metadata
+from wis2box.metadata.station import refresh_stations
 from wis2box.plugin import load_plugin, PLUGINS
-from wis2box.pubsub.message import gcm
+from wis2box.pubsub.aio import AsyncPool
+from wis2box.pubsub.message import clear_has_auth, gcm, load_has_auth
+from wis2box.pubsub.pool import WorkerPool
+from wis2box.pubsub.retry import RetryStore
+from wis2box.pubsub.spool import EventSpool
 from wis2box.storage import put_data
+from wis2box.util import run_in_executor
 
 LOGGER = logging.getLogger(__name__)
 
@@ -70,35 +84,425 @@ def get_gts_mappings():
     return gts_mappings
 
 
+# topics processed by a single subscriber when clustered
+WORK_TOPICS = [
+    'wis2box/notifications',
+    'wis2box/storage',
+    'wis2box/cap/publication',
+    'wis2box/data/publication',
+    'wis2box/dataset/publication',
+    'wis2box/dataset/unpublication/#'
+]
+
+# topics applied by every subscriber
+CONTROL_TOPICS = [
+    'wis2box/data_mappings/refresh',
+    'wis2box/auth/refresh',
+    'wis2box/stations'
+]
+
+
+def get_topics(share_group: str = None) -> list:
+    """
+    Get the topics to subscribe to
+
+    :param share_group: `str` of MQTT v5 shared subscription group
+                        (default subscribes to all topics)
+
+    :returns: `list` of topic filters
+    """
+
+    if share_group is None:
+        return ['wis2box/#']
+
+    topics = [f'$share/{share_group}/{topic}' for topic in WORK_TOPICS]
+    return topics + CONTROL_TOPICS
+
+
 class WIS2BoxSubscriber:
 
-    def __init__(self, broker):
+    def __init__(self, broker, workers: int = SUBSCRIBER_WORKERS,
+                 queue_max: int = SUBSCRIBER_QUEUE_MAX,
+                 batch_max: int = SUBSCRIBER_BATCH_MAX,
+                 batch_window: float = SUBSCRIBER_BATCH_WINDOW,
+                 metrics_port: int = METRICS_PORT,
+                 share_group: str = SUBSCRIBER_SHARE_GROUP,
+                 spool: str = SUBSCRIBER_SPOOL,
+                 mode: str = SUBSCRIBER_MODE,
+                 tasks_max: int = SUBSCRIBER_TASKS_MAX,
+                 retry_store: str = RETRY_STORE):
         self.data_mappings = get_data_mappings()
         self.gts_mappings = get_gts_mappings()
+        # pre-warm access control flags of datasets
+        load_has_auth()
         self.broker = broker
+        self.share_group = share_group
+        self.spool = None
+        if spool:
+            LOGGER.info(f'Journaling tasks in {spool}')
+            self.spool = EventSpool(spool)
+        self.retries = None
+        if retry_store:
+            LOGGER.info(f'Recording failed files in {retry_store}')
+            self.retries = RetryStore(retry_store)
+        # thread pool of each worker, created on first batch
+        self.executor = None
+        self.batch_max = batch_max
+        if mode == 'asyncio':
+            # tasks run on an event loop in this process, using the
+            # pool's threads for blocking and CPU-heavy steps
+            self.pool = AsyncPool(self.process_task_async,
+                                  tasks_max=tasks_max, queue_max=queue_max,
+                                  executor_workers=workers)
+        else:
+            if mode != 'process':
+                LOGGER.warning(f'Unknown subscriber mode {mode}; using worker processes')  # noqa
+            # workers are forked with the mappings loaded above
+            self.pool = WorkerPool(self.process_task, self.process_control,
+                                   workers=workers, queue_max=queue_max,
+                                   process_batch=self.process_batch,
+                                   batch_max=batch_max,
+                                   batch_window=batch_window)
+        if metrics_port:
+            start_metrics_server(metrics_port, queue_depth=self.pool.qsize)
+        self.pool.start()
+        if self.spool is not None:
+            # also resumes tasks left over from a previous run; the
+            # journal holds bursts on disk while the pool is busy
+            self.spool.feed(lambda task: self.pool.submit(task, block=True))
+        if self.retries is not None:
+            # retries only take up the free half of the queue
+            self.retries.schedule(
+                self.submit, lambda: self.pool.qsize() < queue_max // 2)
         self.broker.bind('on_message', self.on_message_handler)
-        self.broker.sub('wis2box/#')
+        try:
+            self.broker.sub(get_topics(self.share_group))
+        finally:
+            if self.retries is not None:
+                self.retries.stop()
+            if self.spool is not None:
+                self.spool.stop()
+            self.pool.stop()
+
+    def process_task(self, task: tuple) -> None:
+        """
+        Process a task in a worker
+
+        :param task: `tuple` of task type and payload, followed by the
+                     event identifier for journaled tasks
+
+        :returns: `None`
+        """
+
+        type_, payload = task[:2]
+        try:
+            if type_ in ['storage', 'retry']:
+                self.handle(payload, retried=type_ == 'retry')
+            elif type_ == 'publish':
+                self.handle_publish(payload)
+            else:
+                LOGGER.error(f'Unknown task type: {type_}')
+        finally:
+            self.task_done(task)
+
+    async def process_task_async(self, task: tuple) -> None:
+        """
+        Process a task on the event loop (asyncio mode)
+
+        :param task: `tuple` of task type and payload, followed by the
+                     event identifier for journaled tasks
+
+        :returns: `None`
+        """
+
+        executor = self.pool.executor
+        type_, payload = task[:2]
+        try:
+            if type_ in ['storage', 'retry']:
+                # the handler reads the file from storage
+                handler = await run_in_executor(executor, self.load_handler,
+                                                payload)
+                if handler is not None:
+                    result = await handler.handle_async(self.pool.session,
+                                                        executor)
+                    await run_in_executor(executor, self.report, handler,
+                                          result, type_ == 'retry')
+                elif type_ == 'retry':
+                    await run_in_executor(executor, self.forget, payload)
+            elif type_ == 'publish':
+                await run_in_executor(executor, self.handle_publish, payload)
+            else:
+                LOGGER.error(f'Unknown task type: {type_}')
+        except Exception as err:
+            LOGGER.error(f'handle() error: {err}', exc_info=True)
+        finally:
+            await run_in_executor(executor, self.task_done, task)
+
+    def task_done(self, task: tuple) -> None:
+        """
+        Mark a task as processed
+
+        :param task: `tuple` of task type and payload
+
+        :returns: `None`
+        """
+
+        if len(task) > 2:
+            self.spool.done(task[2])
+
+    def process_batch(self, tasks: list) -> None:
+        """
+        Process a batch of tasks in a worker
+
+        Files of the same dataset and plugins are transformed
+        concurrently, so that their requests to wis2box-api overlap, and
+        then published one by one in the order received.
+
+        :param tasks: `list` of tasks
+
+        :returns: `None`
+        """
+
+        groups = {}
+        for task in tasks:
+            if task[0] not in ['storage', 'retry']:
+                self.process_task(task)
+                continue
+            try:
+                handler = self.load_handler(task[1])
+            except Exception as err:
+                LOGGER.error(f'handle() error: {err}', exc_info=True)
+                handler = None
+            if handler is None:
+                if task[0] == 'retry':
+                    self.forget(task[1])
+                self.task_done(task)
+                continue
+            key = (handler.metadata_id,
+                   tuple(plugin_name(plugin) for plugin in handler.plugins))
+            groups.setdefault(key, []).append((task, handler))
+
+        for (metadata_id, plugins), group in groups.items():
+            if len(group) > 1:
+                LOGGER.debug(f'Transforming {len(group)} files of {metadata_id} concurrently')  # noqa
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.batch_max)
+            # each file publishes once the file before it has
+            turns = [Event() for _ in range(len(group) + 1)]
+            turns[0].set()
+            results = self.executor.map(self.handle_in_turn, group,
+                                        turns, turns[1:])
+            for (task, handler), result in zip(group, results):
+                try:
+                    self.report(handler, result, task[0] == 'retry')
+                except Exception as err:
+                    LOGGER.error(f'handle() error: {err}', exc_info=True)
+                finally:
+                    self.task_done(task)
+
+    @staticmethod
+    def handle_in_turn(item: tuple, turn: Event, next_turn: Event) -> bool:
+        """
+        Handle a file of a batch, publishing it in turn
+
+        :param item: `tuple` of task and `wis2box.handler.Handler`
+        :param turn: `threading.Event` set once the file may be published
+        :param next_turn: `threading.Event` set once the file is done
+
+        :returns: `bool` of whether the file was transformed and published
+        """
+
+        handler = item[1]
+        try:
+            with labels(dataset=handler.metadata_id), stage('handle'):
+                transformed = handler.transform_plugins()
+                turn.wait()
+                return handler.publish_plugins(*transformed)
+        except Exception as err:
+            LOGGER.error(f'handle() error: {err}', exc_info=True)
+            return False
+        finally:
+            turn.wait()
+            next_turn.set()
+
+    def submit(self, task: tuple) -> None:
+        """
+        Queue a task for the workers
+
+        With a spool, the task is journaled before the incoming message
+        is acknowledged, and passed on to the workers from the journal.
+
+        :param task: `tuple` of task type and payload
+
+        :returns: `None`
+        """
+
+        if self.spool is not None:
+            self.spool.add(task)
+        else:
+            self.pool.submit(task)
+
+    def process_control(self, event: str, payload) -> None:
+        """
+        Apply a control event in a worker
+
+        :param event: `str` of event name
+        :param payload: event payload
+
+        :returns: `None`
+        """
+
+        if event == 'data_mappings':
+            LOGGER.debug('Updating data mappings in worker')
+            self.data_mappings = payload
+            # collections may have been added or removed
+            get_buffer().invalidate()
+        elif event == 'has_auth':
+            LOGGER.debug('Invalidating access control flags in worker')
+            clear_has_auth(payload)
+        elif event == 'stations':
+            LOGGER.debug('Refreshing station index in worker')
+            refresh_stations(payload)
+        else:
+            LOGGER.warning(f'Unknown control event: {event}')
+
+    def refresh_data_mappings(self) -> None:
+        """
+        Reload data mappings and share them with the workers
+
+        :returns: `None`
+        """
+
+        self.data_mappings = get_data_mappings()
+        LOGGER.info(f'Data mappings: {self.data_mappings}')
+        # collections may have been added or removed
+        get_buffer().invalidate()
+        self.pool.broadcast('data_mappings', self.data_mappings)
+
+    def refresh_has_auth(self, metadata_id: str = None) -> None:
+        """
+        Invalidate cached access control flags here and in the workers
+
+        :param metadata_id: `str` of metadata identifier
+                            (default invalidates all datasets)
+
+        :returns: `None`
+        """
+
+        clear_has_auth(metadata_id)
+        self.pool.broadcast('has_auth', metadata_id)
+
+    def refresh_stations(self, station_list: list = None) -> None:
+        """
+        Refresh cached stations here and in the workers
+
+        :param station_list: `list` of WIGOS station identifiers that
+                             changed (default reloads all stations)
+
+        :returns: `None`
+        """
+
+        refresh_stations(station_list)
+        self.pool.broadcast('stations', station_list)
+
+    def refresh_dataset(self, metadata_id: str = None) -> None:
+        """
+        Refresh data mappings and access control flags after a dataset
+        was (un)published
+
+        When clustered, every subscriber is asked to refresh through the
+        broadcast control topics.
+
+        :param metadata_id: `str` of metadata identifier
+                            (default refreshes all datasets)
+
+        :returns: `None`
+        """
+
+        if self.share_group is None:
+            self.refresh_data_mappings()
+            self.refresh_has_auth(metadata_id)
+            return
+
+        from wis2box.pubsub.publisher import get_publisher
+
+        publisher = get_publisher(DOCKER_BROKER, 'subscriber-publisher')
+        publisher.pub('wis2box/data_mappings/refresh', json.dumps({}))
+        publisher.pub('wis2box/auth/refresh',
+                      json.dumps({'metadata_id': metadata_id}))
+
+    def load_handler(self, filepath: str):
+        """
+        Load the handler of a file
+
+        :param filepath: `str` of file path
+
+        :returns: `wis2box.handler.Handler` or `None` if the file is not
+                  handled
+        """
 
-    def handle(self, filepath):
         try:
             LOGGER.info(f'Processing {filepath}')
-            # load handler
-            handler = Handler(filepath=filepath,
-                              data_mappings=self.data_mappings,
-                              gts_mappings=self.gts_mappings)
-            if handler.handle():
-                LOGGER.debug('Data processed')
-                for plugin in handler.plugins:
-                    for filepath in plugin.files():
-                        LOGGER.debug(f'Public filepath: {filepath}')
+            return Handler(filepath=filepath,
+                           data_mappings=self.data_mappings,
+                           gts_mappings=self.gts_mappings)
         except NotHandledError as err:
             msg = f'not handled: {err}'
             LOGGER.info(msg)
         except ValueError as err:
             LOGGER.error(err)
-        except Exception as err:
-            msg = f'handle() error: {err}'
-            raise err
+
+        return None
+
+    def report(self, handler, result: bool, retried: bool = False) -> None:
+        """
+        Log the outcome of handling a file, and record failed files to
+        be retried
+
+        :param handler: `wis2box.handler.Handler`
+        :param result: `bool` of handling result
+        :param retried: `bool` of whether the file was being retried
+
+        :returns: `None`
+        """
+
+        if result:
+            LOGGER.debug('Data processed')
+            for plugin in handler.plugins:
+                for filepath in plugin.files():
+                    LOGGER.debug(f'Public filepath: {filepath}')
+            # also clears earlier failures of the file, e.g. when it was
+            # uploaded again rather than replayed
+            self.forget(handler.filepath)
+            return
+
+        if self.retries is None:
+            return
+
+        due = self.retries.fail(handler.filepath, handler.error, retried)
+        if due is None:
+            LOGGER.error(f'Giving up on {handler.filepath}; see wis2box pubsub dead-letters list')  # noqa
+        else:
+            LOGGER.warning(f'Retrying {handler.filepath} in {due - time():.0f}s')  # noqa
+
+    def forget(self, filepath: str) -> None:
+        """
+        Stop retrying a file
+
+        :param filepath: `str` of file path
+
+        :returns: `None`
+        """
+
+        if self.retries is not None:
+            self.retries.done(filepath)
+
+    def handle(self, filepath, retried: bool = False):
+        handler = self.load_handler(filepath)
+        if handler is not None:
+            self.report(handler, handler.handle(), retried)
+        elif retried:
+            self.forget(filepath)
 
     def handle_publish(self, message, publisher='wis2box'):
         LOGGER.debug('Loading MessageData plugin to publish data from message') # noqa
@@ -144,8 +548,11 @@ class WIS2BoxSubscriber:
         LOGGER.info(f'Incoming message on topic {topic}')
         if topic == 'wis2box/notifications':
             LOGGER.info(f'Notification: {message}')
-            # store notification in messages collection
-            upsert_collection_item('messages', message)
+            # internal to wis2box, not part of the WIS2 notification
+            message.pop('incoming_filepath', None)
+            # store notification in messages collection, in bulk and
+            # without holding up the network thread
+            queue_collection_item('messages', message)
         elif (topic == 'wis2box/storage' and
               message.get('EventName', '') in ['s3:ObjectCreated:Put', 's3:ObjectCreated:CompleteMultipartUpload']): # noqa
             LOGGER.debug('Storing data')
@@ -155,10 +562,8 @@ class WIS2BoxSubscriber:
                 LOGGER.info(f'Do not process directories: {key}')
                 return
             filepath = f'{STORAGE_SOURCE}/{key}'
-            # start a new process to handle the received data
-            while len(mp.active_children()) == mp.cpu_count():
-                sleep(0.05)
-            mp.Process(target=self.handle, args=(filepath,)).start()
+            # queue the received data for the worker pool
+            self.submit(('storage', filepath))
         elif topic == 'wis2box/cap/publication':
             LOGGER.debug('Publishing data received by cap-editor')
             # get filename and data from message and store in incoming-data
@@ -181,17 +586,16 @@ class WIS2BoxSubscriber:
             put_data(data_bytes, path)
         elif topic == 'wis2box/data/publication':
             LOGGER.debug('Publishing data')
-            self.handle_publish(message)
+            self.submit(('publish', message))
         elif topic == 'wis2box/data_mappings/refresh':
             LOGGER.info('Refreshing data mappings')
-            self.data_mappings = get_data_mappings()
-            LOGGER.info(f'Data mappings: {self.data_mappings}')
+            self.refresh_data_mappings()
         elif topic == 'wis2box/dataset/publication':
             LOGGER.debug('Publishing dataset')
             metadata = message
             discovery_metadata.publish_discovery_metadata(metadata)
             data_.add_collection_data(metadata)
-            self.data_mappings = get_data_mappings()
+            self.refresh_dataset()
         elif topic.startswith('wis2box/dataset/unpublication'):
             LOGGER.debug('Unpublishing dataset')
             identifier = topic.split('/')[-1]
@@ -199,7 +603,13 @@ class WIS2BoxSubscriber:
             if message.get('force', False):
                 LOGGER.info('Deleting data')
                 remove_collection(identifier)
-            self.data_mappings = get_data_mappings()
+            self.refresh_dataset(identifier)
+        elif topic == 'wis2box/auth/refresh':
+            LOGGER.info('Refreshing access control flags')
+            self.refresh_has_auth(message.get('metadata_id'))
+        elif topic == 'wis2box/stations':
+            LOGGER.info('Refreshing stations')
+            self.refresh_stations(message.get('station_list'))
         else:
             LOGGER.debug('Ignoring message')
 
@@ -217,6 +627,9 @@ def subscribe(ctx, verbosity):
         'url': DOCKER_BROKER,  # noqa
         'client_type': 'subscriber'
     }
+    if SUBSCRIBER_SHARE_GROUP is not None:
+        click.echo(f'Sharing work with subscribers in group {SUBSCRIBER_SHARE_GROUP}')  # noqa
+        defs['protocol'] = 'v5'
 
     broker = load_plugin('pubsub', defs)
 
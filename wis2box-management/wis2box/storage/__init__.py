@@ -20,7 +20,9 @@
 ###############################################################################
 
 import logging
-from typing import Any
+import os
+from threading import Lock
+from typing import Any, BinaryIO, Iterable, Iterator, Tuple, Union
 
 from wis2box.env import (STORAGE_TYPE, STORAGE_SOURCE,
                          STORAGE_USERNAME, STORAGE_PASSWORD)
@@ -28,6 +30,76 @@ from wis2box.plugin import load_plugin, PLUGINS
 
 LOGGER = logging.getLogger(__name__)
 
+# user metadata key holding the base64 SHA512 checksum of stored objects
+CHECKSUM_METADATA_KEY = 'wis2box-sha512'
+
+# storage clients by bucket name, shared by all calls in a process
+_STORAGES = {}
+_STORAGES_LOCK = Lock()
+
+
+def _reset_storages() -> None:
+    """
+    Drop cached storage clients (connection pools must not be shared
+    across a fork)
+
+    :returns: `None`
+    """
+
+    global _STORAGES_LOCK
+
+    _STORAGES.clear()
+    _STORAGES_LOCK = Lock()
+
+
+os.register_at_fork(after_in_child=_reset_storages)
+
+
+def get_storage(name: str) -> Any:
+    """
+    Get storage client for a bucket, creating it on first use
+
+    :param name: `str` of bucket name
+
+    :returns: storage plugin object
+    """
+
+    storage = _STORAGES.get(name)
+    if storage is not None:
+        return storage
+
+    with _STORAGES_LOCK:
+        storage = _STORAGES.get(name)
+        if storage is None:
+            defs = {
+                'storage_type': STORAGE_TYPE,
+                'source': STORAGE_SOURCE,
+                'name': name,
+                'auth': {'username': STORAGE_USERNAME,
+                         'password': STORAGE_PASSWORD},
+                'codepath': PLUGINS['storage'][STORAGE_TYPE]['plugin']
+            }
+            LOGGER.debug(f'Connecting to storage: {name}')
+            storage = load_plugin('storage', defs)
+            _STORAGES[name] = storage
+
+    return storage
+
+
+def _resolve(path: str) -> Tuple[Any, str]:
+    """
+    Resolve a storage path into a storage client and object identifier
+
+    :param path: path of object/file
+
+    :returns: `tuple` of storage plugin object and identifier
+    """
+
+    storage_path = path.replace(f'{STORAGE_SOURCE}/', '')
+    name = storage_path.split('/')[0]
+
+    return get_storage(name), storage_path.replace(name, '')
+
 
 def exists(path: str) -> bool:
     """
@@ -38,24 +110,24 @@ def exists(path: str) -> bool:
     :returns: `bool` of result
     """
     LOGGER.debug(f'exists: {path}')
-    storage_path = path.replace(f'{STORAGE_SOURCE}/', '')
-    name = storage_path.split('/')[0]
+    storage, identifier = _resolve(path)
 
-    defs = {
-        'storage_type': STORAGE_TYPE,
-        'source': STORAGE_SOURCE,
-        'name': name,
-        'auth': {'username': STORAGE_USERNAME, 'password': STORAGE_PASSWORD},
-        'codepath': PLUGINS['storage'][STORAGE_TYPE]['plugin']
-    }
+    LOGGER.debug(f'Checking if {identifier} exists')
+    return storage.exists(identifier)
 
-    LOGGER.debug(f'Connecting to storage: {name}')
-    storage = load_plugin('storage', defs)
 
-    identifier = storage_path.replace(name, '')
+def stat_data(path: str) -> Union[dict, None]:
+    """
+    Get object information (size, etag, metadata) without its content
 
-    LOGGER.debug(f'Checking if {identifier} exists')
-    return storage.exists(identifier)
+    :param path: path of object/file
+
+    :returns: `dict` of object information or `None` if not found
+    """
+    LOGGER.debug(f'stat_data: {path}')
+    storage, identifier = _resolve(path)
+
+    return storage.stat(identifier)
 
 
 def get_data(path: str) -> Any:
@@ -67,24 +139,26 @@ def get_data(path: str) -> Any:
     :returns: content of object/file
     """
     LOGGER.debug(f'get_data from : {path}')
-    storage_path = path.replace(f'{STORAGE_SOURCE}/', '')
-    name = storage_path.split('/')[0]
+    storage, identifier = _resolve(path)
 
-    defs = {
-        'storage_type': STORAGE_TYPE,
-        'source': STORAGE_SOURCE,
-        'name': name,
-        'auth': {'username': STORAGE_USERNAME, 'password': STORAGE_PASSWORD},
-        'codepath': PLUGINS['storage'][STORAGE_TYPE]['plugin']
-    }
+    LOGGER.debug(f'Fetching data from {identifier}')
+    return storage.get(identifier)
 
-    LOGGER.debug(f'Connecting to storage: {name}')
-    storage = load_plugin('storage', defs)
 
-    identifier = storage_path.replace(name, '')
+def get_data_stream(path: str,
+                    chunk_size: int = 1048576) -> Iterator[bytes]:
+    """
+    Get data from storage in chunks
 
-    LOGGER.debug(f'Fetching data from {identifier}')
-    return storage.get(identifier)
+    :param path: path of object/file
+    :param chunk_size: `int` of maximum chunk size in bytes
+
+    :returns: generator of `bytes` chunks
+    """
+    LOGGER.debug(f'get_data_stream: {path}')
+    storage, identifier = _resolve(path)
+
+    return storage.get_stream(identifier, chunk_size)
 
 
 def list_content(basepath: str) -> Any:
@@ -96,82 +170,134 @@ def list_content(basepath: str) -> Any:
     :returns: list of 'str'-objects
     """
     LOGGER.debug(f'get_data from : {basepath}')
-    storage_path = basepath.replace(f'{STORAGE_SOURCE}/', '')
-    name = storage_path.split('/')[0]
+    storage, prefix = _resolve(basepath)
 
-    defs = {
-        'storage_type': STORAGE_TYPE,
-        'source': STORAGE_SOURCE,
-        'name': name,
-        'auth': {'username': STORAGE_USERNAME, 'password': STORAGE_PASSWORD},
-        'codepath': PLUGINS['storage'][STORAGE_TYPE]['plugin']
-    }
+    LOGGER.debug(f'List identifiers matching {prefix}')
+    return storage.list_objects(prefix)
 
-    LOGGER.debug(f'Connecting to storage: {name}')
-    storage = load_plugin('storage', defs)
 
-    prefix = storage_path.replace(name, '')
+def iter_content(basepath: str, recursive: bool = True) -> Iterator[dict]:
+    """
+    Iterate over storage objects starting with a basepath
 
-    LOGGER.debug(f'List identifiers matching {prefix}')
-    return storage.list_objects(prefix)
+    :param basepath: basepath
+    :param recursive: `bool` of whether to list below "directories"
+
+    :returns: generator of object `dict`s
+    """
+    storage, prefix = _resolve(basepath)
+
+    LOGGER.debug(f'Iterate identifiers matching {prefix}')
+    return storage.iter_objects(prefix.lstrip('/'), recursive)
+
+
+def delete_data_batch(paths: Iterable[str]) -> int:
+    """
+    Delete data from storage in batches
+
+    :param paths: iterable of paths of objects/files
+
+    :returns: `int` of number of objects deleted
+    """
+
+    by_storage = {}
+    for path in paths:
+        storage, identifier = _resolve(path)
+        # keys in multi-object delete requests must not start with '/'
+        by_storage.setdefault(storage, []).append(identifier.lstrip('/'))
+
+    deleted = 0
+    for storage, identifiers in by_storage.items():
+        LOGGER.debug(f'Deleting {len(identifiers)} objects from {storage}')
+        deleted += storage.delete_many(identifiers)
+
+    return deleted
+
+
+def set_data_expiration(basepath: str, days: int) -> bool:
+    """
+    Install a lifecycle rule expiring data after a number of days
+
+    :param basepath: basepath the rule applies to
+    :param days: `int` of number of days to keep data
+
+    :returns: `bool` of result
+    """
+    storage, prefix = _resolve(basepath)
+
+    return storage.set_expiration(days, prefix.lstrip('/'))
 
 
 def put_data(data: bytes, path: str,
-             content_type: str = 'application/octet-stream') -> Any:
+             content_type: str = 'application/octet-stream',
+             metadata: dict = None) -> Any:
     """
     Put data into storage
 
     :param data: bytes of object/file
     :param path: path to use object id
     :param content_type: media type (default is `application/octet-stream`)
+    :param metadata: `dict` of user metadata to store with the object
 
     :returns: content of object/file
     """
 
-    storage_path = path.replace(f'{STORAGE_SOURCE}/', '')
-    name = storage_path.split('/')[0]
+    storage, identifier = _resolve(path)
+
+    LOGGER.debug(f'Storing data into {identifier}')
+    if metadata:
+        return storage.put(data, identifier, content_type, metadata)
+    return storage.put(data, identifier, content_type)
 
-    defs = {
-        'storage_type': STORAGE_TYPE,
-        'source': STORAGE_SOURCE,
-        'name': name,
-        'auth': {'username': STORAGE_USERNAME, 'password': STORAGE_PASSWORD},
-        'codepath': PLUGINS['storage'][STORAGE_TYPE]['plugin']
-    }
 
-    LOGGER.debug(f'Connecting to storage: {name}')
-    storage = load_plugin('storage', defs)
+def put_data_stream(stream: BinaryIO, path: str, length: int = -1,
+                    content_type: str = 'application/octet-stream',
+                    metadata: dict = None) -> bool:
+    """
+    Put data from a file-like object into storage
 
-    identifier = storage_path.replace(name, '')
+    :param stream: readable binary file-like object
+    :param path: path to use object id
+    :param length: `int` of data length in bytes (-1 if unknown)
+    :param content_type: media type (default is `application/octet-stream`)
+    :param metadata: `dict` of user metadata to store with the object
 
-    LOGGER.debug(f'Storing data into {identifier}')
-    return storage.put(data, identifier, content_type)
+    :returns: `bool` of put result
+    """
 
+    storage, identifier = _resolve(path)
 
-def delete_data(path: str) -> Any:
+    LOGGER.debug(f'Streaming data into {identifier}')
+    return storage.put_stream(stream, identifier, length, content_type,
+                              metadata)
+
+
+def set_data_metadata(path: str, metadata: dict) -> bool:
     """
-    Delete data from storage
+    Replace the user metadata of data in storage
 
     :param path: path of object/file
+    :param metadata: `dict` of user metadata to store with the object
 
-    :returns: content of object/file
+    :returns: `bool` of update result
     """
 
-    storage_path = path.replace(f'{STORAGE_SOURCE}/', '')
-    name = storage_path.split('/')[0]
+    storage, identifier = _resolve(path)
 
-    defs = {
-        'storage_type': STORAGE_TYPE,
-        'source': STORAGE_SOURCE,
-        'name': name,
-        'auth': {'username': STORAGE_USERNAME, 'password': STORAGE_PASSWORD},
-        'codepath': PLUGINS['storage'][STORAGE_TYPE]['plugin']
-    }
+    LOGGER.debug(f'Updating metadata of {identifier}')
+    return storage.update_metadata(identifier, metadata)
 
-    LOGGER.debug(f'Connecting to storage: {name}')
-    storage = load_plugin('storage', defs)
 
-    identifier = storage_path.replace(name, '')
+def delete_data(path: str) -> Any:
+    """
+    Delete data from storage
+
+    :param path: path of object/file
+
+    :returns: content of object/file
+    """
+
+    storage, identifier = _resolve(path)
 
     LOGGER.debug(f'Delete data for {identifier}')
     return storage.delete(identifier)
@@ -186,21 +312,7 @@ def move_data(old_path: str, path: str) -> Any:
     :returns: content of object/file
     """
 
-    storage_path = path.replace(f'{STORAGE_SOURCE}/', '')
-    name = storage_path.split('/')[0]
-
-    defs = {
-        'storage_type': STORAGE_TYPE,
-        'source': STORAGE_SOURCE,
-        'name': name,
-        'auth': {'username': STORAGE_USERNAME, 'password': STORAGE_PASSWORD},
-        'codepath': PLUGINS['storage'][STORAGE_TYPE]['plugin']
-    }
-
-    LOGGER.debug(f'Connecting to storage: {name}')
-    storage = load_plugin('storage', defs)
-
-    identifier = storage_path.replace(name, '')
+    storage, identifier = _resolve(path)
 
     data = get_data(old_path)
 
@@ -21,7 +21,7 @@
 
 from enum import Enum
 import logging
-from typing import Any
+from typing import Any, BinaryIO, Iterable, Iterator, Union
 
 LOGGER = logging.getLogger(__name__)
 
@@ -73,20 +73,78 @@ class StorageBase:
 
         raise NotImplementedError()
 
+    def get_stream(self, identifier: str,
+                   chunk_size: int = 1048576) -> Iterator[bytes]:
+        """
+        Access data source from storage in chunks
+
+        :param identifier: `str` of data source identifier
+        :param chunk_size: `int` of maximum chunk size in bytes
+
+        :returns: generator of `bytes` chunks
+        """
+
+        raise NotImplementedError()
+
     def put(self, data: bytes, identifier: str,
-            content_type: str = 'application/octet-stream') -> bool:
+            content_type: str = 'application/octet-stream',
+            metadata: dict = None) -> bool:
         """
         Access data source from storage
 
         :param data: bytes of file to upload
         :param identifier: `str` of data dest identifier
         :param content_type: media type (default is `application/octet-stream`)
+        :param metadata: `dict` of user metadata to store with the object
+
+        :returns: `bool` of put result
+        """
+
+        raise NotImplementedError()
+
+    def put_stream(self, stream: BinaryIO, identifier: str,
+                   length: int = -1,
+                   content_type: str = 'application/octet-stream',
+                   metadata: dict = None) -> bool:
+        """
+        Upload data from a file-like object without reading it into memory
+
+        :param stream: readable binary file-like object
+        :param identifier: `str` of data dest identifier
+        :param length: `int` of data length in bytes (-1 if unknown)
+        :param content_type: media type (default is `application/octet-stream`)
+        :param metadata: `dict` of user metadata to store with the object
 
         :returns: `bool` of put result
         """
 
         raise NotImplementedError()
 
+    def update_metadata(self, identifier: str, metadata: dict) -> bool:
+        """
+        Replace the user metadata of an object, without uploading its
+        content again
+
+        :param identifier: `str` of data dest identifier
+        :param metadata: `dict` of user metadata to store with the object
+
+        :returns: `bool` of update result
+        """
+
+        raise NotImplementedError()
+
+    def stat(self, identifier: str) -> Union[dict, None]:
+        """
+        Get object information without fetching its content
+
+        :param identifier: `str` of data source identifier
+
+        :returns: `dict` of object information (size, etag, metadata)
+                  or `None` if the object does not exist
+        """
+
+        raise NotImplementedError()
+
     def put_bytes(self, data: bytes, identifier: str) -> bool:
         """
         Access data source from storage
@@ -119,5 +177,45 @@ class StorageBase:
         :returns: list of 'str'-objects
         """
 
+    def iter_objects(self, prefix: str = '',
+                     recursive: bool = True) -> Iterator[dict]:
+        """
+        Iterate over objects in storage starting with prefix
+
+        Objects are yielded as they are listed, without holding the whole
+        listing in memory.  When not recursive, common prefixes
+        ("directories") are yielded with `is_dir` set.
+
+        :param prefix: `str` of object prefix
+        :param recursive: `bool` of whether to list below "directories"
+
+        :returns: generator of object `dict`s
+        """
+
+        raise NotImplementedError()
+
+    def delete_many(self, identifiers: Iterable[str]) -> int:
+        """
+        Delete data sources from storage in batches
+
+        :param identifiers: iterable of `str` data source identifiers
+
+        :returns: `int` of number of objects deleted
+        """
+
+        raise NotImplementedError()
+
+    def set_expiration(self, days: int, prefix: str = '') -> bool:
+        """
+        Install a lifecycle rule expiring objects after a number of days
+
+        :param days: `int` of number of days to keep objects
+        :param prefix: `str` of object prefix the rule applies to
+
+        :returns: `bool` of result
+        """
+
+        raise NotImplementedError()
+
     def __repr__(self):
         return f'<StorageBase ({self.source})>'
@@ -22,11 +22,14 @@
 from io import BytesIO
 import json
 import logging
-from typing import Any
+from typing import Any, BinaryIO, Iterable, Iterator, Union
 from urllib.parse import urlparse
 
 from minio import Minio
 from minio import error as minio_error
+from minio.commonconfig import CopySource, ENABLED, Filter, REPLACE
+from minio.deleteobjects import DeleteObject
+from minio.lifecycleconfig import Expiration, LifecycleConfig, Rule
 from minio.notificationconfig import NotificationConfig, QueueConfig
 
 from wis2box.storage.base import PolicyTypes, StorageBase
@@ -202,6 +205,38 @@ class MinIOStorage(StorageBase):
             msg = f'Error checking object existence: {err}'
             LOGGER.error(msg)
 
+    def stat(self, identifier: str) -> Union[dict, None]:
+        """
+        Get object information without fetching its content
+
+        :param identifier: `str` of data source identifier
+
+        :returns: `dict` of object information (size, etag, metadata)
+                  or `None` if the object does not exist
+        """
+
+        LOGGER.debug(f'Getting object information for {identifier}')
+        try:
+            result = self.client.stat_object(bucket_name=self.name,
+                                             object_name=identifier)
+        except minio_error.S3Error as err:
+            if err.code == 'NoSuchKey':
+                LOGGER.debug(err)
+                return None
+            raise err
+
+        metadata = {}
+        for key, value in (result.metadata or {}).items():
+            if key.lower().startswith('x-amz-meta-'):
+                metadata[key.lower()[len('x-amz-meta-'):]] = value
+
+        return {
+            'size': result.size,
+            'etag': result.etag,
+            'last_modified': result.last_modified,
+            'metadata': metadata
+        }
+
     def get(self, identifier: str) -> Any:
         """
         Access data source from storage
@@ -224,14 +259,37 @@ class MinIOStorage(StorageBase):
             LOGGER.error(msg)
         return data
 
+    def get_stream(self, identifier: str,
+                   chunk_size: int = 1048576) -> Iterator[bytes]:
+        """
+        Access data source from storage in chunks
+
+        Only one chunk is held in memory at a time.
+
+        :param identifier: `str` of data source identifier
+        :param chunk_size: `int` of maximum chunk size in bytes
+
+        :returns: generator of `bytes` chunks
+        """
+
+        LOGGER.debug(f'Streaming object {identifier} from bucket={self.name}')
+        response = self.client.get_object(self.name, object_name=identifier)
+        try:
+            yield from response.stream(chunk_size)
+        finally:
+            response.close()
+            response.release_conn()
+
     def put(self, data: bytes, identifier: str,
-            content_type: str = 'application/octet-stream') -> bool:
+            content_type: str = 'application/octet-stream',
+            metadata: dict = None) -> bool:
         """
         Access data source from storage
 
         :param data: bytes of file to upload
         :param identifier: `str` of data dest identifier
         :param content_type: media type (default is `application/octet-stream`)
+        :param metadata: `dict` of user metadata to store with the object
 
         :returns: `bool` of put result
         """
@@ -242,13 +300,72 @@ class MinIOStorage(StorageBase):
                                    object_name=identifier,
                                    content_type=content_type,
                                    data=BytesIO(data), length=-1,
-                                   part_size=10*1024*1024)
+                                   part_size=10*1024*1024,
+                                   metadata=metadata)
         except Exception as err:
             msg = f'Error putting object: {err}'
             LOGGER.error(msg)
             return False
         return True
 
+    def put_stream(self, stream: BinaryIO, identifier: str,
+                   length: int = -1,
+                   content_type: str = 'application/octet-stream',
+                   metadata: dict = None) -> bool:
+        """
+        Upload data from a file-like object without reading it into memory
+
+        Data larger than the part size is sent as a multipart upload.
+
+        :param stream: readable binary file-like object
+        :param identifier: `str` of data dest identifier
+        :param length: `int` of data length in bytes (-1 if unknown)
+        :param content_type: media type (default is `application/octet-stream`)
+        :param metadata: `dict` of user metadata to store with the object
+
+        :returns: `bool` of put result
+        """
+
+        LOGGER.debug(f'Streaming data as object={identifier}')
+        try:
+            self.client.put_object(bucket_name=self.name,
+                                   object_name=identifier,
+                                   content_type=content_type,
+                                   data=stream, length=length,
+                                   part_size=10*1024*1024,
+                                   metadata=metadata)
+        except Exception as err:
+            msg = f'Error putting object: {err}'
+            LOGGER.error(msg)
+            return False
+        return True
+
+    def update_metadata(self, identifier: str, metadata: dict) -> bool:
+        """
+        Replace the user metadata of an object, without uploading its
+        content again
+
+        The object is copied onto itself on the server.
+
+        :param identifier: `str` of data dest identifier
+        :param metadata: `dict` of user metadata to store with the object
+
+        :returns: `bool` of update result
+        """
+
+        LOGGER.debug(f'Updating metadata of object={identifier}')
+        try:
+            self.client.copy_object(bucket_name=self.name,
+                                    object_name=identifier,
+                                    source=CopySource(self.name, identifier),
+                                    metadata=metadata,
+                                    metadata_directive=REPLACE)
+        except Exception as err:
+            msg = f'Error updating object metadata: {err}'
+            LOGGER.error(msg)
+            return False
+        return True
+
     def delete(self, identifier: str) -> bool:
         """
         Delete data source from storage
@@ -279,18 +396,89 @@ class MinIOStorage(StorageBase):
         LOGGER.debug(f'list identifiers starting with {prefix}')
         objects = []
         try:
-            for object in self.client.list_objects(self.name, prefix, True): # noqa
-                objects.append({
-                    'filename': object.object_name.split('/')[-1],
-                    'fullpath': f'{self.source}/{self.name}/{object.object_name}', # noqa
-                    'last_modified': object.last_modified,
-                    'size': object.size,
-                    'basedir': object.object_name.split('/')[0],
-                })
+            for object in self.iter_objects(prefix):
+                objects.append(object)
         except Exception as err:
             msg = f'Error listing objects: {err}'
             LOGGER.error(msg)
         return objects
 
+    def iter_objects(self, prefix: str = '',
+                     recursive: bool = True) -> Iterator[dict]:
+        """
+        Iterate over objects in storage starting with prefix
+
+        Objects are yielded as they are listed, without holding the whole
+        listing in memory.  When not recursive, common prefixes
+        ("directories") are yielded with `is_dir` set.
+
+        :param prefix: `str` of object prefix
+        :param recursive: `bool` of whether to list below "directories"
+
+        :returns: generator of object `dict`s
+        """
+
+        for object in self.client.list_objects(self.name, prefix, recursive): # noqa
+            yield {
+                'filename': object.object_name.rstrip('/').split('/')[-1],
+                'identifier': object.object_name,
+                'fullpath': f'{self.source}/{self.name}/{object.object_name}', # noqa
+                'last_modified': object.last_modified,
+                'size': object.size,
+                'basedir': object.object_name.split('/')[0],
+                'is_dir': object.is_dir
+            }
+
+    def delete_many(self, identifiers: Iterable[str]) -> int:
+        """
+        Delete data sources from storage in batches
+
+        Objects are deleted with multi-object delete requests of up to
+        1000 objects each.
+
+        :param identifiers: iterable of `str` data source identifiers
+
+        :returns: `int` of number of objects deleted
+        """
+
+        count = 0
+
+        def delete_objects():
+            nonlocal count
+            for identifier in identifiers:
+                count += 1
+                yield DeleteObject(identifier)
+
+        failed = 0
+        for error in self.client.remove_objects(self.name, delete_objects()):
+            LOGGER.error(f'Error deleting object {error.name}: {error.message}')  # noqa
+            failed += 1
+
+        return count - failed
+
+    def set_expiration(self, days: int, prefix: str = '') -> bool:
+        """
+        Install a lifecycle rule expiring objects after a number of days
+
+        :param days: `int` of number of days to keep objects
+        :param prefix: `str` of object prefix the rule applies to
+
+        :returns: `bool` of result
+        """
+
+        LOGGER.debug(f'Setting expiration of {days} days on {self.name}')
+        config = LifecycleConfig([
+            Rule(ENABLED, rule_filter=Filter(prefix=prefix),
+                 rule_id='wis2box-retention',
+                 expiration=Expiration(days=days))
+        ])
+        try:
+            self.client.set_bucket_lifecycle(self.name, config)
+        except Exception as err:
+            msg = f'Error setting bucket lifecycle: {err}'
+            LOGGER.error(msg)
+            return False
+        return True
+
     def __repr__(self):
         return f'<MinioStorage ({self.source})>'
@@ -21,7 +21,7 @@
 
 import logging
 from pathlib import Path
-from typing import Any
+from typing import Any, Union
 
 import boto3
 from botocore.exceptions import ClientError
@@ -58,6 +58,31 @@ class S3Storage(StorageBase):
 
         return True
 
+    def stat(self, identifier: str) -> Union[dict, None]:
+        """
+        Get object information without fetching its content
+
+        :param identifier: `str` of data source identifier
+
+        :returns: `dict` of object information (size, etag, metadata)
+                  or `None` if the object does not exist
+        """
+
+        LOGGER.debug(f'Getting object information for {identifier}')
+        try:
+            result = self.client.head_object(Bucket=self.name, Key=identifier)
+        except ClientError as e:
+            if e.response['Error']['Code'] == '404':
+                return None
+            raise e
+
+        return {
+            'size': result['ContentLength'],
+            'etag': result['ETag'].strip('"'),
+            'last_modified': result['LastModified'],
+            'metadata': result.get('Metadata', {})
+        }
+
     def get(self, identifier: str) -> Any:
 
         LOGGER.debug(f'Getting object {identifier}')
@@ -66,11 +91,37 @@ class S3Storage(StorageBase):
         return data['Body'].read()
 
     def put(self, filepath: Path, identifier: str,
-            content_type: str = 'application/octet-stream') -> bool:
+            content_type: str = 'application/octet-stream',
+            metadata: dict = None) -> bool:
 
         LOGGER.debug(f'Putting file {filepath} to {identifier}')
+        extra_args = {'ContentType': content_type}
+        if metadata:
+            extra_args['Metadata'] = metadata
         self.client.upload_file(filepath, self.name, identifier,
-                                ContentType=content_type)
+                                ExtraArgs=extra_args)
+
+        return True
+
+    def update_metadata(self, identifier: str, metadata: dict) -> bool:
+        """
+        Replace the user metadata of an object, without uploading its
+        content again
+
+        The object is copied onto itself on the server.
+
+        :param identifier: `str` of data dest identifier
+        :param metadata: `dict` of user metadata to store with the object
+
+        :returns: `bool` of update result
+        """
+
+        LOGGER.debug(f'Updating metadata of object {identifier}')
+        self.client.copy_object(Bucket=self.name, Key=identifier,
+                                CopySource={'Bucket': self.name,
+                                            'Key': identifier},
+                                Metadata=metadata,
+                                MetadataDirective='REPLACE')
 
         return True
 
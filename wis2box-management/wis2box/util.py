@@ -19,15 +19,19 @@
 #
 ###############################################################################
 
+import asyncio
 from base64 import b64encode
+from concurrent.futures import Executor
+import contextvars
 from datetime import date, datetime, time, timedelta
 from decimal import Decimal
+import hashlib
 import isodate
 import logging
 import os
 from pathlib import Path
 import re
-from typing import Iterator, Union
+from typing import Any, BinaryIO, Callable, Iterator, Union
 from urllib.parse import urlparse
 import yaml
 
@@ -108,6 +112,29 @@ def json_serial(obj: object) -> Union[bytes, str, float]:
     raise TypeError(msg)
 
 
+async def run_in_executor(executor: Union[Executor, None],
+                          func: Callable[..., Any], *args) -> Any:
+    """
+    Run a blocking or CPU-heavy function without blocking the event loop
+
+    Unlike `loop.run_in_executor`, the function runs in a copy of the
+    current context, so that context variables (e.g. metrics labels)
+    are preserved.
+
+    :param executor: `concurrent.futures.Executor` (`None` for the
+                     default executor of the loop)
+    :param func: function to run
+    :param args: positional arguments of the function
+
+    :returns: result of the function
+    """
+
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(executor, context.run, func, *args)
+
+
 def walk_path(path: Path, regex: str, recursive: bool) -> Iterator[Path]:
     """
     Walks os directory path collecting all files.
@@ -239,3 +266,51 @@ def remove_auth_from_url(url: str, replace_with: str = None) -> str:
         return url.replace(auth, f'{replace_with}@')
     else:
         return url.replace(auth, '')
+
+
+class HashingReader:
+    """
+    File-like reader computing checksum and length of the data read
+
+    Wrapping an upload stream computes the checksum during the transfer,
+    without a separate pass over the data.
+    """
+
+    def __init__(self, stream: BinaryIO, algorithm: str = 'sha512') -> None:
+        """
+        Initializer
+
+        :param stream: readable binary file-like object
+        :param algorithm: secure hash algorithm (md5, sha512)
+
+        :returns: `None`
+        """
+
+        self.stream = stream
+        self.length = 0
+        self._hash = getattr(hashlib, algorithm)()
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read from the wrapped stream, updating checksum and length
+
+        :param size: `int` of maximum number of bytes to read
+
+        :returns: `bytes` read
+        """
+
+        data = self.stream.read(size)
+        self._hash.update(data)
+        self.length += len(data)
+
+        return data
+
+    @property
+    def checksum(self) -> str:
+        """
+        Base64 encoded digest of the data read so far
+
+        :returns: `str` of checksum
+        """
+
+        return b64encode(self._hash.digest()).decode()
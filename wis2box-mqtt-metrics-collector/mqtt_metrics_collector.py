@@ -19,8 +19,11 @@
 #
 ###############################################################################
 
+from collections import OrderedDict
+from datetime import datetime, timezone
 import os
 import logging
+import queue
 
 import requests
 
@@ -31,17 +34,13 @@ import sys
 import json
 import time
 
-from threading import Lock
 from threading import Thread
 
-from prometheus_client import start_http_server, Counter, Gauge
+from prometheus_client import start_http_server, Counter, Gauge, Histogram
 
 # de-register default-collectors
 from prometheus_client import REGISTRY, PROCESS_COLLECTOR, PLATFORM_COLLECTOR
 
-message_buffer = []
-buffer_lock = Lock()
-
 REGISTRY.unregister(PROCESS_COLLECTOR)
 REGISTRY.unregister(PLATFORM_COLLECTOR)
 
@@ -58,6 +57,20 @@ logger.setLevel(WIS2BOX_LOGGING_LOGLEVEL)
 
 INTERRUPT = False
 
+# maximum number of messages decoded per batch
+BATCH_SIZE = 100
+# maximum number of storage events on incoming awaiting a notification
+INCOMING_EVENTS_MAX = 10000
+# seconds a storage event on incoming awaits a notification
+INCOMING_EVENTS_TTL = 3600
+# seconds new WSI label sets are exposed at zero before counting
+NEW_LABEL_DELAY = 5
+# maximum number of messages waiting to be decoded
+MESSAGE_QUEUE_MAX = 10000
+# maximum seconds the network loop blocks on a full message queue,
+# well below the MQTT keepalive
+MESSAGE_QUEUE_WAIT = 5
+
 notify_total = Counter('wis2box_notify_total',
                        'Total notifications sent by wis2box')
 notify_wsi_total = Counter('wis2box_notify_wsi_total',
@@ -87,15 +100,67 @@ broker_msg_stored = Gauge('wis2box_broker_msg_stored',
 broker_msg_dropped = Gauge('wis2box_broker_msg_dropped',
                            '$SYS/messages/dropped')
 
+pipeline_latency = Histogram('wis2box_pipeline_latency_seconds',
+                             'Seconds from storage event of a file on incoming to pubtime of its first notification, by dataset', # noqa
+                             ["dataset"],
+                             buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300,
+                                      600, 1800, 3600, float('inf')))
+
+collector_queue = Gauge('wis2box_metrics_collector_queue',
+                        'Messages waiting to be decoded by the metrics collector') # noqa
+collector_dropped_total = Counter('wis2box_metrics_collector_dropped_total',
+                                  'Messages dropped by the metrics collector on a full queue') # noqa
+
 station_wsi = Gauge('wis2box_stations_wsi',
                     'wis2box configured stations by WSI',
                     ["WSI"])
 
 
+def parse_time(value):
+    """
+    function to parse an RFC3339 timestamp
+
+    :param value: timestamp string, e.g. 2024-01-01T00:00:00.123Z
+
+    :returns: `datetime` (timezone aware) or `None`
+    """
+
+    try:
+        value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    return value
+
+
+def incoming_key(filepath):
+    """
+    function to get the storage event key of an incoming filepath
+
+    :param filepath: filepath of a file on incoming, e.g.
+                     http://minio:9000/wis2box-incoming/path/file.csv
+
+    :returns: `str` of key (e.g. wis2box-incoming/path/file.csv) or `None`
+    """
+
+    if not filepath or 'wis2box-incoming/' not in filepath:
+        return None
+
+    return filepath[filepath.index('wis2box-incoming/'):]
+
+
 class MetricsCollector:
     def __init__(self):
-        self.message_buffer = []
-        self.buffer_lock = Lock()
+        self.message_queue = queue.Queue(MESSAGE_QUEUE_MAX)
+        self.saturated = False
+        # storage event and receive times by incoming key, oldest first
+        self.incoming_events = OrderedDict()
+        # notifications of new WSIs not counted yet, by WSI:
+        # [time due, count]
+        self.deferred = {}
 
     def update_stations_gauge(self, station_list):
         """
@@ -177,57 +242,169 @@ class MetricsCollector:
             elif msg.topic.endswith('/dropped'):
                 broker_msg_dropped.set(float(msg.payload))
         else:
-            with self.buffer_lock:
-                self.message_buffer.append((msg.topic, msg))
-                if len(self.message_buffer) >= 100:
-                    self.process_buffered_messages()
+            # decoding happens on the worker thread; on a full queue the
+            # network loop blocks for a bounded time, delaying the QoS 1
+            # acknowledgement so that the broker slows down
+            item = (msg.topic, msg.payload, time.time())
+            try:
+                self.message_queue.put(item, timeout=MESSAGE_QUEUE_WAIT)
+                if self.saturated:
+                    logger.info('Message queue accepting messages again')
+                    self.saturated = False
+            except queue.Full:
+                if not self.saturated:
+                    logger.warning(f'Message queue full ({MESSAGE_QUEUE_MAX} messages); dropping messages') # noqa
+                    self.saturated = True
+                collector_dropped_total.inc()
+
+    def process_messages(self):
+        """
+        function to decode and count queued messages, run in a
+        separate thread
 
-    def process_buffered_messages(self):
+        :returns: `None`
         """
-        function to process buffered messages
+
+        while True:
+            try:
+                batch = [self.message_queue.get(timeout=1)]
+            except queue.Empty:
+                self.count_deferred()
+                continue
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.message_queue.get_nowait())
+                except queue.Empty:
+                    break
+            collector_queue.set(self.message_queue.qsize())
+
+            for topic, payload, received in batch:
+                try:
+                    self.process_message(topic, payload, received)
+                except Exception as err:
+                    logger.error(f'Failed to process message on topic={topic}: {err}') # noqa
+            self.count_deferred()
+
+    def count_deferred(self):
+        """
+        function to count notifications of new WSIs once their zero
+        value has been exposed for NEW_LABEL_DELAY seconds
 
         :returns: `None`
         """
 
-        with self.buffer_lock:
-            messages_to_process = self.message_buffer
-            self.message_buffer = []
-
-        for topic, msg in messages_to_process:
-            m = json.loads(msg.payload.decode('utf-8'))
-            if topic.startswith('wis2box/stations'):
-                self.update_stations_gauge(m['station_list'])
-            elif topic.startswith('wis2box/notifications'):
-                wsi = m['properties'].get('wigos_station_identifier', 'none')
-                if (wsi,) not in notify_wsi_total._metrics:
-                    notify_wsi_total.labels(wsi).inc(0)
-                    failure_wsi_total.labels(wsi).inc(0)
-                    station_wsi.labels(wsi).set(1)
-                    time.sleep(5)
-                notify_wsi_total.labels(wsi).inc(1)
-                failure_wsi_total.labels(wsi).inc(0)
-                notify_total.inc(1)
-            elif topic.startswith('wis2box/failure'):
-                wsi = m.get('wigos_station_identifier', 'none')
+        now = time.monotonic()
+        for wsi, (due, count) in list(self.deferred.items()):
+            if due <= now:
+                notify_wsi_total.labels(wsi).inc(count)
+                del self.deferred[wsi]
+
+    def process_message(self, topic, payload, received):
+        """
+        function to update metrics for a single message
+
+        :param topic: topic of the message
+        :param payload: payload of the message
+        :param received: time the message was received (epoch seconds)
+
+        :returns: `None`
+        """
+
+        m = json.loads(payload.decode('utf-8'))
+        if topic.startswith('wis2box/stations'):
+            self.update_stations_gauge(m['station_list'])
+        elif topic.startswith('wis2box/notifications'):
+            wsi = m['properties'].get('wigos_station_identifier', 'none')
+            if (wsi,) not in notify_wsi_total._metrics:
+                # expose the new label set at zero first, so that
+                # increase() sees the first notification; counting is
+                # deferred rather than holding up this thread
                 notify_wsi_total.labels(wsi).inc(0)
-                failure_wsi_total.labels(wsi).inc(1)
-                failure_total.inc(1)
-            elif topic.startswith('wis2box/storage'):
-                if str(m["Key"]).startswith('wis2box-incoming'):
-                    storage_incoming_total.inc(1)
-                if str(m["Key"]).startswith('wis2box-public'):
-                    storage_public_total.inc(1)
-
-    def periodic_buffer_processing(self):
+                failure_wsi_total.labels(wsi).inc(0)
+                station_wsi.labels(wsi).set(1)
+                self.deferred[wsi] = [time.monotonic() + NEW_LABEL_DELAY, 0]
+            if wsi in self.deferred:
+                self.deferred[wsi][1] += 1
+            else:
+                notify_wsi_total.labels(wsi).inc(1)
+            failure_wsi_total.labels(wsi).inc(0)
+            notify_total.inc(1)
+            self.observe_latency(m)
+        elif topic.startswith('wis2box/failure'):
+            wsi = m.get('wigos_station_identifier', 'none')
+            notify_wsi_total.labels(wsi).inc(0)
+            failure_wsi_total.labels(wsi).inc(1)
+            failure_total.inc(1)
+            # the file will not be notified
+            key = incoming_key(m.get('incoming_filepath'))
+            if key is not None:
+                self.incoming_events.pop(key, None)
+        elif topic.startswith('wis2box/storage'):
+            if str(m["Key"]).startswith('wis2box-incoming'):
+                storage_incoming_total.inc(1)
+                self.record_incoming(m, received)
+            if str(m["Key"]).startswith('wis2box-public'):
+                storage_public_total.inc(1)
+
+    def record_incoming(self, m, received):
         """
-        function to process buffered messages every second
+        function to remember the time of a storage event on incoming,
+        until the file is notified or the event expires
+
+        :param m: storage event message
+        :param received: time the message was received (epoch seconds)
 
         :returns: `None`
         """
 
-        while True:
-            self.process_buffered_messages()
-            time.sleep(1)
+        event_time = None
+        try:
+            event_time = parse_time(m['Records'][0]['eventTime'])
+        except (KeyError, IndexError, TypeError):
+            pass
+        if event_time is None:
+            event_time = datetime.fromtimestamp(received, timezone.utc)
+
+        key = str(m['Key'])
+        self.incoming_events.pop(key, None)
+        self.incoming_events[key] = (event_time, received)
+
+        # forget files that were never notified
+        while self.incoming_events:
+            _, (_, oldest) = next(iter(self.incoming_events.items()))
+            if (len(self.incoming_events) <= INCOMING_EVENTS_MAX and
+                    received - oldest <= INCOMING_EVENTS_TTL):
+                break
+            self.incoming_events.popitem(last=False)
+
+    def observe_latency(self, m):
+        """
+        function to observe the time from the storage event of a file on
+        incoming to the publication of its first notification
+
+        Notifications on wis2box/notifications carry the incoming
+        filepath they were published from.
+
+        :param m: notification message
+
+        :returns: `None`
+        """
+
+        key = incoming_key(m.get('incoming_filepath'))
+        if key is None:
+            return
+        event = self.incoming_events.pop(key, None)
+        if event is None:
+            return
+
+        properties = m['properties']
+        pubtime = parse_time(properties.get('pubtime'))
+        if pubtime is None:
+            return
+
+        dataset = properties.get('metadata_id', 'none')
+        latency = (pubtime - event[0]).total_seconds()
+        pipeline_latency.labels(dataset).observe(latency)
 
     def gather_mqtt_metrics(self):
         """
@@ -260,7 +437,7 @@ def main():
     collector = MetricsCollector()
     collector.init_stations_gauge()
 
-    Thread(target=collector.periodic_buffer_processing, daemon=True).start()
+    Thread(target=collector.process_messages, daemon=True).start()
     collector.gather_mqtt_metrics()
 
 